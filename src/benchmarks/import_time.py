@@ -0,0 +1,93 @@
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Modules which should not be loaded by a headless solve worker
+HEAVY_MODULES = ['matplotlib', 'deepdish', 'h5py', 'tables', 'scipy']
+
+# Import statements of the different entry points
+ENTRY_POINTS = {
+    'solve worker': 'import models.batch',
+    'cli': 'import cli',
+    'plotting': 'import models.batch; import visualization.visualize',
+}
+
+_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{'import': elapsed, 'heavy': heavy}}))
+"""
+
+
+def measure_import(statement, repeat=5):
+    """Measure the import time of a statement in fresh interpreters.
+
+    Parameters
+    ----------
+    statement : str
+        The import statement e.g. 'import models.batch'.
+    repeat : int
+        Number of fresh interpreters to start.
+
+    Returns
+    -------
+    dict
+        Median import and process times (s) and the heavy modules loaded.
+
+    """
+    src_path = str(Path(__file__).parents[1])
+    probe = _PROBE.format(statement=statement, heavy=HEAVY_MODULES)
+    import_times, process_times = [], []
+    for i in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', probe],
+                                cwd=src_path,
+                                stdout=subprocess.PIPE,
+                                check=True)
+        process_times.append(time.perf_counter() - start)
+        result = json.loads(output.stdout.decode().strip().splitlines()[-1])
+        import_times.append(result['import'])
+
+    return {
+        'import': float(np.median(import_times)),
+        'process': float(np.median(process_times)),
+        'heavy': result['heavy'],
+    }
+
+
+def run_benchmark(repeat=5):
+    """Print the import time of every entry point.
+
+    Parameters
+    ----------
+    repeat : int
+        Number of fresh interpreters per entry point.
+
+    Returns
+    -------
+    dict
+        The results of every entry point.
+
+    """
+    results = {}
+    print('{:>14} {:>10} {:>10}  {}'.format('entry point', 'import (s)',
+                                            'process (s)', 'heavy modules'))
+    for name, statement in ENTRY_POINTS.items():
+        results[name] = measure_import(statement, repeat)
+        print('{:>14} {:>10.3f} {:>10.3f}  {}'.format(
+            name, results[name]['import'], results[name]['process'],
+            ', '.join(results[name]['heavy']) or '-'))
+
+    return results
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, str(Path(__file__).parents[1]))
+    run_benchmark()
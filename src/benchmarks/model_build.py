@@ -0,0 +1,101 @@
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# Build the model in a fresh interpreter and report the time and peak RSS
+_PROBE = """
+import io, contextlib, json, resource, time
+import pyomo.environ as pyo
+from utils import load_config
+from models import hammering, lean
+config = load_config()
+base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+if {method!r} == 'dae':
+    with contextlib.redirect_stdout(io.StringIO()):
+        m = hammering.dynamic_motion_model({tf}, {stiffness!r}, config)
+    pyo.TransformationFactory('dae.finite_difference').apply_to(
+        m, nfe={nfe}, wrt=m.time, scheme='BACKWARD')
+else:
+    m = lean.lean_motion_model({tf}, {stiffness!r}, config, {nfe})
+elapsed = time.perf_counter() - start
+build_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+# Writing the .nl file is the rest of the work before ipopt starts
+start = time.perf_counter()
+m.write({nl_path!r}, format='nl')
+write = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'build': elapsed, 'write': write,
+                  'build_rss': (build_peak - base) / 1024,
+                  'rss': (peak - base) / 1024}}))
+"""
+
+
+def measure_build(method, nfe, tf=1.5, stiffness='variable_stiffness'):
+    """Build time (s) and peak RSS increase (MB) of one model.
+
+    Parameters
+    ----------
+    method : str
+        dae (dynamic_motion_model and the finite difference transformation)
+        or lean (lean.lean_motion_model).
+    nfe : int
+        Number of finite elements.
+    tf : float
+        Final time.
+    stiffness : str
+        Stiffness of springs used for simulation
+
+    Returns
+    -------
+    dict
+        The build and .nl write times and the peak RSS above the one after
+        the imports, after the build and after the write.
+
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        probe = _PROBE.format(method=method,
+                              nfe=nfe,
+                              tf=tf,
+                              stiffness=stiffness,
+                              nl_path=str(Path(temp_dir) / 'model.nl'))
+        output = subprocess.run([sys.executable, '-c', probe],
+                                cwd=str(Path(__file__).parents[1]),
+                                stdout=subprocess.PIPE,
+                                check=True)
+    return json.loads(output.stdout.decode().strip().splitlines()[-1])
+
+
+def run_benchmark(nfe=(1000, 2000, 5000)):
+    """Print the build time and memory of both construction paths.
+
+    Parameters
+    ----------
+    nfe : list
+        Mesh sizes to build.
+
+    Returns
+    -------
+    dict
+        The results of every method and mesh size.
+
+    """
+    results = {}
+    print('{:>6} {:>6} {:>10} {:>10} {:>10} {:>10}'.format(
+        'nfe', 'method', 'build (s)', 'write (s)', 'build RSS', 'RSS (MB)'))
+    for n in nfe:
+        for method in ['dae', 'lean']:
+            results[(method, n)] = measure_build(method, n)
+            result = results[(method, n)]
+            print('{:>6} {:>6} {:>10.2f} {:>10.2f} {:>10.1f} {:>10.1f}'.format(
+                n, method, result['build'], result['write'],
+                result['build_rss'], result['rss']))
+
+    return results
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, str(Path(__file__).parents[1]))
+    run_benchmark()
@@ -0,0 +1,99 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+
+def run_benchmark(config,
+                  stiffness='variable_stiffness',
+                  tf=1.5,
+                  nfe=50,
+                  rate=20.0,
+                  max_iter=100,
+                  max_cpu_time=0.05,
+                  noise=0.0,
+                  seed=0,
+                  solver='ipopt'):
+    """Closed loop latency of the receding horizon controller.
+
+    The measured state at every step is the state predicted by the
+    previous solution (plus optional noise), so no robot is needed.
+
+    Parameters
+    ----------
+    config : yaml
+        The configuration file for the simulation
+    stiffness : str
+        Stiffness of springs used for simulation
+    tf : float
+        Final (strike) time.
+    nfe : int
+        Number of finite elements of the horizon.
+    rate : float
+        Control rate (Hz).
+    max_iter : int
+        Maximum number of IPOPT iterations per step.
+    max_cpu_time : float
+        Maximum IPOPT cpu time per step (s).
+    noise : float
+        Standard deviation of the measurement noise.
+    seed : int
+        Seed of the random generator.
+    solver : str
+        IPOPT backend (see models.optimize.SOLVERS).
+
+    Returns
+    -------
+    dict
+        Percentiles of the per step solve time (s).
+
+    """
+    from models.mpc import RecedingHorizonController, STATES
+
+    rng = np.random.RandomState(seed)
+    controller = RecedingHorizonController(config,
+                                           stiffness,
+                                           tf,
+                                           nfe=nfe,
+                                           max_iter=max_iter,
+                                           max_cpu_time=max_cpu_time,
+                                           solver=solver)
+
+    # The first solve is cold and not part of the closed loop latency
+    state = {key: controller.m.x0[key].value for key in STATES}
+    controller.opt.options['max_iter'] = 3000
+    controller.opt.options['max_cpu_time'] = 60
+    controller.step(state, 0.0)
+    controller.opt.options['max_iter'] = max_iter
+    controller.opt.options['max_cpu_time'] = max_cpu_time
+
+    solve_times = []
+    for t_now in np.arange(1, int(tf * rate)) / rate:
+        state = controller.predict(t_now)
+        for key in state:
+            state[key] += rng.normal(0, noise)
+        output = controller.step(state, t_now)
+        if output['status'] != 'skipped':
+            solve_times.append(output['solve_time'])
+            print('{:.3f} {} {:.4f}'.format(t_now, output['status'],
+                                            output['solve_time']))
+
+    solve_times = np.array(solve_times)
+    results = {
+        'steps': len(solve_times),
+        'p50': np.percentile(solve_times, 50),
+        'p90': np.percentile(solve_times, 90),
+        'p99': np.percentile(solve_times, 99),
+        'max': solve_times.max(),
+    }
+    print('steps {steps}, p50 {p50:.4f} s, p90 {p90:.4f} s, '
+          'p99 {p99:.4f} s, max {max:.4f} s'.format(**results))
+
+    return results
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, str(Path(__file__).parents[1]))
+    from utils import load_config
+
+    run_benchmark(load_config())
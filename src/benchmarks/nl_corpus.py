@@ -0,0 +1,434 @@
+import contextlib
+import hashlib
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Layout of the corpus and sidecar files, replay refuses other versions
+CORPUS_VERSION = 1
+INDEX = 'corpus.json'
+DEFAULT_SETTINGS = [{'name': 'ipopt', 'solver': 'ipopt', 'options': {}}]
+
+# Lines of the ipopt output parsed by replay_ipopt
+_ITERATIONS = re.compile(r'Number of Iterations\.*:\s*(\d+)')
+_OBJECTIVE = re.compile(r'Objective\.*:\s*(\S+)\s+(\S+)')
+_EXIT = re.compile(r'EXIT: (.*)')
+
+
+def _write_json(path, content):
+    from utils import atomic_write
+
+    with atomic_write(path, 'w') as f:
+        json.dump(content, f, indent=1, default=str)
+
+
+def _git_commit():
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                cwd=str(Path(__file__).parent),
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL,
+                                check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.decode().strip()
+
+
+def nl_header(nl_path):
+    """Size of the NLP of a .nl file (variables, constraints, nonzeros)."""
+    with open(str(nl_path)) as f:
+        lines = [next(f).split('#')[0].split() for i in range(8)]
+    return {
+        'n_vars': int(lines[1][0]),
+        'n_cons': int(lines[1][1]),
+        'nnz_jacobian': int(lines[7][0])
+    }
+
+
+def discretized_model(job, config):
+    """The discretized model of a job, at the initial point of its solve.
+
+    The same model, mesh and initial point (including the warm start
+    library) as batch.solve_job, without solving it.
+
+    Parameters
+    ----------
+    job : dict
+        Job specification.
+    config : yaml
+        The configuration file for the simulation
+
+    Returns
+    -------
+    m
+        A discretized pyomo model.
+
+    """
+    import pyomo.environ as pyo
+    from models.batch import build_model, initial_point
+    from models.lean import initialize_lean
+    from models.optimize import initialize_model
+
+    _, initial_values = initial_point(job, config)
+    config = {**config, **job.get('overrides', {})}
+    with contextlib.redirect_stdout(io.StringIO()):
+        m = build_model(job, config)
+    if job['builder'] == 'lean':
+        if initial_values is not None:
+            initialize_lean(m, initial_values)
+        return m
+    pyo.TransformationFactory('dae.finite_difference').apply_to(
+        m, nfe=job['nfe'], wrt=m.time, scheme=job['scheme'])
+    if initial_values is not None:
+        initialize_model(m, initial_values)
+    return m
+
+
+def read_corpus(corpus_path):
+    """Index of a corpus, an empty one if nothing was recorded yet."""
+    index_path = Path(corpus_path) / INDEX
+    if not index_path.is_file():
+        return {'version': CORPUS_VERSION, 'entries': []}
+    with open(str(index_path)) as f:
+        index = json.load(f)
+    if index['version'] != CORPUS_VERSION:
+        raise ValueError('{} is a version {} corpus, expected {}'.format(
+            corpus_path, index['version'], CORPUS_VERSION))
+    return index
+
+
+def _objective_sense(m):
+    """Sense of the objective of a pyomo model or kernel block (lean)."""
+    import pyomo.environ as pyo
+    import pyomo.kernel as pmo
+
+    if isinstance(m, pyo.Block):
+        objectives = m.component_data_objects(pyo.Objective, active=True)
+    else:
+        objectives = m.components(ctype=pmo.objective, active=True)
+    objective = next(objectives)
+    return 'minimize' if objective.sense == pyo.minimize else 'maximize'
+
+
+def record(jobs, config, corpus_path, force=False):
+    """Save the discretized NLP of jobs into a corpus.
+
+    Every NLP is written as <key>.nl (with the .row and .col names) and a
+    <key>.json sidecar with the job, the configuration, the objective
+    sense, the size of the NLP, the sha256 of the .nl file, the build and
+    write times and the pyomo version and git commit it was built with.
+    The index (corpus.json) lists the entries and the corpus version.
+
+    Parameters
+    ----------
+    jobs : list
+        A list of job specifications.
+    config : yaml
+        The configuration file for the simulation
+    corpus_path : str
+        Directory of the corpus, one directory per corpus version.
+    force : bool
+        Record the jobs already in the corpus again.
+
+    Returns
+    -------
+    list
+        The sidecars of the recorded jobs.
+
+    """
+    import pyomo
+    import pyomo.environ as pyo
+    from models.sweep import job_key
+
+    corpus_path = Path(corpus_path)
+    corpus_path.mkdir(parents=True, exist_ok=True)
+    index = read_corpus(corpus_path)
+    known = {entry['key'] for entry in index['entries']}
+    commit = _git_commit()
+    recorded = []
+    for job in jobs:
+        key = job_key(job)
+        if key in known and not force:
+            continue
+        start = time.perf_counter()
+        m = discretized_model(job, config)
+        build = time.perf_counter() - start
+        # Before writing, so a failure does not leave a .nl without sidecar
+        sense = _objective_sense(m)
+
+        nl_path = corpus_path / (key + '.nl')
+        start = time.perf_counter()
+        labels = {'symbolic_solver_labels': True}
+        if isinstance(m, pyo.Block):
+            m.write(str(nl_path), format='nl', io_options=labels)
+        else:
+            m.write(str(nl_path), format='nl', **labels)  # kernel (lean)
+        write = time.perf_counter() - start
+        with open(str(nl_path), 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+
+        sidecar = {
+            'version': CORPUS_VERSION,
+            'key': key,
+            'model_name': job['model_name'],
+            'job': job,
+            'config': {**config, **job.get('overrides', {})},
+            'sense': sense,
+            'sha256': digest,
+            'build_time': build,
+            'write_time': write,
+            'pyomo': pyomo.version.version,
+            'commit': commit,
+            'recorded': time.time(),
+            **nl_header(nl_path)
+        }
+        _write_json(corpus_path / (key + '.json'), sidecar)
+        recorded.append(sidecar)
+
+        index['entries'] = [
+            entry for entry in index['entries'] if entry['key'] != key
+        ] + [{'key': key, 'model_name': job['model_name']}]
+        known.add(key)
+        _write_json(corpus_path / INDEX, index)
+
+    return recorded
+
+
+def read_sidecars(corpus_path):
+    """Sidecars of the entries of a corpus, in the order of the index."""
+    sidecars = []
+    for entry in read_corpus(corpus_path)['entries']:
+        with open(str(Path(corpus_path) / (entry['key'] + '.json'))) as f:
+            sidecars.append(json.load(f))
+    return sidecars
+
+
+def replay_ipopt(nl_path, options, timeout=None):
+    """Solve a .nl file with the ipopt executable.
+
+    The .nl file is linked into a temporary directory, so the .sol file
+    and the ipopt.opt options file of parallel replays never collide.
+
+    Parameters
+    ----------
+    nl_path : str
+        The .nl file.
+    options : dict
+        IPOPT options.
+    timeout : float
+        Wall time after which ipopt is killed (s).
+
+    Returns
+    -------
+    dict
+        The status, iterations, objective (as minimised by IPOPT, so
+        negated for maximisation problems) and wall time.
+
+    """
+    from pyomo.opt import ReaderFactory
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        stub = Path(temp_dir) / 'model'
+        os.symlink(str(Path(nl_path).resolve()), str(stub) + '.nl')
+        with open(str(Path(temp_dir) / 'ipopt.opt'), 'w') as f:
+            for option, value in options.items():
+                f.write('{} {}\n'.format(option, value))
+        start = time.perf_counter()
+        try:
+            output = subprocess.run(['ipopt', str(stub), '-AMPL'],
+                                    cwd=temp_dir,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT,
+                                    timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return {
+                'status': 'timeout',
+                'iterations': np.nan,
+                'objective': np.nan,
+                'time': time.perf_counter() - start
+            }
+        elapsed = time.perf_counter() - start
+        log = output.stdout.decode(errors='replace')
+
+        status = 'error'
+        if os.path.exists(str(stub) + '.sol'):
+            with ReaderFactory('sol') as reader:
+                status = str(
+                    reader(str(stub) + '.sol').solver.termination_condition)
+
+    iterations = _ITERATIONS.search(log)
+    objective = _OBJECTIVE.search(log)
+    message = _EXIT.search(log)
+    return {
+        'status': status,
+        'message': message.group(1).strip() if message else None,
+        'iterations': int(iterations.group(1)) if iterations else np.nan,
+        'objective': float(objective.group(2)) if objective else np.nan,
+        'time': elapsed
+    }
+
+
+def replay_cyipopt(nl_path, options, sense):
+    """Solve a .nl file in this process (PyNumero ASL and cyipopt).
+
+    Parameters
+    ----------
+    nl_path : str
+        The .nl file.
+    options : dict
+        IPOPT options.
+    sense : str
+        minimize or maximize, the sense of the objective.
+
+    Returns
+    -------
+    dict
+        As replay_ipopt, the time includes loading the .nl file.
+
+    """
+    from pyomo.contrib.pynumero.algorithms.solvers.cyipopt_solver import (
+        CyIpoptSolver)
+    from pyomo.contrib.pynumero.interfaces.ampl_nlp import AmplNLP
+    from models.inprocess import STATUS, _problem
+
+    start = time.perf_counter()
+    nlp = AmplNLP(str(nl_path))
+    problem = _problem(nlp, 1.0 if sense == 'minimize' else -1.0)
+    iterations = [0]
+
+    def intermediate(alg_mod, iter_count, *args):
+        iterations[0] = iter_count
+        return True
+
+    problem.intermediate = intermediate
+    with contextlib.redirect_stdout(io.StringIO()):
+        x, info = CyIpoptSolver(problem, options).solve(
+            nlp.init_primals(), tee=False)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'status': str(STATUS.get(info['status'], 'error')),
+        'message': info['status_msg'].decode() if isinstance(
+            info['status_msg'], bytes) else info['status_msg'],
+        'iterations': iterations[0],
+        'objective': float(info['obj_val']),
+        'time': elapsed
+    }
+
+
+def _replay(args):
+    sidecar, nl_path, setting, repeat, timeout = args
+    options = setting.get('options', {})
+    if setting['solver'] == 'cyipopt':
+        result = replay_cyipopt(nl_path, options, sidecar['sense'])
+    else:
+        result = replay_ipopt(nl_path, options, timeout)
+    result.update({
+        'key': sidecar['key'],
+        'model_name': sidecar['model_name'],
+        'n_vars': sidecar['n_vars'],
+        'setting': setting['name'],
+        'repeat': repeat
+    })
+    return result
+
+
+def replay(corpus_path, settings=None, n_jobs=1, repeat=1, timeout=None):
+    """Solve every NLP of a corpus with every solver setting.
+
+    No model is built, so the times are the solver side only (reading the
+    .nl file and solving). Parallel replays share the cores and memory
+    bandwidth, use n_jobs=1 for timings which are compared to others.
+
+    Parameters
+    ----------
+    corpus_path : str
+        Directory of the corpus.
+    settings : list
+        Solver settings, dicts with a name, a solver (ipopt or cyipopt)
+        and IPOPT options.
+    n_jobs : int
+        Number of worker processes.
+    repeat : int
+        Number of solves of every NLP with every setting.
+    timeout : float
+        Wall time after which an ipopt replay is killed (s).
+
+    Returns
+    -------
+    dataframe
+        One row per solve: the entry, setting, repeat, status, message,
+        iterations, objective and time.
+
+    """
+    corpus_path = Path(corpus_path)
+    tasks = []
+    for sidecar in read_sidecars(corpus_path):
+        nl_path = corpus_path / (sidecar['key'] + '.nl')
+        for setting in settings or DEFAULT_SETTINGS:
+            for i in range(repeat):
+                tasks.append((sidecar, nl_path, setting, i, timeout))
+
+    if n_jobs <= 1 or len(tasks) <= 1:
+        results = [_replay(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_jobs,
+                                                 len(tasks))) as pool:
+            results = list(pool.map(_replay, tasks))
+
+    return pd.DataFrame(results,
+                        columns=[
+                            'key', 'model_name', 'n_vars', 'setting',
+                            'repeat', 'status', 'message', 'iterations',
+                            'objective', 'time'
+                        ])
+
+
+def run_benchmark(corpus_path, settings=None, n_jobs=1, repeat=3,
+                  timeout=None):
+    """Print the median replay time of every NLP and solver setting.
+
+    Parameters
+    ----------
+    corpus_path : str
+        Directory of the corpus.
+    settings : list
+        Solver settings (see replay).
+    n_jobs : int
+        Number of worker processes.
+    repeat : int
+        Number of solves of every NLP with every setting.
+    timeout : float
+        Wall time after which an ipopt replay is killed (s).
+
+    Returns
+    -------
+    dataframe
+        The results of every solve.
+
+    """
+    results = replay(corpus_path, settings, n_jobs, repeat, timeout)
+    summary = results.groupby(['model_name', 'key', 'setting']).agg(
+        n_vars=('n_vars', 'first'),
+        status=('status', lambda status: ','.join(sorted(set(status)))),
+        iterations=('iterations', 'median'),
+        objective=('objective', 'median'),
+        time=('time', 'median'))
+    print(summary.to_string(float_format='{:.4g}'.format))
+
+    return results
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, str(Path(__file__).parents[1]))
+    run_benchmark(sys.argv[1])
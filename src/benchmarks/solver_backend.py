@@ -0,0 +1,108 @@
+import contextlib
+import io
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+def solve_times(config, solver, stiffness, tf, nfe, repeat):
+    """First solve and re-solve times of one backend.
+
+    Parameters
+    ----------
+    config : yaml
+        The configuration file for the simulation
+    solver : str
+        IPOPT backend (see models.optimize.SOLVERS).
+    stiffness : str
+        Stiffness of springs used for simulation
+    tf : float
+        Final time.
+    nfe : int
+        Number of finite elements.
+    repeat : int
+        Number of re-solves of the same model from its solution.
+
+    Returns
+    -------
+    dict
+        The times (s), the objective and the optimal values.
+
+    """
+    from models import hammering
+    from models.optimize import get_solver, run_optimization
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        m = hammering.dynamic_motion_model(tf, stiffness, config)
+    start = time.perf_counter()
+    m, optimal_values, solution = run_optimization(m, nfe, solver=solver)
+    first = time.perf_counter() - start
+
+    opt = get_solver(solver)
+    resolves = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        opt.solve(m)
+        resolves.append(time.perf_counter() - start)
+
+    return {
+        'first': first,
+        'resolve': float(np.median(resolves)) if resolves else np.nan,
+        'objective': m.obj(),
+        'status': str(solution.solver.termination_condition),
+        'optimal_values': optimal_values
+    }
+
+
+def run_benchmark(config,
+                  stiffness='variable_stiffness',
+                  tf=1.5,
+                  nfe=(100, 500),
+                  repeat=5):
+    """Compare the ipopt executable with the in process backend.
+
+    Parameters
+    ----------
+    config : yaml
+        The configuration file for the simulation
+    stiffness : str
+        Stiffness of springs used for simulation
+    tf : float
+        Final time.
+    nfe : list
+        Mesh sizes to solve.
+    repeat : int
+        Number of re-solves per backend.
+
+    Returns
+    -------
+    dict
+        The results of every backend and mesh size.
+
+    """
+    results = {}
+    print('{:>6} {:>8} {:>10} {:>12} {:>12} {:>10}'.format(
+        'nfe', 'solver', 'first (s)', 'resolve (s)', 'objective', 'max diff'))
+    for n in nfe:
+        for solver in ['ipopt', 'cyipopt']:
+            results[(solver, n)] = solve_times(config, solver, stiffness, tf,
+                                               n, repeat)
+        # Largest difference of the optimal values between the backends
+        reference = results[('ipopt', n)]['optimal_values']
+        difference = (results[('cyipopt', n)]['optimal_values'] -
+                      reference).abs().max().max()
+        for solver in ['ipopt', 'cyipopt']:
+            result = results[(solver, n)]
+            print('{:>6} {:>8} {:>10.3f} {:>12.3f} {:>12.6f} {:>10.2e}'.format(
+                n, solver, result['first'], result['resolve'],
+                result['objective'], difference))
+
+    return results
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, str(Path(__file__).parents[1]))
+    from utils import load_config
+    run_benchmark(load_config())
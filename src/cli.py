@@ -0,0 +1,1029 @@
+"""Command line entry point for the dynamic manipulation study.
+
+Examples
+--------
+python src/cli.py solve --stiffness low_stiffness --tf 2.0 --nfe 500
+python src/cli.py sweep --job-file jobs.yml --jobs 8 [--resume]
+python src/cli.py scenarios --job-file car_scenarios.yml --jobs 8
+python src/cli.py search --tf-min 0.7 --tf-max 2.0 --jobs 4
+python src/cli.py --set h_mass=0.25 export --stiffness low_stiffness
+python src/cli.py plot optimal_trajectories --save
+python src/cli.py render --jobs 4
+python src/cli.py animate --jobs 4 --speed 0.25
+
+"""
+import sys
+from pathlib import Path
+
+import click
+
+# Make the packages in src importable when called as a script
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from utils import load_config  # noqa: E402
+
+PROJECT_DIR = Path(__file__).resolve().parents[1]
+
+# Same as visualization.pipeline.FIGURES (not imported to keep --help fast)
+PLOTS = [
+    'optimal_trajectories', 'hammer_magnet_path', 'hammer_magnet_external',
+    'simulation_trajectories', 'experiment_trajectories'
+]
+
+
+def solver_options(f):
+    """Options shared by all the commands which solve a model."""
+    options = [
+        click.option('--builder',
+                     default='dynamic',
+                     show_default=True,
+                     help='Model builder (dynamic, trajectory, flat, car, '
+                     'lean).'),
+        click.option('--nfe',
+                     default=500,
+                     show_default=True,
+                     help='Number of finite elements.'),
+        click.option('--scheme',
+                     default='BACKWARD',
+                     show_default=True,
+                     help='Finite difference scheme.'),
+        click.option('--solver',
+                     default='ipopt',
+                     show_default=True,
+                     help='IPOPT backend (ipopt executable or cyipopt).'),
+        click.option('--jobs',
+                     'n_jobs',
+                     default=1,
+                     show_default=True,
+                     help='Number of parallel solver processes.'),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
+
+
+def save_outputs(outputs, config, save):
+    from utils import save_model_log
+
+    for output in outputs:
+        print(output['model_name'], output['solver_status'],
+              output['obj_values'])
+        if save:
+            save_path = str(PROJECT_DIR / config['save_path'])
+            save_model_log(output, save_path)
+
+
+@click.group()
+@click.option('--config',
+              'config_path',
+              default=None,
+              type=click.Path(exists=True),
+              help='Path to the configuration file.')
+@click.option('--set',
+              'overrides',
+              multiple=True,
+              metavar='KEY=VALUE',
+              help='Override a configuration entry (repeatable).')
+@click.pass_context
+def cli(ctx, config_path, overrides):
+    ctx.obj = load_config(config_path, overrides)
+
+
+@cli.command()
+@solver_options
+@click.option('--stiffness',
+              multiple=True,
+              help='Stiffness mode (repeatable), defaults to all in config.')
+@click.option('--tf', required=True, type=float, help='Final time.')
+@click.option('--save/--no-save', default=True, show_default=True)
+@click.pass_obj
+def solve(config, builder, nfe, scheme, solver, n_jobs, stiffness, tf, save):
+    """Solve the model for one final time and each stiffness."""
+    from models.batch import make_job, run_jobs
+
+    stiffness = stiffness or config['stiffness']
+    jobs = [
+        make_job(builder=builder, stiffness=item, tf=tf, nfe=nfe,
+                 scheme=scheme, solver=solver) for item in stiffness
+    ]
+    save_outputs(run_jobs(jobs, config, n_jobs), config, save)
+
+
+def print_plan(jobs, config, n_jobs, history, sweep_path=None):
+    """Print the predicted schedule of the jobs still to solve."""
+    from models.schedule import plan
+    from models.sweep import TODO, job_key, read_manifest
+
+    manifest = read_manifest(sweep_path) if sweep_path else None
+    if manifest is not None:
+        done = {
+            entry['key'] for entry in manifest['jobs']
+            if entry['state'] not in TODO
+        }
+        known = {entry['key'] for entry in manifest['jobs']}
+        jobs = [entry['job'] for entry in manifest['jobs']
+                if entry['key'] not in done] + [
+                    job for job in jobs if job_key(job) not in known
+                ]
+    df, totals = plan(jobs, config, n_jobs, history)
+    print('{} timings in the result store'.format(
+        0 if history is None else len(history)))
+    if len(df):
+        print(df.to_string(index=False, float_format='{:.3g}'.format))
+    print('{n_jobs} jobs on {workers} workers: wall time {wall_time:.3g} s, '
+          'cpu time {cpu_time:.3g} s, peak memory {peak_memory:.0f} MB'.format(
+              workers=n_jobs, **totals))
+
+
+@cli.command()
+@click.option('--job-file',
+              type=click.Path(exists=True),
+              help='Yaml file with the batch of jobs.')
+@click.option('--jobs',
+              'n_jobs',
+              default=1,
+              show_default=True,
+              help='Number of parallel solver processes.')
+@click.option('--output',
+              type=click.Path(),
+              help='Sweep directory, defaults to save_path/sweeps/<job file>.')
+@click.option('--resume',
+              is_flag=True,
+              help='Skip the done jobs of the sweep and solve the others.')
+@click.option('--save/--no-save', default=True, show_default=True)
+@click.option('--dry-run',
+              is_flag=True,
+              help='Print the predicted wall time and memory, solve nothing.')
+@click.pass_obj
+def sweep(config, job_file, n_jobs, output, resume, save, dry_run):
+    """Solve all the jobs in a batch job file."""
+    from models.batch import read_job_file, run_jobs
+    from models.schedule import read_history
+
+    if job_file is None and not (resume and output):
+        raise click.UsageError('--job-file is needed unless resuming --output')
+    jobs = read_job_file(job_file) if job_file else []
+    # Solve times of the earlier results, to predict the cost of the jobs
+    history = None
+    if n_jobs > 1 or dry_run:
+        history = read_history([PROJECT_DIR / config['save_path']])
+    if output is None and job_file is not None:
+        output = (PROJECT_DIR / config['save_path'] / 'sweeps' /
+                  Path(job_file).stem)
+    if dry_run:
+        print_plan(jobs, config, n_jobs, history, output if resume else None)
+        return
+    if not save:
+        save_outputs(run_jobs(jobs, config, n_jobs, history), config, save)
+        return
+
+    from models.sweep import run_sweep
+
+    try:
+        manifest = run_sweep(jobs, config, output, n_jobs, resume, history)
+    except FileExistsError as error:
+        raise click.ClickException(str(error))
+    for entry in manifest['jobs']:
+        print(entry['job']['model_name'], entry['state'],
+              entry.get('solver_status'), entry.get('obj_values'),
+              entry.get('result') or entry.get('error'))
+
+
+@cli.command()
+@click.option('--job-file',
+              required=True,
+              type=click.Path(exists=True),
+              help='Yaml file with the batch of scenarios.')
+@click.option('--jobs',
+              'n_jobs',
+              default=1,
+              show_default=True,
+              help='Number of parallel solver processes.')
+@click.option('--output',
+              default=None,
+              help='Columnar output, defaults to the trajectory save path.')
+@click.pass_obj
+def scenarios(config, job_file, n_jobs, output):
+    """Solve a batch of scenarios seeded from the nearest solved one."""
+    from models.batch import read_job_file, solve_scenarios
+
+    if output is None:
+        save_path = PROJECT_DIR / config['trajectory_save_path']
+        save_path.mkdir(parents=True, exist_ok=True)
+        output = str(save_path / 'scenarios.npz')
+    outputs, df = solve_scenarios(read_job_file(job_file),
+                                  config,
+                                  n_jobs=n_jobs,
+                                  save_path=output)
+    for item in outputs:
+        print(item['model_name'], item['job']['tf'], item['solver_status'],
+              item['obj_values'])
+
+
+@cli.command()
+@solver_options
+@click.option('--stiffness', default='variable_stiffness', show_default=True)
+@click.option('--tf-min', default=0.7, show_default=True)
+@click.option('--tf-max', default=2.0, show_default=True)
+@click.option('--tol', default=10e-3, show_default=True)
+@click.option('--starts',
+              'n_starts',
+              default=1,
+              show_default=True,
+              help='Multi-start initial trajectories per final time.')
+@click.pass_obj
+def search(config, builder, nfe, scheme, solver, n_jobs, stiffness, tf_min,
+           tf_max, tol, n_starts):
+    """Search the minimum feasible final time."""
+    from models.search import search_minimum_time
+
+    tf, history = search_minimum_time(config,
+                                      tf_min,
+                                      tf_max,
+                                      tol=tol,
+                                      n_jobs=n_jobs,
+                                      n_starts=n_starts,
+                                      builder=builder,
+                                      stiffness=stiffness,
+                                      nfe=nfe,
+                                      scheme=scheme,
+                                      solver=solver)
+    for tf_tried, feasible, objective in history:
+        print('tf {:.6f}  feasible {!s:<5}  objective {}'.format(
+            tf_tried, feasible, objective))
+    print(tf)
+
+
+@cli.command()
+@solver_options
+@click.option('--stiffness', default='variable_stiffness', show_default=True)
+@click.option('--tf', required=True, type=float, help='Final time.')
+@click.option('--starts', 'n_starts', default=8, show_default=True)
+@click.option('--bound',
+              default=None,
+              type=float,
+              help='Best known objective, stop once it is reached.')
+@click.option('--tol', default=1e-3, show_default=True)
+@click.option('--seed', default=0, show_default=True)
+@click.option('--save/--no-save', default=True, show_default=True)
+@click.pass_obj
+def multistart(config, builder, nfe, scheme, solver, n_jobs, stiffness, tf,
+               n_starts, bound, tol, seed, save):
+    """Solve from several initial trajectories and keep the best."""
+    from models.multistart import run_multistart
+
+    best, spread = run_multistart(config,
+                                  tf,
+                                  stiffness,
+                                  n_starts=n_starts,
+                                  n_jobs=n_jobs,
+                                  bound=bound,
+                                  tol=tol,
+                                  seed=seed,
+                                  builder=builder,
+                                  nfe=nfe,
+                                  scheme=scheme,
+                                  solver=solver)
+    for strategy, feasible, objective in spread['starts']:
+        print(strategy, feasible, objective)
+    print('feasible {n_feasible}/{n_solved}, min {min}, max {max}, '
+          'std {std}'.format(**spread))
+    if best is not None:
+        save_outputs([best], config, save)
+
+
+@cli.command()
+@click.option('--stiffness', default='variable_stiffness', show_default=True)
+@click.option('--tf', required=True, type=float, help='Final time.')
+@click.option('--nfe', default=100, show_default=True)
+@click.option('--param',
+              'params',
+              multiple=True,
+              default=['tf', 'h_mass', 'path_length'],
+              show_default=True,
+              help='Mutable parameter of the scaled model (repeatable).')
+@click.option('--predict',
+              'values',
+              multiple=True,
+              metavar='KEY=VALUE',
+              help='Predict the objective for new parameter values.')
+@click.pass_obj
+def sensitivity(config, stiffness, tf, nfe, params, values):
+    """Objective and trajectory sensitivities from a single solve."""
+    from models.sensitivity import hammering_sensitivity
+
+    result = hammering_sensitivity(config, stiffness, tf, params, nfe=nfe)
+    print('status', result.solver_status, 'objective', result.objective)
+    for name, value in result.gradient().items():
+        print('d objective / d {} = {}'.format(name, value))
+    if values:
+        values = dict(item.split('=', 1) for item in values)
+        objective, _ = result.predict(
+            {key: float(value)
+             for key, value in values.items()})
+        print('predicted objective', objective)
+
+
+@cli.command()
+@click.option('--stiffness',
+              multiple=True,
+              help='Stiffness mode (repeatable), defaults to all the logs.')
+@click.option('--trajectories',
+              default='time,bd,bv,hd,hv,md,mv',
+              show_default=True,
+              help='Comma separated trajectories to export.')
+@click.option('--source',
+              multiple=True,
+              help='Experiment directory (repeatable), defaults to save_path.')
+@click.option('--all-experiments',
+              is_flag=True,
+              help='Export every models/experiment_* directory.')
+@click.option('--format',
+              'formats',
+              multiple=True,
+              default=['csv'],
+              type=click.Choice(['csv', 'npz']),
+              show_default=True)
+@click.option('--jobs', 'n_jobs', default=1, show_default=True)
+@click.option('--force', is_flag=True, help='Export up to date logs too.')
+@click.pass_obj
+def export(config, stiffness, trajectories, source, all_experiments, formats,
+           n_jobs, force):
+    """Export the optimal trajectories to csv and/or npz."""
+    from models.utils import export_trajectory_data
+
+    if all_experiments:
+        source = [
+            str(path.relative_to(PROJECT_DIR))
+            for path in sorted(PROJECT_DIR.glob('models/experiment_*'))
+        ]
+    result = export_trajectory_data(config,
+                                    stiffness,
+                                    trajectories.split(','),
+                                    read_paths=source or None,
+                                    formats=formats,
+                                    n_jobs=n_jobs,
+                                    force=force)
+    print('{} exported, {} up to date'.format(len(result['exported']),
+                                              len(result['skipped'])))
+    for path, missing in result['incompatible'].items():
+        print('Skipped {}: no {} trajectories'.format(path,
+                                                      ', '.join(missing)))
+
+
+@cli.command()
+@click.option('--stiffness',
+              multiple=True,
+              help='Stiffness mode (repeatable), defaults to all the logs.')
+@click.option('--rate', default=1000.0, show_default=True, help='Hz')
+@click.pass_obj
+def resample(config, stiffness, rate):
+    """Resample the optimal trajectories to controller setpoint files."""
+    from models.resample import (check_endpoints, check_limits,
+                                 resample_trajectories, save_setpoints)
+    from models.utils import log_stiffness, read_model_log
+
+    read_path = PROJECT_DIR / config['save_path']
+    save_path = PROJECT_DIR / config['trajectory_save_path']
+    for fname in sorted(read_path.glob('*.pkl')):
+        if stiffness and log_stiffness(fname) not in stiffness:
+            continue
+        log = read_model_log(str(fname))
+        setpoints = resample_trajectories(log['optimal_values'], rate)
+        # Named after the log file: logs with a run id share their model name
+        path = save_path / '{}_{:g}hz.bin'.format(fname.stem, rate)
+        save_setpoints(path, setpoints, rate)
+        print(path.name, len(setpoints), 'records, limit violations',
+              check_limits(setpoints, config) or 'none', 'endpoint errors',
+              check_endpoints(setpoints, log['optimal_values']))
+
+
+@cli.command()
+@click.argument('name', type=click.Choice(PLOTS))
+@click.option('--save/--no-save', default=False, show_default=True)
+@click.option('--show/--no-show', default=True, show_default=True)
+@click.pass_obj
+def plot(config, name, save, show):
+    """Plot the optimal or experimental trajectories."""
+    import matplotlib.pyplot as plt
+    from visualization.pipeline import draw_figure
+
+    draw_figure(config, name, save_plot=save)
+    if show:
+        plt.show()
+
+
+@cli.command()
+@click.argument('names', nargs=-1, type=click.Choice(PLOTS))
+@click.option('--jobs', 'n_jobs', default=1, show_default=True)
+@click.option('--force', is_flag=True, help='Render up to date figures too.')
+@click.pass_obj
+def render(config, names, n_jobs, force):
+    """Save the report figures in parallel, skipping unchanged ones."""
+    from visualization.pipeline import render_figures
+
+    status = render_figures(config, names, n_jobs=n_jobs, force=force)
+    for name, item in status.items():
+        print(name, item)
+
+
+@cli.command()
+@click.argument('paths', nargs=-1, type=click.Path(exists=True))
+@click.option('--format',
+              'fmt',
+              default='gif',
+              show_default=True,
+              type=click.Choice(['gif', 'mp4']),
+              help='mp4 needs ffmpeg.')
+@click.option('--fps', default=30, show_default=True)
+@click.option('--speed',
+              default=1.0,
+              show_default=True,
+              help='Playback speed, 1 is real time.')
+@click.option('--column',
+              'columns',
+              multiple=True,
+              metavar='ROLE=EXPRESSION',
+              help='Column of time, bd, hd or md (repeatable), '
+              'e.g. md=Magnet_position.')
+@click.option('--output',
+              type=click.Path(),
+              help='Directory, defaults to figure_save_path/animations.')
+@click.option('--jobs', 'n_jobs', default=1, show_default=True)
+@click.pass_obj
+def animate(config, paths, fmt, fps, speed, columns, output, n_jobs):
+    """Export animations of model logs or experiment csv files."""
+    import matplotlib
+    matplotlib.use('Agg')
+    from visualization.animate import animate_runs
+
+    paths = paths or sorted(
+        (PROJECT_DIR / config['save_path']).glob('*.pkl'))
+    output = output or PROJECT_DIR / config['figure_save_path'] / 'animations'
+    columns = dict(item.split('=', 1) for item in columns)
+    for result in animate_runs(paths, output, fmt, fps, speed, columns,
+                               n_jobs):
+        if 'error' in result:
+            print(result['path'], result['error'])
+            continue
+        print(result['path'], result['frames'], 'frames',
+              '{:.2f} s video rendered in {:.2f} s'.format(
+                  result['duration'], result['render_time']))
+
+
+def parse_grid(value):
+    """Parse a grid given as start:stop:num or as comma separated values."""
+    import numpy as np
+
+    if ':' in value:
+        start, stop, num = value.split(':')
+        return np.linspace(float(start), float(stop), int(num)).tolist()
+    return [float(item) for item in value.split(',')]
+
+
+@cli.command()
+@click.argument('paths', nargs=-1)
+@click.pass_obj
+def ingest(config, paths):
+    """Convert new or changed experiment csv files to the columnar cache."""
+    from data.ingest import ingest as ingest_files
+
+    keys = ['input_data_path', 'output_data_path', 'data_path']
+    paths = paths or [config[key] for key in keys if key in config]
+    counts = ingest_files(paths)
+    print('{converted} converted, {touched} touched, {unchanged} unchanged'.
+          format(**counts))
+
+
+@cli.group()
+def lookup():
+    """Precomputed table of optimal schedules."""
+
+
+@lookup.command()
+@click.option('--tf', 'tf_grid', default='0.8:2.0:13', show_default=True)
+@click.option('--path-length', default='0.2:0.3:5', show_default=True)
+@click.option('--h-mass', default='0.1:0.3:5', show_default=True)
+@click.option('--stiffness', multiple=True)
+@click.option('--nfe', default=100, show_default=True)
+@click.option('--samples', default=101, show_default=True)
+@click.option('--jobs', 'n_jobs', default=1, show_default=True)
+@click.option('--output',
+              default=str(PROJECT_DIR / 'models/lookup_table.npz'),
+              show_default=True)
+@click.pass_obj
+def generate(config, tf_grid, path_length, h_mass, stiffness, nfe, samples,
+             n_jobs, output):
+    """Solve over a parameter grid and save the table."""
+    from models.lookup import generate_lookup_table
+
+    table = generate_lookup_table(config,
+                                  parse_grid(tf_grid),
+                                  parse_grid(path_length),
+                                  parse_grid(h_mass),
+                                  stiffness=stiffness,
+                                  nfe=nfe,
+                                  n_samples=samples,
+                                  n_jobs=n_jobs,
+                                  save_path=output)
+    print('{} of {} grid points feasible'.format(table['feasible'].sum(),
+                                                 table['feasible'].size))
+
+
+@lookup.command()
+@click.option('--table',
+              default=str(PROJECT_DIR / 'models/lookup_table.npz'),
+              show_default=True)
+@click.option('--tf', required=True, type=float)
+@click.option('--path-length', required=True, type=float)
+@click.option('--h-mass', required=True, type=float)
+@click.option('--stiffness', default='variable_stiffness', show_default=True)
+def query(table, tf, path_length, h_mass, stiffness):
+    """Interpolate the schedules for the given parameters."""
+    from models.lookup import LookupTable
+
+    result = LookupTable(table).query(tf, path_length, h_mass, stiffness)
+    print('feasible', result['feasible'], 'hv', result['hv'])
+    for t, ba, md in zip(result['time'], result['ba'], result['md']):
+        print('{:.4f} {:.4f} {:.4f}'.format(t, ba, md))
+
+
+@cli.group()
+def warmstart():
+    """Library of stored solutions used as initial points."""
+
+
+@warmstart.command()
+@click.option('--source',
+              multiple=True,
+              help='Directory with model logs, defaults to '
+              'models/experiment_*')
+@click.option('--grid', default=101, show_default=True)
+@click.pass_obj
+def build(config, source, grid):
+    """Index the stored model logs by their parameters."""
+    from models.warmstart import build_library
+
+    source = source or sorted(PROJECT_DIR.glob('models/experiment_*'))
+    n = build_library(source, config,
+                      PROJECT_DIR / config['warm_start_library'], grid)
+    print('{} solutions in {}'.format(n, config['warm_start_library']))
+
+
+@cli.group()
+def stream():
+    """Stream setpoints of a solved trajectory to the controller."""
+
+
+def stream_options(f):
+    """Options shared by the stream commands."""
+    options = [
+        click.option('--source',
+                     default=None,
+                     help='Model log (.pkl) or setpoint file (.bin), '
+                     'defaults to the variable stiffness log in save_path.'),
+        click.option('--rate', default=1000.0, show_default=True, help='Hz'),
+        click.option('--spin',
+                     default=1e-3,
+                     show_default=True,
+                     help='Time spent spinning before every deadline (s).'),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
+
+
+def load_frames(config, source, rate):
+    from models.streaming import load_setpoints, pack_frames
+
+    source = source or str(PROJECT_DIR / config['save_path'] /
+                           'variable_stiffness.pkl')
+    return pack_frames(*load_setpoints(source, rate))
+
+
+@stream.command()
+@stream_options
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=9000, show_default=True)
+@click.pass_obj
+def serve(config, source, rate, spin, host, port):
+    """Serve the setpoints until interrupted, then print the jitter."""
+    import asyncio
+    from models.streaming import SetpointServer
+
+    server = SetpointServer(load_frames(config, source, rate), rate, spin)
+    loop = asyncio.new_event_loop()
+    port = loop.run_until_complete(server.start(host, port))
+    print('streaming on {}:{} at {:g} Hz'.format(host, port, rate))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.stop())
+        loop.close()
+    print('send jitter (us)', server.stats())
+
+
+@stream.command()
+@stream_options
+@click.option('--clients', 'n_clients', default=1, show_default=True)
+@click.pass_obj
+def test(config, source, rate, spin, n_clients):
+    """Stream to local stand-in clients and print the jitter."""
+    from models.streaming import run_local
+
+    stats, results = run_local(load_frames(config, source, rate), rate,
+                               n_clients, spin)
+    print('send jitter (us)', stats)
+    for i, (frames, arrival) in enumerate(results):
+        print('client', i, len(frames), 'frames, arrival jitter (us)',
+              arrival)
+
+
+@cli.group()
+def queue():
+    """Job queue on a shared filesystem for multi-node sweeps."""
+
+
+def queue_option(f):
+    """Directory of the queue, defaults to save_path/queue."""
+    return click.option('--queue',
+                        'queue_path',
+                        default=None,
+                        type=click.Path(),
+                        help='Queue directory on a shared filesystem, '
+                        'defaults to save_path/queue.')(f)
+
+
+def queue_dir(config, queue_path):
+    return queue_path or PROJECT_DIR / config['save_path'] / 'queue'
+
+
+@queue.command()
+@click.option('--job-file',
+              required=True,
+              type=click.Path(exists=True),
+              help='Yaml file with the batch of jobs.')
+@queue_option
+@click.pass_obj
+def submit(config, job_file, queue_path):
+    """Add the jobs of a batch job file to the queue."""
+    from models.batch import read_job_file
+    from models.workqueue import enqueue
+
+    added = enqueue(read_job_file(job_file), queue_dir(config, queue_path))
+    print('{} jobs added'.format(len(added)))
+
+
+@queue.command()
+@queue_option
+@click.option('--workers', 'n_workers', default=1, show_default=True)
+@click.option('--heartbeat', default=10.0, show_default=True, help='s')
+@click.option('--timeout',
+              default=60.0,
+              show_default=True,
+              help='Heartbeat age after which a job is requeued (s).')
+@click.option('--wait/--no-wait',
+              default=False,
+              show_default=True,
+              help='Keep waiting for jobs once the queue is empty.')
+@click.pass_obj
+def work(config, queue_path, n_workers, heartbeat, timeout, wait):
+    """Solve the queued jobs with local worker processes."""
+    from models.workqueue import run_local_workers, run_worker
+
+    queue_path = queue_dir(config, queue_path)
+    kwargs = {'heartbeat': heartbeat, 'timeout': timeout, 'wait': wait}
+    if n_workers <= 1:
+        solved = [run_worker(queue_path, config, **kwargs)]
+    else:
+        solved = run_local_workers(queue_path, config, n_workers, **kwargs)
+    print('{} jobs solved'.format(sum(solved)))
+
+
+@queue.command()
+@queue_option
+@click.option('--retry', is_flag=True, help='Requeue the failed jobs.')
+@click.pass_obj
+def status(config, queue_path, retry):
+    """Number of jobs in every state."""
+    from models.workqueue import queue_status, retry_failed
+
+    queue_path = queue_dir(config, queue_path)
+    if retry:
+        print('{} failed jobs requeued'.format(retry_failed(queue_path)))
+    print(queue_status(queue_path))
+
+
+@cli.group()
+def daemon():
+    """Long lived solver processes serving requests on a Unix socket."""
+
+
+@daemon.command('serve')
+@click.option('--socket',
+              'socket_path',
+              default='/tmp/dynamic-manipulation.sock',
+              show_default=True)
+@click.option('--workers', 'n_workers', default=2, show_default=True)
+@click.option('--max-pending', default=64, show_default=True)
+@click.option('--nfe',
+              default='500',
+              show_default=True,
+              help='Meshes of the templates built at start (comma separated).')
+@click.pass_obj
+def daemon_serve(config, socket_path, n_workers, max_pending, nfe):
+    """Serve solve requests until interrupted."""
+    from models.daemon import serve
+
+    prebuild = [(stiffness, int(item), 'BACKWARD')
+                for stiffness in config['stiffness']
+                for item in nfe.split(',')]
+    served = serve(config, socket_path, n_workers, max_pending, prebuild)
+    print('{} requests served'.format(served))
+
+
+@daemon.command('solve')
+@click.option('--socket',
+              'socket_path',
+              default='/tmp/dynamic-manipulation.sock',
+              show_default=True)
+@click.option('--builder', default='dynamic', show_default=True)
+@click.option('--stiffness',
+              multiple=True,
+              help='Stiffness mode (repeatable), defaults to all in config.')
+@click.option('--tf', required=True, type=float, help='Final time.')
+@click.option('--nfe', default=500, show_default=True)
+@click.pass_obj
+def daemon_solve(config, socket_path, builder, stiffness, tf, nfe):
+    """Send solve requests to a running daemon."""
+    from models.daemon import solve_remote
+
+    jobs = [{
+        'builder': builder,
+        'stiffness': item,
+        'tf': tf,
+        'nfe': nfe
+    } for item in stiffness or config['stiffness']]
+    for result in solve_remote(jobs, socket_path):
+        if 'error' in result:
+            print(result['error'])
+            continue
+        print(result['model_name'], result['solver_status'],
+              result['obj_values'],
+              'solve {:.3f} s, round trip {:.3f} s'.format(
+                  result['solve_time'], result['round_trip']))
+
+
+@cli.group()
+def artifacts():
+    """Deduplicated store of model logs, trajectories and figures."""
+
+
+def experiment_option(f):
+    """Name of the experiment, defaults to the name of save_path."""
+    return click.option('--experiment',
+                        default=None,
+                        help='Experiment name, defaults to the last '
+                        'directory of save_path.')(f)
+
+
+def remote_options(f):
+    options = [
+        click.option('--remote',
+                     required=True,
+                     help='s3://bucket/prefix or a local directory.'),
+        click.option('--endpoint-url',
+                     default=None,
+                     help='S3 compatible server (e.g. a local MinIO).'),
+        click.option('--profile', default=None, help='AWS profile.'),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
+
+
+def experiment_name(config, experiment):
+    return experiment or Path(config['save_path']).name
+
+
+def print_checkout(status):
+    for name in status['skipped']:
+        print('modified, not overwritten:', name)
+    print('{} written, {} unchanged, {} skipped'.format(
+        *[len(status[key]) for key in ['written', 'unchanged', 'skipped']]))
+
+
+@artifacts.command('commit')
+@click.argument('paths', nargs=-1, type=click.Path(exists=True))
+@experiment_option
+@click.pass_obj
+def artifacts_commit(config, paths, experiment):
+    """Add files to the store and write the experiment manifest.
+
+    PATHS default to the save_path, trajectory_save_path and
+    figure_save_path of the configuration.
+    """
+    from data.artifacts import commit
+
+    if not paths:
+        paths = [
+            PROJECT_DIR / config[key] for key in
+            ['save_path', 'trajectory_save_path', 'figure_save_path']
+            if (PROJECT_DIR / config[key]).exists()
+        ]
+    result = commit(experiment_name(config, experiment), paths)
+    print('{} files, {} new chunks ({} bytes)'.format(
+        len(result['manifest']['files']), result['new_chunks'],
+        result['new_bytes']))
+
+
+@artifacts.command('checkout')
+@experiment_option
+@click.option('--force', is_flag=True, help='Overwrite modified files.')
+@click.pass_obj
+def artifacts_checkout(config, experiment, force):
+    """Write the files of an experiment from the store."""
+    from data.artifacts import checkout
+
+    print_checkout(checkout(experiment_name(config, experiment), force=force))
+
+
+@artifacts.command('push')
+@experiment_option
+@remote_options
+@click.pass_obj
+def artifacts_push(config, experiment, remote, endpoint_url, profile):
+    """Upload the chunks the remote does not have and the manifest."""
+    from data.artifacts import get_remote, push
+
+    result = push(experiment_name(config, experiment),
+                  get_remote(remote, endpoint_url, profile))
+    print('{chunks} chunks ({bytes} bytes) uploaded'.format(**result))
+
+
+@artifacts.command('pull')
+@experiment_option
+@remote_options
+@click.option('--checkout/--no-checkout', default=True, show_default=True)
+@click.pass_obj
+def artifacts_pull(config, experiment, remote, endpoint_url, profile,
+                   checkout):
+    """Download the chunks the store does not have and the manifest."""
+    from data.artifacts import checkout as checkout_files, get_remote, pull
+
+    experiment = experiment_name(config, experiment)
+    result = pull(experiment, get_remote(remote, endpoint_url, profile))
+    print('{chunks} chunks ({bytes} bytes) downloaded'.format(**result))
+    if checkout:
+        print_checkout(checkout_files(experiment))
+
+
+@artifacts.command('list')
+def artifacts_list():
+    """Experiments in the store."""
+    from data.artifacts import experiments, read_manifest
+
+    for experiment in experiments():
+        files = read_manifest(experiment)['files']
+        print(experiment, len(files), 'files',
+              sum(entry['size'] for entry in files.values()), 'bytes')
+
+
+@cli.group()
+def corpus():
+    """Recorded discretized NLPs (.nl files) to benchmark solvers alone."""
+
+
+def corpus_dir(label):
+    """Directory of a corpus version, defaults to the latest one."""
+    root = PROJECT_DIR / 'data' / 'interim' / 'nl_corpus'
+    if label is None:
+        labels = sorted(path.name for path in root.glob('*') if path.is_dir())
+        if not labels:
+            raise click.UsageError('No corpus in {}'.format(root))
+        label = labels[-1]
+    return root / label
+
+
+@corpus.command('record')
+@click.option('--job-file',
+              required=True,
+              type=click.Path(exists=True),
+              help='Yaml file with the batch of jobs.')
+@click.option('--label',
+              default=None,
+              help='Version of the corpus, defaults to today (YYYYMMDD).')
+@click.option('--output',
+              type=click.Path(),
+              help='Corpus directory, defaults to '
+              'data/interim/nl_corpus/<label>.')
+@click.option('--force', is_flag=True, help='Record known jobs again.')
+@click.pass_obj
+def corpus_record(config, job_file, label, output, force):
+    """Save the discretized NLP of every job as .nl and a sidecar."""
+    import time
+    from benchmarks.nl_corpus import record
+    from models.batch import read_job_file
+
+    output = output or corpus_dir(label or time.strftime('%Y%m%d'))
+    for sidecar in record(read_job_file(job_file), config, output, force):
+        print(sidecar['model_name'], sidecar['key'], sidecar['n_vars'],
+              sidecar['n_cons'], '{:.2f} s'.format(sidecar['build_time']))
+    print('corpus', output)
+
+
+@corpus.command('replay')
+@click.option('--label', default=None, help='Version of the corpus.')
+@click.option('--corpus',
+              'corpus_path',
+              type=click.Path(exists=True),
+              help='Corpus directory, defaults to the latest version.')
+@click.option('--settings',
+              type=click.Path(exists=True),
+              help='Yaml file with a list of solver settings (name, solver '
+              'and options), defaults to the ipopt executable.')
+@click.option('--jobs',
+              'n_jobs',
+              default=1,
+              show_default=True,
+              help='Number of parallel solver processes.')
+@click.option('--repeat', default=3, show_default=True)
+@click.option('--timeout', type=float, default=None, help='Per solve (s).')
+def corpus_replay(label, corpus_path, settings, n_jobs, repeat, timeout):
+    """Solve every recorded NLP with every solver setting."""
+    import yaml
+    from benchmarks.nl_corpus import run_benchmark
+
+    if settings is not None:
+        with open(settings) as f:
+            settings = yaml.safe_load(f)
+        settings = settings.get('settings', settings) if isinstance(
+            settings, dict) else settings
+    run_benchmark(corpus_path or corpus_dir(label), settings, n_jobs, repeat,
+                  timeout)
+
+
+@cli.group()
+def bench():
+    """Benchmarks of the solver and the tooling."""
+
+
+@bench.command()
+@click.option('--repeat', default=5, show_default=True)
+def imports(repeat):
+    """Import time of the entry points in fresh interpreters."""
+    from benchmarks.import_time import run_benchmark
+
+    run_benchmark(repeat)
+
+
+@bench.command()
+@click.option('--stiffness', default='variable_stiffness', show_default=True)
+@click.option('--tf', default=1.5, show_default=True)
+@click.option('--nfe', default=50, show_default=True)
+@click.option('--rate', default=20.0, show_default=True, help='Hz')
+@click.option('--max-iter', default=100, show_default=True)
+@click.option('--max-cpu-time', default=0.05, show_default=True)
+@click.option('--noise', default=0.0, show_default=True)
+@click.option('--solver', default='ipopt', show_default=True)
+@click.pass_obj
+def mpc(config, stiffness, tf, nfe, rate, max_iter, max_cpu_time, noise,
+        solver):
+    """Per step solve time percentiles of the receding horizon mode."""
+    from benchmarks.mpc_latency import run_benchmark
+
+    run_benchmark(config, stiffness, tf, nfe, rate, max_iter, max_cpu_time,
+                  noise, solver=solver)
+
+
+@bench.command('build')
+@click.option('--nfe', default='1000,2000,5000', show_default=True)
+def model_build(nfe):
+    """Build time and peak RSS of the dae and lean model construction."""
+    from benchmarks.model_build import run_benchmark
+
+    run_benchmark([int(item) for item in nfe.split(',')])
+
+
+@bench.command()
+@click.option('--stiffness', default='variable_stiffness', show_default=True)
+@click.option('--tf', default=1.5, show_default=True)
+@click.option('--nfe', default='100,500', show_default=True)
+@click.option('--repeat', default=5, show_default=True)
+@click.pass_obj
+def solvers(config, stiffness, tf, nfe, repeat):
+    """Solve and re-solve times of the ipopt and cyipopt backends."""
+    from benchmarks.solver_backend import run_benchmark
+
+    nfe = [int(item) for item in nfe.split(',')]
+    run_benchmark(config, stiffness, tf, nfe, repeat)
+
+
+def main():
+    cli()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,401 @@
+import hashlib
+import json
+import os
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from utils import atomic_write
+
+PROJECT_DIR = Path(__file__).resolve().parents[2]
+STORE_PATH = PROJECT_DIR / '.artifacts'
+MANIFESTS = 'manifests'
+CHUNKS = 'chunks'
+
+# Content defined chunking: a boundary follows every position where
+# MASK_BITS bits of the window hash are zero (8 KiB chunks on average),
+# chunks are kept between MIN_CHUNK and MAX_CHUNK bytes
+WINDOW = 48
+MASK_BITS = 13
+MIN_CHUNK = 2 << 10
+MAX_CHUNK = 64 << 10
+# Random 64 bit value of every byte (fixed seed: the chunks must never
+# change between versions, or nothing is deduplicated any more)
+_GEAR = np.random.RandomState(20200301).randint(0,
+                                                2**63,
+                                                size=256,
+                                                dtype=np.int64).astype(
+                                                    np.uint64)
+
+
+def chunk_boundaries(data):
+    """End offsets of the content defined chunks of a bytes object.
+
+    The hash of every position is the sum of the random values of the
+    WINDOW bytes before it, so the boundaries only depend on the nearby
+    content: an insertion only changes the chunks around it, the others
+    are the same and deduplicated. The hash is vectorized (cumulative sum),
+    only the candidate boundaries are visited in python.
+
+    Parameters
+    ----------
+    data : bytes
+        The content.
+
+    Returns
+    -------
+    list
+        The end offset of every chunk (the last one is len(data)).
+
+    """
+    n = len(data)
+    if n <= MIN_CHUNK:
+        return [n] if n else []
+    values = _GEAR[np.frombuffer(data, dtype=np.uint8)]
+    cumulative = np.cumsum(values)  # wraps around, differences stay exact
+    window = cumulative[WINDOW - 1:].copy()
+    window[1:] -= cumulative[:n - WINDOW]
+    # Offset just after the window whose hash matches
+    mask = np.uint64(((1 << MASK_BITS) - 1) << 16)
+    candidates = np.flatnonzero(window & mask == 0) + WINDOW
+
+    boundaries, start = [], 0
+    for candidate in candidates:
+        while candidate - start > MAX_CHUNK:
+            start += MAX_CHUNK
+            boundaries.append(start)
+        if candidate - start >= MIN_CHUNK and candidate < n:
+            boundaries.append(int(candidate))
+            start = int(candidate)
+    while n - start > MAX_CHUNK:
+        start += MAX_CHUNK
+        boundaries.append(start)
+    boundaries.append(n)
+
+    return boundaries
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def chunk_key(digest):
+    """Key of a chunk in a store or a remote."""
+    return '{}/{}/{}'.format(CHUNKS, digest[:2], digest)
+
+
+def manifest_key(experiment):
+    """Key of the manifest of an experiment in a store or a remote."""
+    return '{}/{}.json'.format(MANIFESTS, experiment)
+
+
+class LocalRemote:
+    """Store or remote in a local (or mounted) directory.
+
+    Parameters
+    ----------
+    root : str
+        The directory.
+
+    """
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def keys(self, prefix):
+        """Keys of the objects under a prefix."""
+        base = self.root / prefix
+        return {
+            path.relative_to(self.root).as_posix()
+            for path in base.rglob('*')
+            if path.is_file() and not path.name.endswith('.tmp')
+        }
+
+    def exists(self, key):
+        return (self.root / key).is_file()
+
+    def get(self, key):
+        with open(str(self.root / key), 'rb') as f:
+            return f.read()
+
+    def put(self, key, data):
+        with atomic_write(self.root / key) as f:
+            f.write(data)
+
+
+class S3Remote:
+    """Remote in an S3 bucket or an S3 compatible server (e.g. MinIO).
+
+    Uses botocore (installed with awscli) and the usual AWS credentials
+    (environment, ~/.aws or the profile).
+
+    Parameters
+    ----------
+    url : str
+        s3://bucket/prefix
+    endpoint_url : str
+        URL of an S3 compatible server, defaults to AWS (or to the
+        AWS_ENDPOINT_URL environment variable).
+    profile : str
+        AWS profile.
+
+    """
+    def __init__(self, url, endpoint_url=None, profile=None):
+        import botocore.session
+
+        bucket, _, prefix = url[len('s3://'):].partition('/')
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        session = botocore.session.Session(profile=profile)
+        self.client = session.create_client(
+            's3', endpoint_url=endpoint_url or os.environ.get(
+                'AWS_ENDPOINT_URL'))
+
+    def keys(self, prefix):
+        keys = set()
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket,
+                                       Prefix=self.prefix + prefix):
+            for item in page.get('Contents', []):
+                keys.add(item['Key'][len(self.prefix):])
+        return keys
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except ClientError as error:
+            if error.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return False
+            raise
+        return True
+
+    def get(self, key):
+        response = self.client.get_object(Bucket=self.bucket,
+                                          Key=self.prefix + key)
+        return response['Body'].read()
+
+    def put(self, key, data):
+        self.client.put_object(Bucket=self.bucket,
+                               Key=self.prefix + key,
+                               Body=data)
+
+
+def get_remote(url, endpoint_url=None, profile=None):
+    """Remote of a url: s3://bucket/prefix or a local directory."""
+    if str(url).startswith('s3://'):
+        return S3Remote(str(url), endpoint_url, profile)
+    if str(url).startswith('file://'):
+        url = str(url)[len('file://'):]
+    return LocalRemote(url)
+
+
+def _relative(path):
+    path = Path(path).resolve()
+    try:
+        return path.relative_to(PROJECT_DIR).as_posix()
+    except ValueError:
+        raise ValueError('{} is not in the project directory'.format(path))
+
+
+def commit(experiment, paths, store_path=STORE_PATH):
+    """Add files to the store and write the manifest of an experiment.
+
+    Every file is split in content defined chunks, stored once (zlib
+    compressed) under their sha256, so identical files and identical
+    parts of files (e.g. the same log in two experiments, or a csv file
+    with appended rows) are stored and transferred once.
+
+    Parameters
+    ----------
+    experiment : str
+        Name of the experiment (e.g. experiment_0).
+    paths : list
+        Files and directories (added recursively) in the project.
+    store_path : str
+        Directory of the store.
+
+    Returns
+    -------
+    dict
+        The manifest and the number of new chunks and of new bytes
+        (compressed) in the store.
+
+    """
+    store = LocalRemote(store_path)
+    files, new_chunks, new_bytes = {}, 0, 0
+    for path in paths:
+        path = Path(path)
+        items = sorted(p for p in path.rglob('*')
+                       if p.is_file()) if path.is_dir() else [path]
+        for item in items:
+            with open(str(item), 'rb') as f:
+                data = f.read()
+            chunks, start = [], 0
+            for end in chunk_boundaries(data):
+                chunk = data[start:end]
+                digest = _sha256(chunk)
+                if not store.exists(chunk_key(digest)):
+                    compressed = zlib.compress(chunk, 6)
+                    store.put(chunk_key(digest), compressed)
+                    new_chunks += 1
+                    new_bytes += len(compressed)
+                chunks.append(digest)
+                start = end
+            files[_relative(item)] = {
+                'size': len(data),
+                'sha256': _sha256(data),
+                'chunks': chunks
+            }
+
+    manifest = {'experiment': experiment, 'created': time.time(),
+                'files': files}
+    store.put(manifest_key(experiment),
+              json.dumps(manifest, indent=1, sort_keys=True).encode())
+
+    return {
+        'manifest': manifest,
+        'new_chunks': new_chunks,
+        'new_bytes': new_bytes
+    }
+
+
+def read_manifest(experiment, store_path=STORE_PATH):
+    """Manifest of an experiment in the store."""
+    store = LocalRemote(store_path)
+    if not store.exists(manifest_key(experiment)):
+        raise FileNotFoundError('No experiment {} in {}, commit or pull it'.
+                                format(experiment, store_path))
+    return json.loads(store.get(manifest_key(experiment)).decode())
+
+
+def experiments(store_path=STORE_PATH):
+    """Names of the experiments in the store."""
+    return sorted(
+        Path(key).stem
+        for key in LocalRemote(store_path).keys(MANIFESTS))
+
+
+def checkout(experiment, store_path=STORE_PATH, force=False):
+    """Write the files of an experiment from the store.
+
+    Parameters
+    ----------
+    experiment : str
+        Name of the experiment.
+    store_path : str
+        Directory of the store.
+    force : bool
+        Overwrite files whose content differs from the manifest (they are
+        skipped otherwise).
+
+    Returns
+    -------
+    dict
+        The paths of the written, unchanged and skipped (modified) files.
+
+    """
+    store = LocalRemote(store_path)
+    status = {'written': [], 'unchanged': [], 'skipped': []}
+    for name, entry in read_manifest(experiment, store_path)['files'].items():
+        path = PROJECT_DIR / name
+        if path.is_file():
+            with open(str(path), 'rb') as f:
+                digest = _sha256(f.read())
+            if digest == entry['sha256']:
+                status['unchanged'].append(name)
+                continue
+            if not force:
+                status['skipped'].append(name)
+                continue
+        data = b''.join(
+            zlib.decompress(store.get(chunk_key(digest)))
+            for digest in entry['chunks'])
+        if _sha256(data) != entry['sha256']:
+            raise ValueError('Corrupted chunks in the store for {}'.format(
+                name))
+        with atomic_write(path) as f:
+            f.write(data)
+        status['written'].append(name)
+
+    return status
+
+
+def push(experiment, remote, store_path=STORE_PATH):
+    """Upload an experiment, only the chunks the remote does not have.
+
+    The manifest is uploaded last, so a remote manifest never refers to a
+    missing chunk even if the push is interrupted.
+
+    Parameters
+    ----------
+    experiment : str
+        Name of the experiment.
+    remote : LocalRemote or S3Remote
+        The remote (see get_remote).
+    store_path : str
+        Directory of the store.
+
+    Returns
+    -------
+    dict
+        The number of uploaded chunks and bytes.
+
+    """
+    store = LocalRemote(store_path)
+    manifest = read_manifest(experiment, store_path)
+    known = remote.keys(CHUNKS)
+    uploaded, size = 0, 0
+    for digest in {d for entry in manifest['files'].values()
+                   for d in entry['chunks']}:
+        key = chunk_key(digest)
+        if key in known:
+            continue
+        data = store.get(key)
+        remote.put(key, data)
+        uploaded += 1
+        size += len(data)
+    remote.put(manifest_key(experiment), store.get(manifest_key(experiment)))
+
+    return {'chunks': uploaded, 'bytes': size}
+
+
+def pull(experiment, remote, store_path=STORE_PATH):
+    """Download an experiment, only the chunks the store does not have.
+
+    Parameters
+    ----------
+    experiment : str
+        Name of the experiment.
+    remote : LocalRemote or S3Remote
+        The remote (see get_remote).
+    store_path : str
+        Directory of the store.
+
+    Returns
+    -------
+    dict
+        The number of downloaded chunks and bytes.
+
+    """
+    store = LocalRemote(store_path)
+    data = remote.get(manifest_key(experiment))
+    manifest = json.loads(data.decode())
+    downloaded, size = 0, 0
+    for digest in {d for entry in manifest['files'].values()
+                   for d in entry['chunks']}:
+        key = chunk_key(digest)
+        if store.exists(key):
+            continue
+        chunk = remote.get(key)
+        if _sha256(zlib.decompress(chunk)) != digest:
+            raise ValueError('Corrupted chunk {} on the remote'.format(digest))
+        store.put(key, chunk)
+        downloaded += 1
+        size += len(chunk)
+    # The manifest is written once all its chunks are in the store
+    store.put(manifest_key(experiment), data)
+
+    return {'chunks': downloaded, 'bytes': size}
@@ -0,0 +1,184 @@
+import hashlib
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from utils import atomic_write, read_columns, save_columns
+
+INTERIM_PATH = Path(__file__).parents[2] / 'data/interim'
+
+
+def file_hash(path):
+    """sha1 of the content of a file."""
+    key = hashlib.sha1()
+    with open(str(path), 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            key.update(chunk)
+    return key.hexdigest()
+
+
+def parse_time(values):
+    """Convert a time column to float seconds.
+
+    Numeric columns are kept as they are. Timestamps logged by the robot
+    as H:M:S:microseconds are converted to the seconds since the first
+    sample.
+
+    Parameters
+    ----------
+    values : series
+        The time column of the csv file.
+
+    Returns
+    -------
+    array
+        The time in seconds.
+
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return values.values.astype(float)
+    parts = values.astype(str).str.split(':', expand=True).astype(float)
+    seconds = (parts[0] * 3600 + parts[1] * 60 + parts[2] +
+               parts[3] * 1e-6).values
+
+    return seconds - seconds[0]
+
+
+def convert_csv(read_path):
+    """Read an experiment csv file with a float time column in seconds.
+
+    Parameters
+    ----------
+    read_path : str
+        Path of the csv file.
+
+    Returns
+    -------
+    dataframe
+        The numeric columns as int64/float64, the others as str and a
+        'time' column replacing the 'time' or 'Time' column.
+
+    """
+    df = pd.read_csv(str(read_path))
+    for column in ['time', 'Time']:
+        if column in df.columns:
+            df['time'] = parse_time(df[column])
+            if column != 'time':
+                df.drop(columns=column, inplace=True)
+            break
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].astype(str)
+
+    return df
+
+
+def _cache_file(read_path, cache_path):
+    """Cache file of a csv file, unique for its absolute path."""
+    read_path = Path(read_path).resolve()
+    suffix = hashlib.sha1(str(read_path).encode()).hexdigest()[:8]
+    return Path(cache_path) / '{}-{}.npz'.format(read_path.stem, suffix)
+
+
+def _read_entry(cache_file):
+    """Sidecar of a cache file: mtime, size and sha1 of its csv file.
+
+    Every cache file has its own sidecar (written after it), so processes
+    ingesting different files never write the same file.
+    """
+    sidecar = cache_file.with_suffix('.json')
+    if not (sidecar.is_file() and cache_file.is_file()):
+        return {}
+    with open(str(sidecar)) as f:
+        return json.load(f)
+
+
+def _write_entry(cache_file, entry):
+    with atomic_write(cache_file.with_suffix('.json'), 'w') as f:
+        json.dump(entry, f, indent=1, sort_keys=True)
+
+
+def ingest(read_paths, cache_path=INTERIM_PATH):
+    """Convert new or changed experiment csv files to the columnar cache.
+
+    A file is skipped when its mtime and size match the sidecar of its
+    cache file. When they do not, it is only converted again if its
+    content hash changed.
+
+    Parameters
+    ----------
+    read_paths : list
+        csv files or directories (searched recursively for csv files).
+    cache_path : str
+        Directory of the cache files and their sidecars.
+
+    Returns
+    -------
+    dict
+        Number of converted, touched (same content) and unchanged files.
+
+    """
+    cache_path = Path(cache_path)
+    cache_path.mkdir(parents=True, exist_ok=True)
+    files = []
+    for read_path in read_paths:
+        read_path = Path(read_path)
+        if read_path.is_dir():
+            files.extend(sorted(read_path.rglob('*.csv')))
+        else:
+            files.append(read_path)
+
+    counts = {'converted': 0, 'touched': 0, 'unchanged': 0}
+    for read_path in files:
+        stat = read_path.stat()
+        cache_file = _cache_file(read_path, cache_path)
+        entry = _read_entry(cache_file)
+        if (entry.get('mtime') == stat.st_mtime
+                and entry.get('size') == stat.st_size):
+            counts['unchanged'] += 1
+            continue
+
+        sha1 = file_hash(read_path)
+        if entry.get('sha1') == sha1:
+            counts['touched'] += 1
+        else:
+            save_columns(cache_file, convert_csv(read_path))
+            counts['converted'] += 1
+        _write_entry(cache_file, {
+            'source': str(read_path.resolve()),
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'sha1': sha1
+        })
+
+    return counts
+
+
+def read_experiment(read_path, columns=None, cache_path=INTERIM_PATH):
+    """Read an experiment csv file through the columnar cache.
+
+    Parameters
+    ----------
+    read_path : str
+        Path of the csv file.
+    columns : list
+        Columns to read, all of them if None.
+    cache_path : str
+        Directory of the cache.
+
+    Returns
+    -------
+    dataframe
+        The converted csv file (see convert_csv).
+
+    """
+    read_path = Path(read_path)
+    stat = read_path.stat()
+    cache_file = _cache_file(read_path, cache_path)
+    entry = _read_entry(cache_file)
+    if (entry.get('mtime') != stat.st_mtime
+            or entry.get('size') != stat.st_size):
+        ingest([read_path], cache_path)
+
+    return read_columns(cache_file, columns)
@@ -0,0 +1,376 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pyo
+import yaml
+
+from . import car_maneuver, hammering, lean
+from .optimize import (BUDGET_EXCEEDED, SOLVERS, budget_exceeded,
+                       run_optimization)
+from .warmstart import job_parameters, get_library
+
+# Model builders which can be selected from a job specification
+BUILDERS = {
+    'dynamic': hammering.dynamic_motion_model,
+    'trajectory': hammering.dynamic_motion_model_with_trajectory,
+    'flat': hammering.differential_flat_model,
+    'car': car_maneuver.motion_model,
+    # Discretized while it is built (BACKWARD scheme only)
+    'lean': lean.lean_motion_model,
+}
+
+DEFAULT_JOB = {
+    'builder': 'dynamic',
+    'stiffness': 'variable_stiffness',
+    'nfe': 500,
+    'scheme': 'BACKWARD',
+    'solver': 'ipopt',
+}
+
+
+def make_job(**kwargs):
+    """Create a job specification filling in the default values.
+
+    Parameters
+    ----------
+    **kwargs : dict
+        Any of builder, stiffness, tf, nfe, scheme, solver and model_name,
+        final_state for the car builder and overrides, a dictionary of
+        configuration entries changed for this job only.
+
+    Returns
+    -------
+    dict
+        A complete job specification.
+
+    """
+    job = dict(DEFAULT_JOB)
+    job.update({key: value for key, value in kwargs.items()
+                if value is not None})
+    if 'tf' not in job:
+        raise ValueError('The job specification needs a final time tf')
+    if job['builder'] not in BUILDERS:
+        raise ValueError('Unknown builder {}, expected one of {}'.format(
+            job['builder'], sorted(BUILDERS)))
+    if job['solver'] not in SOLVERS:
+        raise ValueError('Unknown solver {}, expected one of {}'.format(
+            job['solver'], SOLVERS))
+    if job['builder'] == 'lean' and job['scheme'] != 'BACKWARD':
+        raise ValueError('The lean builder only supports the BACKWARD scheme')
+    if job['builder'] == 'lean' and job['solver'] == 'cyipopt':
+        # PyNumero only builds NLPs of pyomo.environ models
+        raise ValueError('The lean builder only supports the ipopt solver')
+    job['tf'] = float(job['tf'])
+    job['nfe'] = int(job['nfe'])
+    if job['builder'] == 'car':
+        job.setdefault('model_name', 'car_maneuver')
+    else:
+        job.setdefault('model_name', job['stiffness'])
+
+    return job
+
+
+def read_job_file(path):
+    """Read a batch of jobs from a yaml file.
+
+    The file is either a list of jobs or a dictionary with a 'jobs' list
+    and optional 'defaults' shared by all the jobs e.g.
+
+    defaults: {builder: dynamic, nfe: 500}
+    jobs:
+      - {stiffness: low_stiffness, tf: 2.0}
+      - {stiffness: high_stiffness, tf: 2.0}
+
+    Parameters
+    ----------
+    path : str
+        Path to the job file.
+
+    Returns
+    -------
+    list
+        A list of complete job specifications.
+
+    """
+    with open(str(path)) as f:
+        content = yaml.load(f, Loader=yaml.SafeLoader)
+
+    if isinstance(content, list):
+        defaults, jobs = {}, content
+    else:
+        defaults, jobs = content.get('defaults', {}), content['jobs']
+
+    return [make_job(**{**defaults, **job}) for job in jobs]
+
+
+def build_model(job, config):
+    """Build the pyomo model described by the job.
+
+    Parameters
+    ----------
+    job : dict
+        Job specification.
+    config : yaml
+        The configuration file for the simulation
+
+    Returns
+    -------
+    m
+        A pyomo model (not yet discretized, except for the lean builder).
+
+    """
+    if job['builder'] == 'car':
+        return car_maneuver.motion_model(job['tf'], config,
+                                         job.get('final_state'))
+    if job['builder'] == 'lean':
+        return lean.lean_motion_model(job['tf'], job['stiffness'], config,
+                                      job['nfe'])
+    builder = BUILDERS[job['builder']]
+    return builder(job['tf'], job['stiffness'], config)
+
+
+def initial_point(job, config, initial_values=None):
+    """Parameters of a job and the initial point of its solve.
+
+    Parameters
+    ----------
+    job : dict
+        Job specification.
+    config : yaml
+        The configuration file for the simulation
+    initial_values : dataframe
+        Optimal values of a similar problem, used if given. Otherwise the
+        closest solutions of config['warm_start_library'] (if it exists).
+
+    Returns
+    -------
+    dict, dataframe
+        The parameters (None for the car builder) and the initial values
+        (None to start from the initial point of the builder).
+
+    """
+    parameters = None
+    if job['builder'] != 'car':
+        parameters = job_parameters(job, config)
+        library_path = config.get('warm_start_library')
+        if initial_values is None and library_path:
+            library_path = Path(__file__).parents[2] / library_path
+            if library_path.is_dir():
+                library = get_library(library_path)
+                initial_values = library.initial_values(parameters)
+
+    return parameters, initial_values
+
+
+def solve_job(job, config, initial_values=None):
+    """Build and solve the model described by the job.
+
+    Parameters
+    ----------
+    job : dict
+        Job specification.
+    config : yaml
+        The configuration file for the simulation
+    initial_values : dataframe
+        Optimal values of a similar problem used as the initial point. If
+        None and config['warm_start_library'] exists, the closest stored
+        solutions are used.
+
+    Returns
+    -------
+    dict
+        The model log with the objective, optimal values, solver status
+        and solve time. The status is 'budget_exceeded' if the solve was
+        stopped by the time_limit (s) or max_iter budget of the config.
+
+    """
+    parameters, initial_values = initial_point(job, config, initial_values)
+    config = {**config, **job.get('overrides', {})}
+    budget = {
+        'time_limit': config.get('time_limit'),
+        'max_iter': config.get('max_iter')
+    }
+    start = time.perf_counter()
+    if job['builder'] == 'lean':
+        m, optimal_values, solution = lean.run_lean_optimization(
+            job['tf'], job['stiffness'], config, job['nfe'], initial_values,
+            job['solver'], **budget)
+    else:
+        m = build_model(job, config)
+        m, optimal_values, solution = run_optimization(
+            m,
+            job['nfe'],
+            scheme=job['scheme'],
+            initial_values=initial_values,
+            solver=job['solver'],
+            **budget)
+
+    output = {}
+    # No objective value if the solver was killed before returning a point
+    objective = pyo.value(m.obj, exception=False)
+    output['obj_values'] = np.nan if objective is None else objective
+    output['optimal_values'] = optimal_values
+    output['solver_status'] = solution.solver.termination_condition
+    if budget_exceeded(solution, **budget):
+        output['solver_status'] = BUDGET_EXCEEDED
+    output['solve_time'] = time.perf_counter() - start
+    output['model_name'] = job['model_name']
+    output['job'] = job
+    if parameters is not None:
+        output['parameters'] = parameters
+
+    return output
+
+
+def _solve_job(args):
+    return solve_job(*args)
+
+
+def run_jobs(jobs, config, n_jobs=1, history=None):
+    """Solve a list of jobs, in parallel if n_jobs > 1.
+
+    Parallel jobs are dispatched longest first (see schedule.plan), so a
+    long job does not start last and keep one worker busy alone.
+
+    Parameters
+    ----------
+    jobs : list
+        A list of job specifications.
+    config : yaml
+        The configuration file for the simulation
+    n_jobs : int
+        Number of worker processes.
+    history : dataframe
+        Solve times of the result store (see schedule.read_history).
+
+    Returns
+    -------
+    list
+        The model logs in the same order as the jobs.
+
+    """
+    if n_jobs <= 1 or len(jobs) <= 1:
+        return [solve_job(job, config) for job in jobs]
+
+    from .schedule import dispatch_order
+
+    order = dispatch_order(jobs, config, history)
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(jobs))) as pool:
+        outputs = pool.map(_solve_job, [(jobs[i], config) for i in order])
+        outputs = dict(zip(order, outputs))
+
+    return [outputs[i] for i in range(len(jobs))]
+
+
+def scenario_vector(job):
+    """Parameter vector of a job used to find similar scenarios.
+
+    Parameters
+    ----------
+    job : dict
+        Job specification.
+
+    Returns
+    -------
+    array
+        The final time followed by the final state values (sorted by name).
+
+    """
+    final_state = job.get('final_state') or {}
+    return np.array([job['tf']] +
+                    [final_state[key] for key in sorted(final_state)],
+                    dtype=float)
+
+
+def solve_scenarios(jobs, config, n_jobs=1, save_path=None):
+    """Solve many scenarios, seeding each from the nearest solved one.
+
+    The scenarios closest to an already solved scenario are dispatched
+    first and use its optimal values as the initial point, the first
+    n_jobs scenarios (spread over the parameter range) start cold.
+
+    Parameters
+    ----------
+    jobs : list
+        A list of job specifications (all of them with the same keys in
+        final_state).
+    config : yaml
+        The configuration file for the simulation
+    n_jobs : int
+        Number of worker processes.
+    save_path : str
+        If given, the states and controls of all the scenarios are saved
+        to this columnar (.npz) file.
+
+    Returns
+    -------
+    list, dataframe
+        The model logs in the same order as the jobs and the long format
+        dataframe of all the scenarios.
+
+    """
+    from utils import save_columns
+
+    vectors = np.array([scenario_vector(job) for job in jobs])
+    scale = vectors.std(axis=0)
+    vectors = vectors / np.where(scale > 0, scale, 1.0)
+
+    n_workers = max(min(n_jobs, len(jobs)), 1)
+    order = np.lexsort(vectors.T[::-1])
+    seeds = order[np.linspace(0, len(jobs) - 1, n_workers).astype(int)]
+
+    pending = np.ones(len(jobs), dtype=bool)
+    nearest = np.full(len(jobs), -1)
+    distance = np.full(len(jobs), np.inf)
+    outputs = [None] * len(jobs)
+
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        running = {}
+
+        def submit(index):
+            pending[index] = False
+            seed = nearest[index]
+            initial_values = None
+            if seed >= 0:
+                initial_values = outputs[seed]['optimal_values']
+            future = pool.submit(solve_job, jobs[index], config,
+                                 initial_values)
+            running[future] = index
+
+        for index in np.unique(seeds):
+            submit(index)
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)
+                outputs[index] = future.result()
+
+                # Update the nearest solved scenario of the pending ones
+                d = np.linalg.norm(vectors - vectors[index], axis=1)
+                closer = pending & (d < distance)
+                distance[closer] = d[closer]
+                nearest[closer] = index
+
+                if pending.any():
+                    candidates = np.where(pending, distance, np.inf)
+                    submit(int(np.argmin(candidates)))
+
+    frames = []
+    for index, (job, output) in enumerate(zip(jobs, outputs)):
+        df = output['optimal_values'].apply(pd.to_numeric, errors='coerce')
+        df.insert(0, 'scenario', index)
+        df['tf'] = job['tf']
+        for key, value in (job.get('final_state') or {}).items():
+            df[key + '_final'] = value
+        df['optimal'] = str(output['solver_status']) == 'optimal'
+        frames.append(df)
+    scenarios = pd.concat(frames, ignore_index=True, sort=False)
+
+    if save_path is not None:
+        save_columns(save_path, scenarios)
+
+    return outputs, scenarios
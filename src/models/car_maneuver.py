@@ -2,7 +2,7 @@ import pyomo.environ as pyo
 import pyomo.dae as pyod
 
 
-def motion_model(tf):
+def motion_model(tf, config, final_state=None):
     """Motion model for car maneuvering task from given intial
         conditions to final conditions.
 
@@ -10,6 +10,10 @@ def motion_model(tf):
     ----------
     tf : float
         Final time of the maneuvering.
+    config : yaml
+        The configuration file for the simulation
+    final_state : dict
+        Final values overriding config['car_final_state'] e.g. {'y': 15}
 
     Returns
     -------
@@ -23,11 +27,11 @@ def motion_model(tf):
 
     # Append dependent variables
     dependent_variables = {
-        'x': (0, None),
-        'y': (0, None),
+        'x': (config['car_x_min'], config['car_x_max']),
+        'y': (config['car_y_min'], config['car_y_max']),
         't': (None, None),
         'u': (None, None),
-        'p': (-0.5, 0.5)
+        'p': (config['car_p_min'], config['car_p_max'])
     }
     for key, value in dependent_variables.items():
         m.add_component(key, pyo.Var(m.time, bounds=value))
@@ -45,12 +49,15 @@ def motion_model(tf):
                         pyod.DerivativeVar(var, wrt=m.time))
 
     # Append control variables
-    control_inputs = {'a': (None, None), 'v': (-0.1, 0.1)}
+    control_inputs = {
+        'a': (None, None),
+        'v': (config['car_v_min'], config['car_v_max'])
+    }
     for key, value in control_inputs.items():
         m.add_component(key, pyo.Var(m.time, bounds=value))
 
     # Append differential equations as constraints
-    L = 2
+    L = config['car_wheelbase']
     m.ode_x = pyo.Constraint(
         m.time,
         rule=lambda m, time: m.dxdt[time] == m.u[time] * pyo.cos(m.t[time]))
@@ -67,12 +74,13 @@ def motion_model(tf):
 
     # Add final and initial values
     m.ic = pyo.ConstraintList()
-    intial_condition = {'x': 0, 'y': 0, 't': 0, 'u': 0, 'p': 0, 'a': 0, 'v': 0}
+    intial_condition = config['car_initial_state']
     for i, var in enumerate(m.component_objects(pyo.Var, active=True)):
         m.ic.add(var[0] == intial_condition[str(var)])
 
     m.fc = pyo.ConstraintList()
-    final_condition = {'x': 0, 'y': 20, 't': 0, 'u': 0, 'p': 0, 'a': 0, 'v': 0}
+    final_condition = dict(config['car_final_state'])
+    final_condition.update(final_state or {})
     for i, var in enumerate(m.component_objects(pyo.Var, active=True)):
         m.fc.add(var[tf] == final_condition[str(var)])
 
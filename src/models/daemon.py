@@ -0,0 +1,331 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+import struct
+import time
+
+import numpy as np
+
+# Request: length of the json job specification, then the specification
+REQUEST = struct.Struct('<I')
+# Response: magic, length of the json metadata and of the array data
+RESPONSE = struct.Struct('<4sII')
+MAGIC = b'DMSD'
+# Configuration entries a template takes as (mutable) parameters
+TEMPLATE_OVERRIDES = {'h_mass', 'path_length', 'w_min', 'w_max'}
+
+# Per worker process state, set by _init_worker
+_CONFIG = None
+_TEMPLATES = {}  # (stiffness, nfe, scheme) -> discretized scaled model
+
+
+def encode_result(output, **meta):
+    """Encode a model log as json metadata and a float64 array block.
+
+    Parameters
+    ----------
+    output : dict
+        Model log (e.g. from batch.solve_job) or {'error': message}.
+    **meta : dict
+        Extra metadata (e.g. timings).
+
+    Returns
+    -------
+    bytes
+        The response header, metadata and the optimal values as one
+        little endian float64 (n_rows, n_columns) array.
+
+    """
+    data = b''
+    meta = dict(meta)
+    if 'optimal_values' in output:
+        df = output['optimal_values'].astype(float)
+        data = np.ascontiguousarray(df.values, dtype='<f8').tobytes()
+        meta.update({
+            'columns': [str(column) for column in df.columns],
+            'n_rows': len(df),
+            'obj_values': float(output['obj_values']),
+            'solver_status': str(output['solver_status']),
+            'model_name': output['model_name']
+        })
+    if 'error' in output:
+        meta['error'] = output['error']
+    meta = json.dumps(meta).encode()
+    return RESPONSE.pack(MAGIC, len(meta), len(data)) + meta + data
+
+
+def decode_result(meta, data):
+    """Metadata and optimal values (dataframe) of an encoded result."""
+    import pandas as pd
+
+    meta = json.loads(meta.decode())
+    if 'columns' in meta:
+        values = np.frombuffer(data, dtype='<f8').reshape(
+            meta['n_rows'], len(meta['columns']))
+        meta['optimal_values'] = pd.DataFrame(values,
+                                              columns=meta['columns'])
+    return meta
+
+
+def _template_key(job):
+    """Template of a job, None if it has to be built from scratch."""
+    if job['builder'] != 'dynamic':
+        return None
+    if not set(job.get('overrides', {})) <= TEMPLATE_OVERRIDES:
+        return None
+    return job['stiffness'], job['nfe'], job['scheme']
+
+
+def _template(key):
+    import pyomo.environ as pyo
+    from .hammering import scaled_motion_model
+
+    if key not in _TEMPLATES:
+        stiffness, nfe, scheme = key
+        m = scaled_motion_model(1.0, stiffness, _CONFIG)
+        pyo.TransformationFactory('dae.finite_difference').apply_to(
+            m, nfe=nfe, wrt=m.time, scheme=scheme)
+        _TEMPLATES[key] = m
+    return _TEMPLATES[key]
+
+
+def _init_worker(config, prebuild):
+    """Load the modules and configuration and build the templates."""
+    from . import batch, mpc, optimize  # noqa: F401
+
+    # Interrupts (e.g. ctrl-c on the process group) stop the parent only
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    global _CONFIG
+    _CONFIG = config
+    for key in prebuild:
+        _template(tuple(key))
+
+
+def _worker_pid():
+    time.sleep(0.05)
+    return os.getpid()
+
+
+def solve_template(job, config):
+    """Solve a dynamic job by re-solving a pre-built scaled model.
+
+    The scaled model over the normalised time is the same NLP as the
+    discretized dynamic model, with the final time and the physical
+    parameters as mutable parameters. It is built once per stiffness,
+    mesh and scheme and starts from the solution of the previous request.
+
+    Parameters
+    ----------
+    job : dict
+        Job specification.
+    config : yaml
+        The configuration file for the simulation
+
+    Returns
+    -------
+    dict
+        The model log (as batch.solve_job, over the absolute time).
+
+    """
+    from .mpc import scaled_profiles
+    from .optimize import (BUDGET_EXCEEDED, budget_exceeded, get_solver,
+                           solve_with_budget)
+    from .hammering import stiffness_bounds
+
+    key = _template_key(job)
+    m = _template(key)
+    config = {**config, **job.get('overrides', {})}
+    w_min, w_max = stiffness_bounds(job['stiffness'], config)
+    m.tf = job['tf']
+    m.h_mass = config['h_mass']
+    m.path_length = config['path_length']
+    m.w_min, m.w_max = w_min, w_max
+    m.x0['md'] = w_max
+    budget = {
+        'time_limit': config.get('time_limit'),
+        'max_iter': config.get('max_iter')
+    }
+    solution = solve_with_budget(get_solver(job['solver']), m, **budget)
+
+    output = {}
+    objective = m.obj(exception=False)
+    output['obj_values'] = np.nan if objective is None else objective
+    output['optimal_values'] = scaled_profiles(m)
+    output['solver_status'] = solution.solver.termination_condition
+    if budget_exceeded(solution, **budget):
+        output['solver_status'] = BUDGET_EXCEEDED
+    output['model_name'] = job['model_name']
+    output['job'] = job
+    if str(output['solver_status']) != 'optimal':
+        # Do not start the next request from a failed solution
+        del _TEMPLATES[key]
+
+    return output
+
+
+def _serve_job(job):
+    """Solve a job in a worker process, returns the encoded result."""
+    from .batch import make_job, solve_job
+
+    start = time.perf_counter()
+    try:
+        job = make_job(**job)
+        if _template_key(job) is None:
+            output = solve_job(job, _CONFIG)
+        else:
+            output = solve_template(job, _CONFIG)
+    except Exception as error:
+        output = {'error': repr(error)}
+    return encode_result(output, solve_time=time.perf_counter() - start)
+
+
+class SolverDaemon:
+    """Serve solve requests on a local Unix socket.
+
+    The worker processes keep the imports, the configuration and the
+    pre-built model templates in memory, so a request only pays for the
+    solve. Every connection sends any number of length prefixed json job
+    specifications and receives one binary result per request (see
+    encode_result). At most max_pending requests are queued or running,
+    further requests are answered with a busy error.
+
+    Parameters
+    ----------
+    config : yaml
+        The configuration file for the simulation
+    n_workers : int
+        Number of worker processes.
+    max_pending : int
+        Maximum number of queued and running requests.
+    prebuild : list
+        Template keys (stiffness, nfe, scheme) built when a worker starts.
+
+    """
+    def __init__(self, config, n_workers=2, max_pending=64, prebuild=()):
+        self.config = config
+        self.n_workers = n_workers
+        self.max_pending = max_pending
+        self.prebuild = [tuple(key) for key in prebuild]
+        self.pending = 0
+        self.served = 0
+        self.pool = None
+        self.server = None
+
+    async def start(self, path):
+        """Start the workers and listen on the socket path."""
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.pool = ProcessPoolExecutor(self.n_workers,
+                                        initializer=_init_worker,
+                                        initargs=(self.config, self.prebuild))
+        # Wait until every worker has answered (so it is initialised)
+        loop = asyncio.get_event_loop()
+        pids = set()
+        while len(pids) < self.n_workers:
+            pids.update(await asyncio.gather(*[
+                loop.run_in_executor(self.pool, _worker_pid)
+                for i in range(self.n_workers)
+            ]))
+        self.server = await asyncio.start_unix_server(self._handle, path)
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                header = await reader.readexactly(REQUEST.size)
+                job = json.loads(
+                    (await reader.readexactly(
+                        REQUEST.unpack(header)[0])).decode())
+                if self.pending >= self.max_pending:
+                    writer.write(encode_result({'error': 'busy'}))
+                    continue
+                self.pending += 1
+                try:
+                    result = await loop.run_in_executor(
+                        self.pool, _serve_job, job)
+                finally:
+                    self.pending -= 1
+                self.served += 1
+                writer.write(result)
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass  # the client closed the connection
+        finally:
+            writer.close()
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.pool.shutdown()
+
+
+def serve(config, path, n_workers=2, max_pending=64, prebuild=()):
+    """Run a SolverDaemon until interrupted."""
+    if os.path.exists(path):
+        os.remove(path)
+    daemon = SolverDaemon(config, n_workers, max_pending, prebuild)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(daemon.start(path))
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(daemon.stop())
+        loop.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+    return daemon.served
+
+
+def _read_exactly(connection, n):
+    chunks = []
+    while n:
+        chunk = connection.recv(min(n, 1 << 20))
+        if not chunk:
+            raise ConnectionError('The daemon closed the connection')
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b''.join(chunks)
+
+
+def solve_remote(jobs, path):
+    """Solve jobs with a running daemon.
+
+    Parameters
+    ----------
+    jobs : list
+        Job specifications (as for batch.make_job).
+    path : str
+        Socket path of the daemon.
+
+    Returns
+    -------
+    list
+        The decoded results (metadata with the optimal values dataframe
+        and the round trip time) in the order of the jobs.
+
+    """
+    results = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(str(path))
+        for job in jobs:
+            start = time.perf_counter()
+            request = json.dumps(job, default=str).encode()
+            connection.sendall(REQUEST.pack(len(request)) + request)
+            magic, meta_size, data_size = RESPONSE.unpack(
+                _read_exactly(connection, RESPONSE.size))
+            if magic != MAGIC:
+                raise ValueError('Not a solver daemon response')
+            meta = _read_exactly(connection, meta_size)
+            data = _read_exactly(connection, data_size)
+            round_trip = time.perf_counter() - start
+            result = decode_result(meta, data)
+            result['round_trip'] = round_trip
+            results.append(result)
+
+    return results
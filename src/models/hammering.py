@@ -1,5 +1,4 @@
 import numpy as np
-from scipy.special import erf
 from pathlib import Path
 import yaml
 
@@ -18,6 +17,8 @@ def skew_normal_trajectory(m, t):
     t : pyomo time
         A pyomo time model.
     """
+    from scipy.special import erf
+
     # The configuration file
     config_path = Path(__file__).parents[2] / 'src/config.yml'
     config = yaml.load(open(str(config_path)), Loader=yaml.SafeLoader)
@@ -31,6 +32,16 @@ def skew_normal_trajectory(m, t):
     return m.bd[t] == (config['A'] * phi * Phi)
 
 
+def stiffness_bounds(stiffness, config):
+    """Magnet separation bounds (w_min, w_max) of a stiffness mode."""
+    if stiffness == 'low_stiffness':
+        return config['w_max'], config['w_max']
+    elif stiffness == 'high_stiffness':
+        return config['w_min'], config['w_min']
+    else:
+        return config['w_min'], config['w_max']
+
+
 def dynamic_motion_model(tf, stiffness, config):
     """Motion model for hammer task from given intial conditions
     to final conditions.
@@ -399,3 +410,119 @@ def differential_flat_model(tf, stiffness, config):
                           sense=pyo.maximize)
 
     return m
+
+
+def scaled_motion_model(tf, stiffness, config):
+    """Motion model for hammer task over the normalised time t / tf.
+
+    The final time, the initial state and the physical parameters are
+    mutable parameters, so a discretized instance can be re-solved for a
+    different horizon or initial state without building it again (e.g.
+    receding horizon control). The derivatives are with respect to the
+    normalised time, hence the ode's are scaled by m.tf.
+
+    Parameters
+    ----------
+    tf : float
+        Final time of the maneuvering.
+    stiffness : str
+        Stiffness of springs used for simulation
+    config : yaml
+        The configuration file for the simulation
+
+    Returns
+    -------
+    m
+        A pyomo model with all the variables and constraints described.
+
+    """
+
+    m = pyo.ConcreteModel()
+    m.time = pyod.ContinuousSet(bounds=(0, 1))  # normalised time t / tf
+
+    # Parameters
+    w = 0.03
+    w_min, w_max = stiffness_bounds(stiffness, config)
+
+    m.tf = pyo.Param(initialize=tf, mutable=True)
+    m.h_mass = pyo.Param(initialize=config['h_mass'], mutable=True)
+    m.path_length = pyo.Param(initialize=config['path_length'], mutable=True)
+    m.w_min = pyo.Param(initialize=w_min, mutable=True)
+    m.w_max = pyo.Param(initialize=w_max, mutable=True)
+
+    # Initial state
+    states = ['bd', 'bv', 'hd', 'hv', 'md']
+    initial_condition = {
+        'bd': 0.0,
+        'bv': 0.0,
+        'hd': 0.0,
+        'hv': 0.0,
+        'md': w_max
+    }
+    m.x0 = pyo.Param(states, initialize=initial_condition, mutable=True)
+
+    # Append states and controls
+    if stiffness == 'variable_stiffness':
+        mv_bounds = (-0.15, 0.15)
+    else:
+        mv_bounds = (0.0, 0.0)
+    variables = {
+        'bd': (config['bd_min'], config['bd_max']),
+        'bv': (config['bv_min'], config['bv_max']),
+        'hd': (None, None),
+        'hv': (None, None),
+        'md': (None, None),
+        'ba': (config['ba_min'], config['ba_max']),
+        'ha': (None, None),
+        'mv': mv_bounds,
+    }
+    for key, value in variables.items():
+        m.add_component(key, pyo.Var(m.time, bounds=value))
+
+    # Append derivatives (with respect to the normalised time)
+    derivatives = {'bd': 'bv', 'bv': 'ba', 'hd': 'hv', 'hv': 'ha', 'md': 'mv'}
+    for key, rate in derivatives.items():
+        dvar = pyod.DerivativeVar(m.component(key), wrt=m.time)
+        m.add_component('d' + key, dvar)
+        m.add_component(
+            'ode_' + key,
+            pyo.Constraint(m.time,
+                           rule=lambda m, t, key=key, rate=rate: m.component(
+                               'd' + key)[t] == m.tf * m.component(rate)[t]))
+
+    # Hammer movement dynamics
+    def hammer_acceleration(m, t):
+        c1, c2 = 28.41, 206.35
+        temp = +m.ba[t] * m.h_mass + 2 * c1 * pyo.exp(
+            -c2 * (m.md[t] - w)) * pyo.sinh(c2 * (m.hd[t])) + 1 * m.hv[t]
+        return m.ha[t] == -temp / m.h_mass
+
+    m.ode_hv_force = pyo.Constraint(m.time, rule=hammer_acceleration)
+
+    # Magnet separation bounds as constraints (so they can be changed)
+    m.md_min = pyo.Constraint(m.time,
+                              rule=lambda m, time: m.md[time] >= m.w_min)
+    m.md_max = pyo.Constraint(m.time,
+                              rule=lambda m, time: m.md[time] <= m.w_max)
+
+    # Displacement constraints (end position and hammer displacement)
+    m.disp_1 = pyo.Constraint(m.time,
+                              rule=lambda m, time: m.hd[time] <=
+                              (m.md[time] - w))
+    m.disp_2 = pyo.Constraint(
+        m.time, rule=lambda m, time: m.hd[time] >= -(m.md[time] - w))
+
+    # Initial values of the states
+    m.ic = pyo.ConstraintList()
+    for key in states:
+        m.ic.add(m.component(key)[0] == m.x0[key])
+
+    # End effector zero velocity constraint at the end
+    m.fc = pyo.ConstraintList()
+    m.fc.add(m.bv[1] == 0)
+    m.fc.add(m.bd[1] == m.path_length)
+
+    # Objective function
+    m.obj = pyo.Objective(expr=m.hv[1], sense=pyo.maximize)
+
+    return m
@@ -0,0 +1,179 @@
+import numpy as np
+import pyomo.environ as pyo
+from pyomo.opt import SolverResults, SolverStatus, TerminationCondition
+
+# cyipopt return status -> pyomo termination condition
+STATUS = {
+    0: TerminationCondition.optimal,
+    1: TerminationCondition.optimal,  # solved to acceptable level
+    2: TerminationCondition.infeasible,
+    -1: TerminationCondition.maxIterations,
+    -4: TerminationCondition.maxTimeLimit,
+}
+
+
+def _fingerprint(m):
+    """Values of the parameters and fixed variables of a model.
+
+    The NLP of a model only has to be built again when one of them
+    changed (they are constants in the .nl representation).
+    """
+    values = [
+        pyo.value(p) for p in m.component_data_objects(pyo.Param, active=True)
+    ]
+    values += [
+        v.value for v in m.component_data_objects(pyo.Var, active=True)
+        if v.fixed
+    ]
+    return tuple(values)
+
+
+def _problem(nlp, sense, structure=None):
+    """cyipopt problem of a PyNumero NLP, reusing a cached structure.
+
+    Parameters
+    ----------
+    nlp : PyomoNLP
+        The NLP.
+    sense : float
+        1 to minimise, -1 to maximise (IPOPT always minimises).
+    structure : tuple
+        Jacobian and hessian (coo matrices) of a previous NLP of the model,
+        evaluated again in place if their sparsity is the same.
+
+    """
+    from pyomo.contrib.pynumero.algorithms.solvers.cyipopt_solver import (
+        CyIpoptNLP)
+
+    class Problem(CyIpoptNLP):
+        def __init__(self):
+            # A reused NLP keeps the factor of its last hessian evaluation
+            nlp.set_obj_factor(1.0)
+            super().__init__(nlp)
+            if structure is not None and all(
+                    np.array_equal(old.row, new.row)
+                    and np.array_equal(old.col, new.col)
+                    for old, new in zip(structure,
+                                        (self._jac_g, self._hess_lag))):
+                self._jac_g, self._hess_lag = structure
+
+        def objective(self, x):
+            return sense * super().objective(x)
+
+        def gradient(self, x):
+            return sense * super().gradient(x)
+
+        def hessian(self, x, y, obj_factor):
+            return super().hessian(x, y, sense * obj_factor)
+
+    return Problem()
+
+
+class InProcessIpopt:
+    """IPOPT called in this process through PyNumero and cyipopt.
+
+    A drop-in for pyo.SolverFactory('ipopt') (options and solve). The NLP
+    is evaluated in memory by the AMPL solver library: no ipopt process is
+    started and no .sol file is parsed. The NLP of a model is kept between
+    solves and only built again when a mutable parameter or fixed variable
+    changed; the jacobian and hessian structure is reused in that case, so
+    re-solves in a sweep or receding horizon loop only pay for the
+    evaluations. The cache is kept on the model, so it lives as long as the
+    model does. Requires the PyNumero ASL extension and cyipopt, and a
+    pyomo.environ model (PyNumero does not support pyomo.kernel, so not
+    the lean builder).
+
+    Parameters
+    ----------
+    options : dict
+        IPOPT options.
+
+    """
+    def __init__(self, options=None):
+        self.options = dict(options or {})
+
+    def available(self, exception_flag=False):
+        from pyomo.common.errors import ApplicationError
+        from pyomo.contrib.pynumero.algorithms.solvers.cyipopt_solver import (
+            cyipopt_available)
+        from pyomo.contrib.pynumero.asl import AmplInterface
+
+        if cyipopt_available and AmplInterface.available():
+            return True
+        if exception_flag:
+            raise ApplicationError(
+                'The in process backend needs cyipopt and the PyNumero ASL '
+                'library (pyomo build-extensions)')
+        return False
+
+    def _get_nlp(self, m):
+        """NLP of the model and the structure of a previous one, if any."""
+        from pyomo.contrib.pynumero.interfaces.pyomo_nlp import PyomoNLP
+
+        fingerprint = _fingerprint(m)
+        cache = getattr(m, '_inprocess_cache', None)
+        if cache is not None and cache['fingerprint'] == fingerprint:
+            return cache['nlp'], cache.get('structure')
+        nlp = PyomoNLP(m)
+        structure = cache and cache.get('structure')
+        m._inprocess_cache = {'fingerprint': fingerprint, 'nlp': nlp}
+        return nlp, structure
+
+    def solve(self, m, tee=False, timelimit=None):
+        """Solve the model and load the solution (and duals) into it.
+
+        Parameters
+        ----------
+        m : pyomo model
+            A discretized pyomo model.
+        tee : bool
+            Show the IPOPT output.
+        timelimit : float
+            Time limit (s), passed to IPOPT as max_cpu_time (there is no
+            process to kill, the solve can only be stopped by IPOPT).
+
+        Returns
+        -------
+        SolverResults
+            The solver status and termination condition.
+
+        """
+        from pyomo.contrib.pynumero.algorithms.solvers.cyipopt_solver import (
+            CyIpoptSolver)
+
+        nlp, structure = self._get_nlp(m)
+        variables = nlp.get_pyomo_variables()
+        objective = next(
+            m.component_data_objects(pyo.Objective, active=True))
+        sense = 1.0 if objective.sense == pyo.minimize else -1.0
+        problem = _problem(nlp, sense, structure)
+        m._inprocess_cache['structure'] = (problem._jac_g, problem._hess_lag)
+
+        # Start from the current values of the variables
+        x0 = nlp.init_primals().copy()
+        for i, var in enumerate(variables):
+            if var.value is not None:
+                x0[i] = var.value
+        options = dict(self.options)
+        if timelimit is not None:
+            options['max_cpu_time'] = min(
+                float(timelimit), options.get('max_cpu_time', float('inf')))
+        x, info = CyIpoptSolver(problem, options).solve(x0, tee=tee)
+
+        for var, value in zip(variables, x):
+            var.value = float(value)
+        if hasattr(m, 'dual'):
+            # IPOPT sign convention (see sensitivity.py for the sign fix)
+            for con, value in zip(nlp.get_pyomo_constraints(),
+                                  info['mult_g']):
+                m.dual[con] = float(value)
+
+        results = SolverResults()
+        condition = STATUS.get(info['status'], TerminationCondition.error)
+        results.solver.termination_condition = condition
+        results.solver.status = (SolverStatus.ok
+                                 if condition == TerminationCondition.optimal
+                                 else SolverStatus.warning)
+        results.solver.message = info['status_msg']
+
+        return results
@@ -0,0 +1,194 @@
+import numpy as np
+import pandas as pd
+import pyomo.kernel as pmo
+
+from .optimize import get_solver, solve_with_budget
+from .hammering import stiffness_bounds
+
+# Spring model of the hammer (same as hammering.dynamic_motion_model)
+C1, C2 = 28.41, 206.35
+W = 0.03
+
+# Derivatives of the states, in the order of the columns of get_profiles
+DERIVATIVES = {'bv': 'bd', 'hv': 'hd', 'mv': 'md', 'ba': 'bv', 'ha': 'hv'}
+VARIABLES = ['ba', 'bd', 'bv', 'ha', 'hd', 'hv', 'md', 'mv']
+
+
+def lean_motion_model(tf, stiffness, config, nfe):
+    """Discretized dynamic_motion_model built directly with pyomo.kernel.
+
+    The backward finite difference equations are written as kernel linear
+    constraints (coefficient lists instead of expression trees) and the
+    variables are plain kernel variables, so no continuous model is built
+    and transformed. Only the hammer dynamics need expression trees. The
+    NLP is the one of dynamic_motion_model discretized with the BACKWARD
+    scheme (same variables, bounds and constraint rows).
+
+    Parameters
+    ----------
+    tf : float
+        Final time of the maneuvering.
+    stiffness : str
+        Stiffness of springs used for simulation
+    config : yaml
+        The configuration file for the simulation
+    nfe : int
+        Number of finite elements.
+
+    Returns
+    -------
+    m
+        A pyomo kernel block with one variable list per state or control
+        and the time points in m.time.
+
+    """
+    m = pmo.block()
+    m.time = np.linspace(0, tf, nfe + 1)
+    h = tf / nfe
+    n = nfe + 1
+
+    h_mass = config['h_mass']
+    w_min, w_max = stiffness_bounds(stiffness, config)
+    if stiffness == 'variable_stiffness':
+        mv_bounds = (-0.15, 0.15)
+    else:
+        mv_bounds = (0.0, 0.0)
+    bounds = {
+        'bd': (config['bd_min'], config['bd_max']),
+        'hd': (None, None),
+        'md': (w_min, w_max),
+        'bv': (config['bv_min'], config['bv_max']),
+        'hv': (None, None),
+        'mv': mv_bounds,
+        'ba': (config['ba_min'], config['ba_max']),
+        'ha': (None, None),
+    }
+    for key in VARIABLES:
+        lb, ub = bounds[key]
+        variables = (pmo.variable(lb=lb, ub=ub) for i in range(n))
+        setattr(m, key, pmo.variable_list(variables))
+
+    # Backward differences: dx[i] - (x[i] - x[i-1]) / h == 0
+    m.fd = pmo.constraint_list()
+    for key, state in DERIVATIVES.items():
+        dx, x = getattr(m, key), getattr(m, state)
+        for i in range(1, n):
+            m.fd.append(
+                pmo.linear_constraint(variables=[dx[i], x[i], x[i - 1]],
+                                      coefficients=[1, -1 / h, 1 / h],
+                                      rhs=0))
+
+    # Hammer movement dynamics
+    m.ode_hv = pmo.constraint_list()
+    for i in range(n):
+        temp = +m.ba[i] * h_mass + 2 * C1 * pmo.exp(
+            -C2 * (m.md[i] - W)) * pmo.sinh(C2 * (m.hd[i])) + 1 * m.hv[i]
+        m.ode_hv.append(pmo.constraint(m.ha[i] == -temp / h_mass))
+
+    # Displacement constraints (hammer displacement)
+    m.disp = pmo.constraint_list()
+    for i in range(n):
+        m.disp.append(
+            pmo.linear_constraint(variables=[m.hd[i], m.md[i]],
+                                  coefficients=[1, -1],
+                                  ub=-W))
+        m.disp.append(
+            pmo.linear_constraint(variables=[m.hd[i], m.md[i]],
+                                  coefficients=[1, 1],
+                                  lb=W))
+
+    # Initial values, end effector position and zero velocity at the end
+    initial_condition = {key: 0.0 for key in VARIABLES}
+    initial_condition['md'] = w_max
+    m.ic = pmo.constraint_list()
+    for key, value in initial_condition.items():
+        m.ic.append(
+            pmo.linear_constraint(variables=[getattr(m, key)[0]],
+                                  coefficients=[1],
+                                  rhs=value))
+    m.ic.append(
+        pmo.linear_constraint(variables=[m.bv[n - 1]], coefficients=[1],
+                              rhs=0))
+    m.ic.append(
+        pmo.linear_constraint(variables=[m.bd[n - 1]],
+                              coefficients=[1],
+                              rhs=config['path_length']))
+
+    # Objective function
+    m.obj = pmo.objective(m.hv[n - 1], sense=pmo.maximize)
+
+    return m
+
+
+def lean_profiles(m):
+    """Optimal values of a lean model, same layout as get_profiles."""
+    df = pd.DataFrame({
+        key: [v.value for v in getattr(m, key)]
+        for key in VARIABLES
+    })
+    df.insert(0, 'time', m.time)
+    return df
+
+
+def initialize_lean(m, initial_values):
+    """Initialise a lean model from a solution (like initialize_model)."""
+    time = initial_values['time'].values.astype(float)
+    target = m.time / m.time[-1]
+    for key in VARIABLES:
+        if key not in initial_values.columns:
+            continue
+        values = initial_values[key].values.astype(float)
+        valid = ~np.isnan(values)
+        if not valid.any():
+            continue
+        values = np.interp(target, time[valid] / time[-1], values[valid])
+        for var, value in zip(getattr(m, key), values):
+            var.value = float(value)
+
+    return None
+
+
+def run_lean_optimization(tf,
+                          stiffness,
+                          config,
+                          nfe,
+                          initial_values=None,
+                          solver='ipopt',
+                          time_limit=None,
+                          max_iter=None):
+    """Build and solve the lean model (see optimize.run_optimization).
+
+    Parameters
+    ----------
+    tf : float
+        Final time of the maneuvering.
+    stiffness : str
+        Stiffness of springs used for simulation
+    config : yaml
+        The configuration file for the simulation
+    nfe : int
+        Number of finite elements.
+    initial_values : dataframe
+        Optimal values of a similar problem used as the initial point.
+    solver : str
+        IPOPT backend, only 'ipopt' (see optimize.SOLVERS).
+    time_limit, max_iter : float, int
+        Budget of the solve (see optimize.solve_with_budget).
+
+    Returns
+    -------
+    m, optimal_values, solution
+        The solved model, the dataframe of all the optimal values and the
+        solver results.
+
+    """
+    if solver == 'cyipopt':
+        # PyNumero only builds NLPs of pyomo.environ models
+        raise ValueError('The lean builder only supports the ipopt solver')
+    m = lean_motion_model(tf, stiffness, config, nfe)
+    if initial_values is not None:
+        initialize_lean(m, initial_values)
+    opt = get_solver(solver)
+    solution = solve_with_budget(opt, m, time_limit, max_iter)
+
+    return m, lean_profiles(m), solution
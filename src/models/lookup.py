@@ -0,0 +1,171 @@
+import bisect
+import itertools
+
+import numpy as np
+
+from .batch import make_job, run_jobs
+from .search import is_feasible
+
+AXES = ['tf', 'path_length', 'h_mass']
+
+
+def generate_lookup_table(config,
+                          tf,
+                          path_length,
+                          h_mass,
+                          stiffness=None,
+                          nfe=100,
+                          n_samples=101,
+                          n_jobs=1,
+                          save_path=None):
+    """Solve the hammering problem over a grid of parameters.
+
+    Parameters
+    ----------
+    config : yaml
+        The configuration file for the simulation
+    tf : list
+        Grid of final times (increasing).
+    path_length : list
+        Grid of path lengths (increasing).
+    h_mass : list
+        Grid of hammer masses (increasing).
+    stiffness : list
+        Stiffness modes, defaults to config['stiffness'].
+    nfe : int
+        Number of finite elements of every solve.
+    n_samples : int
+        Number of samples of the schedules over the normalised time.
+    n_jobs : int
+        Number of worker processes.
+    save_path : str
+        If given, the table is saved to this .npz file.
+
+    Returns
+    -------
+    dict
+        The grid axes, the ba and md schedules, the final hammer velocity
+        hv and the feasibility of every grid point (False if a schedule
+        has no values).
+
+    """
+    stiffness = list(stiffness or config['stiffness'])
+    axes = [np.asarray(tf, float), np.asarray(path_length, float),
+            np.asarray(h_mass, float)]
+    shape = tuple(len(axis) for axis in axes) + (len(stiffness), )
+
+    grid = list(itertools.product(*[range(n) for n in shape]))
+    jobs = []
+    for i, j, k, s in grid:
+        overrides = {'path_length': axes[1][j], 'h_mass': axes[2][k]}
+        jobs.append(
+            make_job(tf=axes[0][i],
+                     stiffness=stiffness[s],
+                     nfe=nfe,
+                     overrides=overrides))
+    outputs = run_jobs(jobs, config, n_jobs=n_jobs)
+
+    tau = np.linspace(0, 1, n_samples)
+    table = {
+        'tf': axes[0],
+        'path_length': axes[1],
+        'h_mass': axes[2],
+        'stiffness': np.array(stiffness),
+        'tau': tau,
+        'ba': np.full(shape + (n_samples, ), np.nan, dtype=np.float32),
+        'md': np.full(shape + (n_samples, ), np.nan, dtype=np.float32),
+        'hv': np.full(shape, np.nan),
+        'feasible': np.zeros(shape, dtype=bool),
+    }
+    for index, output in zip(grid, outputs):
+        df = output['optimal_values'].astype(float)
+        source = df['time'].values / df['time'].values[-1]
+        complete = True
+        for key in ['ba', 'md']:
+            values = df[key].values
+            valid = ~np.isnan(values)
+            # No schedule (e.g. a failed solve), the row is left NaN
+            if not valid.any():
+                complete = False
+                continue
+            table[key][index] = np.interp(tau, source[valid], values[valid])
+        table['hv'][index] = output['obj_values']
+        table['feasible'][index] = complete and is_feasible(output)
+
+    if save_path is not None:
+        np.savez(save_path, **table)
+
+    return table
+
+
+def _weights(axis, value):
+    """Index and linear interpolation weights of a value on a grid axis."""
+    if len(axis) == 1:
+        return 0, [1.0], value == axis[0]
+    inside = axis[0] <= value <= axis[-1]
+    i = min(max(bisect.bisect_left(axis, value) - 1, 0), len(axis) - 2)
+    w = (value - axis[i]) / (axis[i + 1] - axis[i])
+    w = min(max(w, 0.0), 1.0)
+    return i, [1 - w, w], inside
+
+
+class LookupTable:
+    """Interpolated optimal schedules from a precomputed table.
+
+    Parameters
+    ----------
+    path : str
+        Path of the table saved by generate_lookup_table.
+
+    """
+    def __init__(self, path):
+        with np.load(str(path)) as data:
+            self.table = {key: data[key] for key in data.keys()}
+        # Plain lists are faster than arrays for the scalar lookups
+        self.axes = [self.table[key].tolist() for key in AXES]
+        self.stiffness = [str(item) for item in self.table['stiffness']]
+
+    def query(self, tf, path_length, h_mass, stiffness):
+        """Interpolate the schedules for the given parameters.
+
+        Parameters
+        ----------
+        tf : float
+            Final time.
+        path_length : float
+            Path length of the end effector.
+        h_mass : float
+            Mass of the hammer.
+        stiffness : str
+            Stiffness mode.
+
+        Returns
+        -------
+        dict
+            time, ba and md schedules, hv and a feasible flag which is False
+            outside the grid or next to an infeasible grid point.
+
+        """
+        s = self.stiffness.index(stiffness)
+        index, w, inside = [], np.ones(1), True
+        for axis, value in zip(self.axes, (tf, path_length, h_mass)):
+            i, weights, check = _weights(axis, value)
+            index.append(slice(i, i + len(weights)))
+            w = np.multiply.outer(w, weights).ravel()
+            inside = inside and check
+
+        index = tuple(index) + (s, )
+        # Only the corners with a weight, the others may have no schedule
+        used = w > 0
+        w = w[used]
+        feasible = inside and bool(
+            self.table['feasible'][index].ravel()[used].all())
+        n_samples = len(self.table['tau'])
+
+        return {
+            'time': self.table['tau'] * tf,
+            'ba': w @ self.table['ba'][index].reshape(-1, n_samples)[used],
+            'md': w @ self.table['md'][index].reshape(-1, n_samples)[used],
+            'hv': float(w @ self.table['hv'][index].ravel()[used]),
+            'feasible': feasible,
+        }
@@ -0,0 +1,157 @@
+import time
+
+import numpy as np
+import pyomo.environ as pyo
+
+from .hammering import scaled_motion_model
+from .optimize import get_solver
+from .pyomoio import get_profiles
+
+STATES = ['bd', 'bv', 'hd', 'hv', 'md']
+
+
+def scaled_profiles(m):
+    """Optimal values of a scaled model over the absolute time.
+
+    Parameters
+    ----------
+    m : pyomo model
+        A solved model from hammering.scaled_motion_model.
+
+    Returns
+    -------
+    dataframe
+        The states and controls with the time in seconds (the derivatives
+        with respect to the normalised time are dropped).
+
+    """
+    df = get_profiles(m)
+    df = df[[c for c in df.columns if c == 'time' or not c.startswith('d')]]
+    df = df.astype(float)
+    df['time'] = df['time'] * pyo.value(m.tf)
+
+    return df
+
+
+class RecedingHorizonController:
+    """Re-solve the remaining hammering trajectory from measured states.
+
+    One discretized scaled_motion_model is kept alive. Every step updates
+    its horizon and initial state parameters, shifts the previous solution
+    to the new time grid as the initial point and solves with capped
+    iterations and cpu time.
+
+    Parameters
+    ----------
+    config : yaml
+        The configuration file for the simulation
+    stiffness : str
+        Stiffness of springs used for simulation
+    tf : float
+        Final (strike) time measured from the start of the maneuver.
+    nfe : int
+        Number of finite elements of the horizon.
+    max_iter : int
+        Maximum number of IPOPT iterations per step.
+    max_cpu_time : float
+        Maximum IPOPT cpu time per step (s).
+    min_horizon : float
+        Below this remaining time the last solution is returned.
+    scheme : str
+        Finite difference scheme.
+    solver : str
+        IPOPT backend (see optimize.SOLVERS). With 'cyipopt' the NLP of the
+        horizon is built once and kept between the steps.
+
+    """
+    def __init__(self,
+                 config,
+                 stiffness,
+                 tf,
+                 nfe=50,
+                 max_iter=100,
+                 max_cpu_time=0.05,
+                 min_horizon=0.05,
+                 scheme='BACKWARD',
+                 solver='ipopt'):
+        self.tf = tf
+        self.min_horizon = min_horizon
+        self.m = scaled_motion_model(tf, stiffness, config)
+        pyo.TransformationFactory('dae.finite_difference').apply_to(
+            self.m, nfe=nfe, wrt=self.m.time, scheme=scheme)
+        self.tau = np.array([t for t in self.m.time], dtype=float)
+
+        self.opt = get_solver(solver)
+        self.opt.options['max_iter'] = max_iter
+        self.opt.options['max_cpu_time'] = max_cpu_time
+
+        self.t_start = 0.0  # time of the start of the current horizon
+        self.solution = None
+        self.history = []
+
+    def shift_solution(self, t_now, horizon):
+        """Interpolate the previous solution on the new time grid."""
+        if self.solution is None:
+            return None
+        source = self.solution['time'].values + self.t_start
+        target = t_now + self.tau * horizon
+        for name in self.solution.columns:
+            if name == 'time':
+                continue
+            values = np.interp(target, source, self.solution[name].values)
+            var = self.m.component(name)
+            for t, value in zip(self.m.time, values):
+                var[t].value = float(value)
+
+        return None
+
+    def step(self, state, t_now):
+        """Solve the remaining trajectory from the measured state.
+
+        Parameters
+        ----------
+        state : dict
+            Measured bd, bv, hd, hv and md.
+        t_now : float
+            Time since the start of the maneuver (s).
+
+        Returns
+        -------
+        dict
+            The optimal values over the remaining horizon (time measured
+            from t_now), the solver status and the solve time.
+
+        """
+        horizon = self.tf - t_now
+        if horizon < self.min_horizon and self.solution is not None:
+            return {'optimal_values': self.solution, 'status': 'skipped',
+                    'solve_time': 0.0}
+
+        self.shift_solution(t_now, horizon)
+        self.m.tf = horizon
+        for key in STATES:
+            self.m.x0[key] = state[key]
+            self.m.component(key)[0].value = state[key]
+
+        start = time.perf_counter()
+        solution = self.opt.solve(self.m)
+        solve_time = time.perf_counter() - start
+
+        self.t_start = t_now
+        self.solution = scaled_profiles(self.m)
+        output = {
+            'optimal_values': self.solution,
+            'status': solution.solver.termination_condition,
+            'solve_time': solve_time,
+        }
+        self.history.append((t_now, output['status'], solve_time))
+
+        return output
+
+    def predict(self, t):
+        """States predicted by the last solution at the absolute time t."""
+        time = self.solution['time'].values + self.t_start
+        return {
+            key: float(np.interp(t, time, self.solution[key].values))
+            for key in STATES
+        }
@@ -0,0 +1,244 @@
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from .batch import make_job, solve_job
+from .hammering import stiffness_bounds
+from .optimize import BUDGET_EXCEEDED
+from .search import is_feasible
+
+STRATEGIES = ['flat', 'perturbed', 'random']
+
+
+def flat_trajectory(tf, stiffness, config, n_points=101):
+    """Initial trajectory from the flat outputs of the hammering task.
+
+    The end effector follows a minimum jerk path to the path length and
+    the hammer stays at rest relative to it.
+
+    Parameters
+    ----------
+    tf : float
+        Final time of the maneuvering.
+    stiffness : str
+        Stiffness of springs used for simulation
+    config : yaml
+        The configuration file for the simulation
+    n_points : int
+        Number of time points.
+
+    Returns
+    -------
+    dataframe
+        Initial values of all the states and controls with a time column.
+
+    """
+    time = np.linspace(0, tf, n_points)
+    s = time / tf
+    L = config['path_length']
+
+    df = pd.DataFrame({'time': time})
+    df['bd'] = L * (10 * s**3 - 15 * s**4 + 6 * s**5)
+    df['bv'] = L * (30 * s**2 - 60 * s**3 + 30 * s**4) / tf
+    df['ba'] = L * (60 * s - 180 * s**2 + 120 * s**3) / tf**2
+    for key in ['hd', 'hv', 'ha', 'mv']:
+        df[key] = 0.0
+    if stiffness == 'high_stiffness':
+        df['md'] = config['w_min']
+    else:
+        df['md'] = config['w_max']
+
+    return df
+
+
+def _bounds(stiffness, config):
+    w_min, w_max = stiffness_bounds(stiffness, config)
+    return {
+        'bd': (config['bd_min'], config['bd_max']),
+        'bv': (config['bv_min'], config['bv_max']),
+        'ba': (config['ba_min'], config['ba_max']),
+        'md': (w_min, w_max),
+    }
+
+
+def _flat_start(flat, base, bounds, rng, first):
+    # Scale the flat path so the flat starts are not all identical
+    df = flat.copy()
+    scale = 1.0 if first else rng.uniform(0.5, 1.5)
+    for key in ['bv', 'ba']:
+        df[key] = df[key] * scale
+    return df
+
+
+def _perturbed_start(flat, base, bounds, rng, first):
+    df = base.copy()
+    for key, (low, high) in bounds.items():
+        if key in df.columns:
+            noise = rng.normal(0, 0.1 * (high - low), len(df))
+            df[key] = np.clip(df[key].values + noise, low, high)
+    return df
+
+
+def _random_start(flat, base, bounds, rng, first):
+    df = flat.copy()
+    for key, (low, high) in bounds.items():
+        df[key] = rng.uniform(low, high, len(df))
+    for key in ['hd', 'hv']:
+        df[key] = rng.normal(0, 0.01, len(df))
+    return df
+
+
+# Initial trajectory of every strategy
+_STARTS = {
+    'flat': _flat_start,
+    'perturbed': _perturbed_start,
+    'random': _random_start
+}
+
+
+def initial_trajectories(tf,
+                         stiffness,
+                         config,
+                         n_starts,
+                         strategies=STRATEGIES,
+                         base=None,
+                         seed=0):
+    """Generate diverse initial trajectories for a multi-start solve.
+
+    Parameters
+    ----------
+    tf : float
+        Final time of the maneuvering.
+    stiffness : str
+        Stiffness of springs used for simulation
+    config : yaml
+        The configuration file for the simulation
+    n_starts : int
+        Number of initial trajectories.
+    strategies : list
+        Cycle of strategies: 'flat' (flat output based), 'perturbed' (base
+        trajectory plus noise) and 'random' (uniform within the bounds).
+    base : dataframe
+        Trajectory perturbed by the 'perturbed' strategy, defaults to the
+        flat trajectory.
+    seed : int
+        Seed of the random generator.
+
+    Returns
+    -------
+    list
+        A list of (strategy, dataframe) tuples, the first flat start is
+        unperturbed.
+
+    """
+    rng = np.random.RandomState(seed)
+    flat = flat_trajectory(tf, stiffness, config)
+    if base is None:
+        base = flat
+    bounds = _bounds(stiffness, config)
+
+    starts = []
+    for i in range(n_starts):
+        strategy = strategies[i % len(strategies)]
+        if strategy not in _STARTS:
+            raise ValueError('Unknown strategy ' + strategy)
+        df = _STARTS[strategy](flat, base, bounds, rng, first=i == 0)
+        starts.append((strategy, df))
+
+    return starts
+
+
+def _solve_start(args):
+    job, config, strategy, initial_values = args
+    return strategy, solve_job(job, config, initial_values)
+
+
+def run_multistart(config,
+                   tf,
+                   stiffness,
+                   n_starts=8,
+                   n_jobs=1,
+                   bound=None,
+                   tol=1e-3,
+                   maximize=True,
+                   strategies=STRATEGIES,
+                   base=None,
+                   seed=0,
+                   **job_kwargs):
+    """Solve the problem from several initial trajectories concurrently.
+
+    Parameters
+    ----------
+    config : yaml
+        The configuration file for the simulation
+    tf : float
+        Final time of the maneuvering.
+    stiffness : str
+        Stiffness of springs used for simulation
+    n_starts : int
+        Number of initial trajectories.
+    n_jobs : int
+        Number of worker processes.
+    bound : float
+        Best known bound of the objective. Once a start is within tol
+        (relative) of it, the outstanding starts are cancelled.
+    tol : float
+        Relative tolerance on the bound.
+    maximize : bool
+        Sense of the objective.
+    strategies : list
+        Strategies of initial_trajectories.
+    base : dataframe
+        Trajectory perturbed by the 'perturbed' strategy.
+    seed : int
+        Seed of the random generator.
+    **job_kwargs : dict
+        Job specification (builder, nfe, scheme, model_name).
+
+    Returns
+    -------
+    dict, dict
+        The model log of the best start (None if no start is feasible) and
+        the spread across the starts.
+
+    """
+    job = make_job(tf=tf, stiffness=stiffness, **job_kwargs)
+    starts = initial_trajectories(tf, stiffness, config, n_starts,
+                                  strategies, base, seed)
+    sign = 1.0 if maximize else -1.0
+
+    best, results, n_exceeded = None, [], 0
+    args = [(job, config, strategy, df) for strategy, df in starts]
+    # Leaving the context terminates the workers, which also cancels the
+    # starts still running once the bound is reached
+    with Pool(processes=max(min(n_jobs, n_starts), 1)) as pool:
+        for strategy, output in pool.imap_unordered(_solve_start, args):
+            feasible = is_feasible(output)
+            results.append((strategy, feasible, output['obj_values']))
+            n_exceeded += output['solver_status'] == BUDGET_EXCEEDED
+            if not feasible:
+                continue
+            if best is None or (sign * output['obj_values'] >
+                                sign * best['obj_values']):
+                best = output
+
+            # Stop early if the best known bound is reached
+            if bound is not None and sign * (
+                    bound - best['obj_values']) <= tol * max(abs(bound), 1):
+                break
+
+    objectives = np.array([obj for _, feasible, obj in results if feasible])
+    spread = {
+        'starts': results,
+        'n_starts': n_starts,
+        'n_solved': len(results),
+        'n_feasible': len(objectives),
+        'n_budget_exceeded': n_exceeded,
+        'min': objectives.min() if len(objectives) else np.nan,
+        'max': objectives.max() if len(objectives) else np.nan,
+        'mean': objectives.mean() if len(objectives) else np.nan,
+        'std': objectives.std() if len(objectives) else np.nan,
+    }
+
+    return best, spread
@@ -1,8 +1,150 @@
+import time
+
+import numpy as np
 import pyomo.environ as pyo
 from .pyomoio import get_profiles
 
+# ipopt: the executable (.nl and .sol files), cyipopt: in process (PyNumero)
+SOLVERS = ('ipopt', 'cyipopt')
+
+
+def get_solver(solver='ipopt'):
+    """IPOPT solver object with the given backend (see SOLVERS)."""
+    if solver == 'ipopt':
+        return pyo.SolverFactory('ipopt')
+    if solver == 'cyipopt':
+        from .inprocess import InProcessIpopt
+        return InProcessIpopt()
+    raise ValueError('Unknown solver {}, expected one of {}'.format(
+        solver, SOLVERS))
+
+
+# Solver status of a job which exceeded its time or iteration budget
+BUDGET_EXCEEDED = 'budget_exceeded'
+
+
+class BudgetExceeded(RuntimeError):
+    pass
+
+
+def solve_with_budget(opt, m, time_limit=None, max_iter=None, grace=5.0):
+    """Solve a model within a time and an iteration budget.
+
+    IPOPT stops by itself after max_iter iterations or time_limit seconds
+    of cpu time (max_cpu_time) and returns its last point. Pyomo kills the
+    ipopt process if it still runs grace seconds (wall clock) after the
+    time limit, e.g. when it is stuck in a function evaluation. The in
+    process backend can only be stopped by IPOPT itself.
+
+    Parameters
+    ----------
+    opt : solver
+        Solver object from get_solver.
+    m : pyomo model
+        A discretized pyomo model.
+    time_limit : float
+        Time budget (s), None for no limit.
+    max_iter : int
+        Iteration budget, None for the IPOPT default.
+    grace : float
+        Wall clock time after the time limit before the process is killed.
+
+    Returns
+    -------
+    SolverResults
+        The solver results, a killed solver terminates with maxTimeLimit.
+
+    """
+    import subprocess
+    from pyomo.common.errors import ApplicationError
+    from pyomo.common.tempfiles import TempfileManager
+    from pyomo.opt import SolverResults, SolverStatus, TerminationCondition
+
+    if max_iter is not None:
+        opt.options['max_iter'] = int(max_iter)
+    if time_limit is None:
+        return opt.solve(m)
+
+    opt.options['max_cpu_time'] = float(time_limit)
+    timelimit = float(time_limit) + grace
+    start = time.perf_counter()
+    try:
+        return opt.solve(m, timelimit=timelimit)
+    except subprocess.TimeoutExpired as error:
+        # Pyomo killed the process and left the temporary .nl, .sol and
+        # log files of the solve behind
+        TempfileManager.pop(remove=True)
+        message = str(error)
+    except ApplicationError as error:
+        # Killed from outside (e.g. out of memory) after the time limit
+        if time.perf_counter() - start < timelimit:
+            raise
+        message = str(error)
+
+    results = SolverResults()
+    results.solver.status = SolverStatus.aborted
+    results.solver.termination_condition = TerminationCondition.maxTimeLimit
+    results.solver.message = message
+    return results
+
+
+def budget_exceeded(solution, time_limit=None, max_iter=None):
+    """Check if a solve was stopped by its time or iteration budget."""
+    from pyomo.opt import TerminationCondition
+
+    condition = solution.solver.termination_condition
+    return ((time_limit is not None
+             and condition == TerminationCondition.maxTimeLimit)
+            or (max_iter is not None
+                and condition == TerminationCondition.maxIterations))
+
+
+def initialize_model(model, initial_values):
+    """Initialise the variables of a discretized model from a solution.
+
+    The solution is interpolated over the normalised time t / tf, so it
+    can come from a model with a different final time or mesh.
+
+    Parameters
+    ----------
+    model : pyomo model
+        A discretized pyomo model.
+    initial_values : dataframe
+        Optimal values (e.g. from get_profiles) with a time column.
+
+    Returns
+    -------
+    None
+
+    """
+    time = initial_values['time'].values.astype(float)
+    source = time / time[-1]
+    target = np.array([t for t in model.time], dtype=float)
+    target = target / target[-1]
+
+    for var in model.component_objects(pyo.Var, active=True):
+        name = str(var)
+        if name not in initial_values.columns or not var.is_indexed():
+            continue
+        values = initial_values[name].values.astype(float)
+        valid = ~np.isnan(values)
+        if not valid.any():
+            continue
+        values = np.interp(target, source[valid], values[valid])
+        for t, value in zip(model.time, values):
+            var[t].value = float(value)
+
+    return None
+
 
-def run_optimization(model, n_time_steps):
+def run_optimization(model,
+                     n_time_steps,
+                     scheme='BACKWARD',
+                     initial_values=None,
+                     duals=False,
+                     solver='ipopt',
+                     time_limit=None,
+                     max_iter=None):
     """Short summary.
 
     Parameters
@@ -11,6 +153,18 @@ def run_optimization(model, n_time_steps):
         A pyomo model with all the states, control and constraints described.
     n_time_steps : int
         Number of time steps to use in the simulation.
+    scheme : str
+        Finite difference scheme, BACKWARD, CENTRAL or FORWARD.
+    initial_values : dataframe
+        Optimal values of a similar problem used as the initial point.
+    duals : bool
+        Import the constraint duals into model.dual.
+    solver : str
+        IPOPT backend, 'ipopt' (executable) or 'cyipopt' (in process).
+    time_limit : float
+        Time budget of the solve (s), see solve_with_budget.
+    max_iter : int
+        Iteration budget of the solve.
 
     Returns
     -------
@@ -23,9 +177,13 @@ def run_optimization(model, n_time_steps):
     m = model
     # Transform and solve
     pyo.TransformationFactory('dae.finite_difference').apply_to(
-        m, nfe=n_time_steps, wrt=m.time, scheme='BACKWARD')
-    opt = pyo.SolverFactory('ipopt')
-    solution = opt.solve(m)  # set tee true for detailed resutls
+        m, nfe=n_time_steps, wrt=m.time, scheme=scheme)
+    if initial_values is not None:
+        initialize_model(m, initial_values)
+    if duals and not hasattr(m, 'dual'):
+        m.dual = pyo.Suffix(direction=pyo.Suffix.IMPORT)
+    opt = get_solver(solver)
+    solution = solve_with_budget(opt, m, time_limit, max_iter)
     # solution.write()
 
     # Get the dataframe of all the states and control
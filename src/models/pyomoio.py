@@ -306,3 +306,29 @@ def get_profiles(model):
         df.insert(0, str(var), t)
 
     return df
+
+
+def get_duals(model):
+    """Get the duals of all the active constraints in one pass.
+
+    The dual suffix is read once, instead of looking up the dual of every
+    constraint of the model.
+
+    Parameters
+    ----------
+    model : pyomo model
+        A solved pyomo model with an import Suffix named dual.
+
+    Returns
+    -------
+    list, array
+        The active constraint data objects with a dual and their duals, in
+        the order the solver returned them.
+
+    """
+    items = [(c, value) for c, value in model.dual.items()
+             if c.ctype is pyo.Constraint and c.active]
+    constraints = [c for c, _ in items]
+    values = [value for _, value in items]
+
+    return constraints, pd.Series(values, dtype=float).values
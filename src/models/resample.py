@@ -0,0 +1,270 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils import atomic_write
+
+# Hermite basis polynomials (rows) as coefficients of s^0 ... s^3, s in [0, 1]
+# Cubic: p0, h v0, p1, h v1
+CUBIC_BASIS = np.array([
+    [1, 0, -3, 2],
+    [0, 1, -2, 1],
+    [0, 0, 3, -2],
+    [0, 0, -1, 1],
+])
+
+# Record layout of the setpoint file (one record per controller tick)
+SETPOINTS = ['time', 'bd', 'bv', 'ba', 'md', 'mv']
+SETPOINT_DTYPE = np.dtype([(name, '<f4') for name in SETPOINTS])
+
+
+def _evaluate(coefficients, s, h, n_derivatives):
+    """Evaluate per sample polynomials in s and their time derivatives."""
+    outputs = []
+    for k in range(n_derivatives + 1):
+        # Horner's scheme over the rows of samples
+        value = coefficients[:, -1].copy()
+        for j in range(coefficients.shape[1] - 2, -1, -1):
+            value = value * s + coefficients[:, j]
+        outputs.append(value / h**k)
+        coefficients = coefficients[:, 1:] * np.arange(
+            1, coefficients.shape[1])
+    return outputs
+
+
+def _intervals(time, time_new):
+    """Interval index, normalised position and length of the new samples."""
+    i = np.clip(np.searchsorted(time, time_new, side='right') - 1, 0,
+                len(time) - 2)
+    h = time[i + 1] - time[i]
+    return i, (time_new - time[i]) / h, h
+
+
+def constant_acceleration(time, position, velocity, acceleration,
+                          time_new):
+    """Motion with a constant acceleration over every interval.
+
+    The position is piecewise quadratic and the velocity piecewise linear,
+    so both stay between their values at the knots (up to the position
+    overshoot where the velocity changes sign) and the acceleration only
+    takes the interval values.
+
+    Parameters
+    ----------
+    time : array
+        Knots (increasing).
+    position, velocity : array
+        Values at the knots, velocity[i + 1] = velocity[i] + acceleration[i]
+        times the interval length.
+    acceleration : array
+        Value over every interval (one less than the knots).
+    time_new : array
+        Times to evaluate.
+
+    Returns
+    -------
+    array, array, array
+        Position, velocity and acceleration at time_new.
+
+    """
+    i, s, h = _intervals(time, time_new)
+    coefficients = np.stack(
+        [position[i], h * velocity[i], h**2 * acceleration[i] / 2], axis=1)
+    return _evaluate(coefficients, s, h, 2)
+
+
+def cubic_hermite(time, position, velocity, time_new):
+    """C1 interpolation of consistent position and velocity.
+
+    Parameters
+    ----------
+    time : array
+        Knots (increasing).
+    position, velocity : array
+        Values at the knots.
+    time_new : array
+        Times to evaluate.
+
+    Returns
+    -------
+    array, array
+        Position and velocity at time_new.
+
+    """
+    i, s, h = _intervals(time, time_new)
+    weights = np.stack(
+        [position[i], h * velocity[i], position[i + 1], h * velocity[i + 1]],
+        axis=1)
+    return _evaluate(weights @ CUBIC_BASIS, s, h, 1)
+
+
+def _monotone_slopes(time, values):
+    """Knot slopes of a monotone cubic Hermite spline (Fritsch-Carlson)."""
+    secants = np.diff(values) / np.diff(time)
+    slopes = np.concatenate([[secants[0]], (secants[1:] + secants[:-1]) / 2,
+                             [secants[-1]]])
+    # Flat at the local extrema, limited next to steep changes
+    extremum = np.concatenate([[False], secants[1:] * secants[:-1] <= 0,
+                               [False]])
+    slopes[extremum] = 0
+    limit = 3 * np.minimum(np.abs(np.concatenate([[np.inf], secants])),
+                           np.abs(np.concatenate([secants, [np.inf]])))
+    return np.clip(slopes, -limit, limit)
+
+
+def _integrate(time, initial, rate):
+    """Cumulative trapezoidal integral of a sampled rate of change."""
+    steps = np.diff(time) * (rate[1:] + rate[:-1]) / 2
+    return initial + np.concatenate([[0], np.cumsum(steps)])
+
+
+def resample_trajectories(optimal_values, rate=1000.0):
+    """Resample the optimal values at a controller rate.
+
+    The base acceleration of the backward scheme is a bang-bang control,
+    constant over every interval (bv moves by ba times the step), so it is
+    resampled as such: ba only takes the optimal (bounded) values, bv is
+    piecewise linear through its knots and bd, its trapezoidal integral, is
+    piecewise quadratic. bd, bv and ba are consistent at every sample, stay
+    within the limits of the optimal values and keep their final values (a
+    smooth spline overshoots ba at the switches, and clipping it moves the
+    final bd and bv). The magnet separation uses cubic Hermite splines with
+    monotone slopes, so it does not overshoot its bounds either.
+
+    Parameters
+    ----------
+    optimal_values : dataframe
+        Optimal values (e.g. from get_profiles) with a time column.
+    rate : float
+        Controller rate (Hz).
+
+    Returns
+    -------
+    dataframe
+        time, bd, bv, ba, md and mv at 1 / rate steps.
+
+    """
+    df = optimal_values.astype(float)
+    # Derivative variables are not defined at the first knot
+    df = df.bfill().ffill()
+    time = df['time'].values
+    time_new = np.arange(0, int(round(time[-1] * rate)) + 1) / rate
+    time_new = np.minimum(time_new, time[-1])
+
+    bv = df['bv'].values
+    bd = _integrate(time, df['bd'].values[0], bv)
+    ba = np.diff(bv) / np.diff(time)
+    bd, bv, ba = constant_acceleration(time, bd, bv, ba, time_new)
+
+    md = df['md'].values
+    md, mv = cubic_hermite(time, md, _monotone_slopes(time, md), time_new)
+
+    return pd.DataFrame({
+        'time': time_new,
+        'bd': bd,
+        'bv': bv,
+        'ba': ba,
+        'md': md,
+        'mv': mv
+    })
+
+
+def check_endpoints(setpoints, optimal_values):
+    """Difference of the setpoints and the optimal values at both ends.
+
+    Parameters
+    ----------
+    setpoints : dataframe
+        Resampled trajectories.
+    optimal_values : dataframe
+        The optimal values they were resampled from.
+
+    Returns
+    -------
+    dict
+        Largest absolute difference of bd, bv and md at the first and the
+        last knot.
+
+    """
+    differences = {}
+    for key in ['bd', 'bv', 'md']:
+        values = optimal_values[key].astype(float).values
+        differences[key] = float(
+            max(abs(setpoints[key].values[i] - values[i]) for i in (0, -1)))
+    return differences
+
+
+def check_limits(setpoints, config, tol=1e-6):
+    """Largest violation of the configured limits on the dense grid.
+
+    Parameters
+    ----------
+    setpoints : dataframe
+        Resampled trajectories.
+    config : yaml
+        The configuration file for the simulation
+    tol : float
+        Violations below this value are ignored.
+
+    Returns
+    -------
+    dict
+        Largest violation of every limited setpoint, empty if none.
+
+    """
+    limits = {
+        'bd': (config['bd_min'], config['bd_max']),
+        'bv': (config['bv_min'], config['bv_max']),
+        'ba': (config['ba_min'], config['ba_max']),
+        'md': (config['w_min'], config['w_max']),
+    }
+    violations = {}
+    for key, (lower, upper) in limits.items():
+        values = setpoints[key].values
+        violation = max(lower - values.min(), values.max() - upper)
+        if violation > tol:
+            violations[key] = float(violation)
+
+    return violations
+
+
+def save_setpoints(path, setpoints, rate):
+    """Write the setpoints as fixed stride little endian float32 records.
+
+    A json sidecar (same name, .json) records the layout, so the file can
+    be memory-mapped by the controller (see read_setpoints).
+
+    Parameters
+    ----------
+    path : str
+        Path of the binary file.
+    setpoints : dataframe
+        Resampled trajectories.
+    rate : float
+        Controller rate (Hz).
+
+    """
+    records = np.empty(len(setpoints), dtype=SETPOINT_DTYPE)
+    for name in SETPOINTS:
+        records[name] = setpoints[name].values
+    path = Path(path)
+    with atomic_write(path) as f:
+        records.tofile(f)
+    meta = {
+        'fields': SETPOINTS,
+        'dtype': '<f4',
+        'stride': SETPOINT_DTYPE.itemsize,
+        'rate': rate,
+        'n_records': len(records)
+    }
+    with atomic_write(path.with_suffix('.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+
+    return None
+
+
+def read_setpoints(path):
+    """Memory-map a setpoint file written by save_setpoints."""
+    return np.memmap(str(path), dtype=SETPOINT_DTYPE, mode='r')
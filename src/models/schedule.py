@@ -0,0 +1,258 @@
+import contextlib
+import heapq
+import io
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Prior cost model, used until the result store has timings of a builder:
+# solve time (s) = coefficient * size ** exponent (size = variables plus
+# constraints of the NLP)
+DEFAULT_COST = (2e-4, 1.2)
+# Peak RSS of a solver worker (MB): python and pyomo, plus per NLP size
+BASE_RSS = 120.0
+RSS_PER_SIZE = 3e-3
+
+
+def _count(m):
+    """Free variables plus active constraints of a pyomo model or block."""
+    import pyomo.environ as pyo
+    import pyomo.kernel as pmo
+
+    if isinstance(m, pmo.block):
+        # The lean builder returns a pyomo.kernel block
+        variables = m.components(ctype=pmo.variable, active=True)
+        constraints = m.components(ctype=pmo.constraint, active=True)
+    else:
+        variables = m.component_data_objects(pyo.Var, active=True)
+        constraints = m.component_data_objects(pyo.Constraint, active=True)
+    return (sum(1 for v in variables if not v.fixed) +
+            sum(1 for c in constraints))
+
+
+def _mesh_size(job, config, nfe):
+    """NLP size of a job discretized with nfe finite elements."""
+    import pyomo.environ as pyo
+    from .batch import build_model
+
+    job = {**job, 'nfe': nfe}
+    config = {**config, **job.get('overrides', {})}
+    with contextlib.redirect_stdout(io.StringIO()):
+        m = build_model(job, config)
+    if job['builder'] != 'lean':
+        pyo.TransformationFactory('dae.finite_difference').apply_to(
+            m, nfe=nfe, wrt=m.time, scheme=job['scheme'])
+    return _count(m)
+
+
+class SizeModel:
+    """NLP size of jobs, extrapolated from two tiny meshes.
+
+    The number of variables and constraints grows linearly with the number
+    of finite elements, so every (builder, stiffness, scheme) is built
+    with 2 and 4 elements once and extrapolated to the mesh of a job.
+
+    Parameters
+    ----------
+    config : yaml
+        The configuration file for the simulation
+
+    """
+    def __init__(self, config):
+        self.config = config
+        self._lines = {}
+
+    def __call__(self, job):
+        key = (job['builder'], job['stiffness'], job['scheme'],
+               str(sorted(job.get('overrides', {}).items())))
+        if key not in self._lines:
+            small, large = (_mesh_size(job, self.config, nfe)
+                            for nfe in (2, 4))
+            slope = (large - small) / 2
+            self._lines[key] = (small - 2 * slope, slope)
+        intercept, slope = self._lines[key]
+        return intercept + slope * job['nfe']
+
+
+def read_history(paths):
+    """Solve times of the model logs in a result store.
+
+    Parameters
+    ----------
+    paths : list
+        Directories searched recursively for model logs (.pkl).
+
+    Returns
+    -------
+    dataframe
+        One row per log with a job and a solve time (builder, stiffness,
+        scheme, nfe, solve_time, solver_status and the job).
+
+    """
+    from .utils import read_model_log
+
+    rows = []
+    for path in paths:
+        for log_path in sorted(Path(path).rglob('*.pkl')):
+            try:
+                log = read_model_log(str(log_path))
+            except Exception:
+                continue
+            if not isinstance(log, dict) or 'solve_time' not in log:
+                continue
+            job = log['job']
+            rows.append({
+                'builder': job['builder'],
+                'stiffness': job['stiffness'],
+                'scheme': job['scheme'],
+                'nfe': job['nfe'],
+                'solve_time': log['solve_time'],
+                'solver_status': str(log['solver_status']),
+                'job': job
+            })
+
+    return pd.DataFrame(rows, columns=[
+        'builder', 'stiffness', 'scheme', 'nfe', 'solve_time',
+        'solver_status', 'job'
+    ])
+
+
+def _fit(sizes, times):
+    """Coefficient and exponent of time = c * size ** p (log space fit)."""
+    sizes, times = np.asarray(sizes, float), np.asarray(times, float)
+    if len(np.unique(sizes)) >= 2:
+        exponent, intercept = np.polyfit(np.log(sizes), np.log(times), 1)
+        return float(np.exp(intercept)), float(exponent)
+    # One mesh only: keep the prior exponent and scale the coefficient
+    exponent = DEFAULT_COST[1]
+    return float(np.median(times / sizes**exponent)), exponent
+
+
+class CostModel:
+    """Predicted solve time and peak memory of jobs.
+
+    The solve time is a power law of the NLP size, fitted on the solve
+    times in the result store for every builder and stiffness (or every
+    builder if a stiffness has no timings yet), and DEFAULT_COST if the
+    builder has none.
+
+    Parameters
+    ----------
+    config : yaml
+        The configuration file for the simulation
+    history : dataframe
+        Solve times from read_history.
+
+    """
+    def __init__(self, config, history=None):
+        self.size = SizeModel(config)
+        self.fits = {}
+        if history is None or history.empty:
+            return
+        # Positional labels, the sizes are indexed by the group labels
+        history = history[history['solve_time'] > 0].reset_index(drop=True)
+        sizes = np.array([self.size(job) for job in history['job']])
+        for keys in ['builder', ['builder', 'stiffness']]:
+            for key, group in history.groupby(keys):
+                key = key if isinstance(key, tuple) else (key, )
+                self.fits[key] = _fit(sizes[group.index.values],
+                                      group['solve_time'].values)
+
+    def predict(self, job):
+        """Predicted solve time (s) and peak worker memory (MB)."""
+        size = self.size(job)
+        coefficient, exponent = self.fits.get(
+            (job['builder'], job['stiffness']),
+            self.fits.get((job['builder'], ), DEFAULT_COST))
+        return coefficient * size**exponent, BASE_RSS + RSS_PER_SIZE * size
+
+
+def longest_first(costs):
+    """Job indices sorted by decreasing predicted cost (stable)."""
+    return sorted(range(len(costs)), key=lambda i: -costs[i])
+
+
+def dispatch_order(jobs, config, history=None):
+    """Indices of the jobs in the order they should be dispatched.
+
+    Parameters
+    ----------
+    jobs : list
+        A list of job specifications.
+    config : yaml
+        The configuration file for the simulation
+    history : dataframe
+        Solve times from read_history.
+
+    Returns
+    -------
+    list
+        The job indices, longest predicted solve first.
+
+    """
+    model = CostModel(config, history)
+    return longest_first([model.predict(job)[0] for job in jobs])
+
+
+def plan(jobs, config, n_jobs=1, history=None):
+    """Predict the wall time and memory of a batch of jobs.
+
+    The jobs are dispatched longest first to n_jobs workers (each worker
+    takes the next job when it is done). The peak memory is the largest
+    sum of the predicted memory of the jobs running at the same time.
+
+    Parameters
+    ----------
+    jobs : list
+        A list of job specifications.
+    config : yaml
+        The configuration file for the simulation
+    n_jobs : int
+        Number of worker processes.
+    history : dataframe
+        Solve times from read_history.
+
+    Returns
+    -------
+    dataframe, dict
+        The prediction of every job (in dispatch order, with its worker
+        and start time) and the totals: wall time, cpu time and peak
+        memory.
+
+    """
+    model = CostModel(config, history)
+    predictions = [model.predict(job) for job in jobs]
+    costs = [cost for cost, _ in predictions]
+    order = longest_first(costs)
+
+    workers = [(0.0, worker) for worker in range(max(n_jobs, 1))]
+    rows, events = [], []
+    for i in order:
+        start, worker = heapq.heappop(workers)
+        end = start + costs[i]
+        heapq.heappush(workers, (end, worker))
+        events.extend([(start, predictions[i][1]), (end, -predictions[i][1])])
+        rows.append({
+            'model_name': jobs[i]['model_name'],
+            'builder': jobs[i]['builder'],
+            'nfe': jobs[i]['nfe'],
+            'tf': jobs[i]['tf'],
+            'size': model.size(jobs[i]),
+            'time': costs[i],
+            'memory': predictions[i][1],
+            'worker': worker,
+            'start': start
+        })
+
+    # Ends before starts at the same time, the worker is free again
+    memory = np.cumsum([change for _, change in sorted(
+        events, key=lambda event: (event[0], event[1]))])
+    totals = {
+        'wall_time': max(end for end, _ in workers),
+        'cpu_time': float(sum(costs)),
+        'peak_memory': float(memory.max()) if len(memory) else 0.0,
+        'n_jobs': len(jobs)
+    }
+
+    return pd.DataFrame(rows), totals
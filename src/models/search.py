@@ -0,0 +1,162 @@
+import pyomo.environ as pyo
+
+from .batch import make_job, run_jobs
+from .optimize import BUDGET_EXCEEDED, BudgetExceeded
+
+
+def is_feasible(output):
+    """Check if a solved job reached an optimal solution.
+
+    Parameters
+    ----------
+    output : dict
+        The model log returned by solve_job.
+
+    Returns
+    -------
+    bool
+        True if the solver terminated with an optimal solution.
+
+    """
+    optimal_condition = pyo.TerminationCondition.optimal
+    return output['solver_status'] == optimal_condition
+
+
+def apply_budget_policy(outputs, jobs, config, policy, n_jobs=1):
+    """Handle the jobs which exceeded their budget during a search.
+
+    Parameters
+    ----------
+    outputs : list
+        The model logs of the jobs.
+    jobs : list
+        The job specifications.
+    config : yaml
+        The configuration file for the simulation
+    policy : str
+        'infeasible' counts them as infeasible, 'retry' solves them once
+        more with twice the budget (and counts them as infeasible if they
+        exceed it again) and 'error' stops the search.
+    n_jobs : int
+        Number of worker processes for the retries.
+
+    Returns
+    -------
+    list
+        The model logs, with the retried jobs replaced.
+
+    """
+    exceeded = [
+        i for i, output in enumerate(outputs)
+        if output['solver_status'] == BUDGET_EXCEEDED
+    ]
+    if not exceeded or policy == 'infeasible':
+        return outputs
+    if policy == 'error':
+        raise BudgetExceeded('The solve of tf={} exceeded its budget'.format(
+            jobs[exceeded[0]]['tf']))
+    if policy != 'retry':
+        raise ValueError('Unknown budget policy {}'.format(policy))
+
+    retries = []
+    for i in exceeded:
+        overrides = dict(jobs[i].get('overrides', {}))
+        for key in ['time_limit', 'max_iter']:
+            value = overrides.get(key, config.get(key))
+            if value is not None:
+                overrides[key] = 2 * value
+        retries.append({**jobs[i], 'overrides': overrides})
+    outputs = list(outputs)
+    for i, output in zip(exceeded, run_jobs(retries, config, n_jobs=n_jobs)):
+        outputs[i] = output
+
+    return outputs
+
+
+def search_minimum_time(config,
+                        tf_min,
+                        tf_max,
+                        tol=10e-3,
+                        n_jobs=1,
+                        n_starts=1,
+                        budget_policy=None,
+                        **job_kwargs):
+    """Search the minimum final time for which the problem is feasible.
+
+    The interval [tf_min, tf_max] is split at n_jobs interior points which
+    are solved in parallel, so every iteration shrinks the interval by a
+    factor of (n_jobs + 1). With n_jobs=1 this is a plain bisection.
+    With n_starts > 1 every final time is instead solved from several
+    initial trajectories (using the n_jobs workers), and it is feasible
+    if any of the starts is.
+
+    Parameters
+    ----------
+    config : yaml
+        The configuration file for the simulation
+    tf_min : float
+        Final time known (or assumed) to be infeasible.
+    tf_max : float
+        Final time known (or assumed) to be feasible.
+    tol : float
+        Width of the final interval.
+    n_jobs : int
+        Number of final times solved in parallel at every iteration.
+    n_starts : int
+        Number of multi-start initial trajectories for each final time.
+    budget_policy : str
+        What to do with the final times whose solve exceeded the time or
+        iteration budget, see apply_budget_policy. Defaults to
+        config['budget_policy'] or 'infeasible'. Multi-start final times
+        are feasible if any start is, whatever the policy.
+    **job_kwargs : dict
+        Job specification (builder, stiffness, nfe, scheme).
+
+    Returns
+    -------
+    float, list
+        The smallest feasible final time found and the history of
+        (tf, feasible, objective) tuples.
+
+    """
+    from .multistart import run_multistart
+
+    if budget_policy is None:
+        budget_policy = config.get('budget_policy', 'infeasible')
+    history = []
+    n_points = max(n_jobs, 1) if n_starts <= 1 else 1
+    while (tf_max - tf_min) >= tol:
+        step = (tf_max - tf_min) / (n_points + 1)
+        tfs = [tf_min + (i + 1) * step for i in range(n_points)]
+        if n_starts > 1:
+            kwargs = dict(job_kwargs)
+            stiffness = kwargs.pop('stiffness', 'variable_stiffness')
+            best, spread = run_multistart(config,
+                                          tfs[0],
+                                          stiffness,
+                                          n_starts=n_starts,
+                                          n_jobs=n_jobs,
+                                          **kwargs)
+            feasible = [best is not None]
+            objectives = [spread['max']]
+        else:
+            jobs = [make_job(tf=tf, **job_kwargs) for tf in tfs]
+            outputs = run_jobs(jobs, config, n_jobs=n_jobs)
+            outputs = apply_budget_policy(outputs, jobs, config,
+                                          budget_policy, n_jobs)
+            feasible = [is_feasible(output) for output in outputs]
+            objectives = [output['obj_values'] for output in outputs]
+
+        for tf, objective, check in zip(tfs, objectives, feasible):
+            history.append((tf, check, objective))
+
+        # Shrink the interval around the first feasible point
+        if any(feasible):
+            index = feasible.index(True)
+            tf_max = tfs[index]
+            if index > 0:
+                tf_min = tfs[index - 1]
+        else:
+            tf_min = tfs[-1]
+
+    return tf_max, history
@@ -0,0 +1,365 @@
+from contextlib import contextmanager
+
+import numpy as np
+import pyomo.environ as pyo
+from pyomo.core.expr.calculus import diff_with_pyomo
+from pyomo.core.expr.calculus.derivatives import differentiate
+from pyomo.core.expr.current import cosh, identify_variables, sinh
+from pyomo.core.expr.numvalue import native_numeric_types
+
+from .pyomoio import get_duals, get_profiles
+
+SYMBOLIC = differentiate.Modes.reverse_symbolic
+NUMERIC = differentiate.Modes.reverse_numeric
+
+
+def _diff_sinh(node, val_dict, der_dict):
+    arg = node.args[0]
+    der_dict[arg] += der_dict[node] * cosh(val_dict[arg])
+
+
+def _diff_cosh(node, val_dict, der_dict):
+    arg = node.args[0]
+    der_dict[arg] += der_dict[node] * sinh(val_dict[arg])
+
+
+@contextmanager
+def _hyperbolic_rules():
+    """Differentiation rules of sinh and cosh while computing sensitivities.
+
+    The hammer dynamics use sinh, which pyomo differentiate does not know
+    (no rule in pyomo 5.6 to 6.9). The missing rules are added to its
+    private table of unary functions and removed again on exit, the rules
+    of a pyomo version which has them are kept.
+    """
+    unary_map = getattr(diff_with_pyomo, '_unary_map', {})
+    rules = {'sinh': _diff_sinh, 'cosh': _diff_cosh}
+    added = [name for name in rules if name not in unary_map]
+    for name in added:
+        unary_map[name] = rules[name]
+    try:
+        yield
+    finally:
+        for name in added:
+            unary_map.pop(name, None)
+
+
+def _derivatives(expr, wrt):
+    """Exact values of the derivatives of an expression (0 if constant)."""
+    if type(expr) in native_numeric_types or not wrt:
+        return np.zeros(len(wrt))
+    return np.array(differentiate(expr, wrt_list=wrt, mode=NUMERIC),
+                    dtype=float)
+
+
+def _free_variables(m, active_tol):
+    """Variables of a model which are not fixed and not at a bound."""
+    variables = []
+    for var in m.component_data_objects(pyo.Var, active=True):
+        if var.fixed or var.value is None:
+            continue
+        at_lower = var.lb is not None and var.value - var.lb <= active_tol
+        at_upper = var.ub is not None and var.ub - var.value <= active_tol
+        if not (at_lower or at_upper):
+            variables.append(var)
+    return variables
+
+
+def _is_active(c, active_tol):
+    if c.equality:
+        return True
+    body = pyo.value(c.body)
+    return ((c.lower is not None
+             and body - pyo.value(c.lower) <= active_tol)
+            or (c.upper is not None
+                and pyo.value(c.upper) - body <= active_tol))
+
+
+def _second_derivatives(gradient, variables, params):
+    """Hessian block and parameter derivatives of a symbolic gradient."""
+    rows = [_derivatives(g, variables + params) for g in gradient]
+    second = np.array(rows).reshape(len(gradient),
+                                    len(variables) + len(params))
+    return second[:, :len(variables)], second[:, len(variables):]
+
+
+def _add_block(triplets, index, block):
+    """Append the non zero entries of a dense block to sparse triplets."""
+    for a, b in zip(*np.nonzero(block)):
+        triplets[0].append(index[a])
+        triplets[1].append(index[b])
+        triplets[2].append(block[a, b])
+
+
+class ParametricSensitivity:
+    """First order sensitivity of a solved model to its mutable parameters.
+
+    The constraint duals (imported with run_optimization(..., duals=True))
+    give the objective sensitivity through the envelope theorem. The
+    trajectory sensitivities are obtained by one back-solve per parameter
+    with the factorised KKT matrix of the active set, in the style of
+    sIPOPT. Active inequalities are treated as equalities and variables at
+    their bounds as fixed, so the prediction is only valid while the
+    active set does not change.
+
+    The first derivatives are symbolic (pyomo differentiate), the second
+    derivatives and the parameter derivatives are the exact values of
+    their derivatives, so no finite difference step is involved.
+
+    Parameters
+    ----------
+    m : pyomo model
+        A solved model with a dual Suffix, e.g.
+        hammering.scaled_motion_model.
+    params : list
+        Names of the mutable parameters, e.g. ['tf', 'h_mass', 'x0[md]'].
+    active_tol : float
+        Tolerance on the slack of the active constraints and bounds.
+
+    """
+    def __init__(self, m, params, active_tol=1e-6):
+        self.m = m
+        self.params = [m.find_component(name) for name in params]
+        self.names = list(params)
+        self.values = np.array([p.value for p in self.params])
+        self.active_tol = active_tol
+        self.profiles = get_profiles(m)
+
+        objective = next(m.component_data_objects(pyo.Objective,
+                                                  active=True))
+        self.sense = 1.0 if objective.sense == pyo.minimize else -1.0
+        self.objective = pyo.value(objective)
+
+        self.variables = _free_variables(m, active_tol)
+        self._position = {id(var): i for i, var in enumerate(self.variables)}
+        with _hyperbolic_rules():
+            self._compute(objective)
+
+    def _compute(self, objective):
+        """Duals, trajectory and objective sensitivities at the solution."""
+        rows, J, jac_p, lambdas = self._active_jacobian(self.active_tol)
+        obj_vars, obj_gradient = self._gradient(objective.expr)
+
+        # Sign of the duals such that grad(f) = J' lambda on the free vars
+        grad_f = np.zeros(len(self.variables))
+        grad_f[self._index(obj_vars)] = self.sense * np.array(
+            [pyo.value(g) for g in obj_gradient], dtype=float)
+        residual = [
+            np.linalg.norm(grad_f - sign * J.T.dot(lambdas))
+            for sign in (1.0, -1.0)
+        ]
+        lambdas = lambdas * (1.0 if residual[0] <= residual[1] else -1.0)
+        self.duals = lambdas
+        self.grad_f = grad_f
+
+        rows.append((obj_vars, obj_gradient, -self.sense))
+        W, hess_p = self._lagrangian_hessian(rows, np.append(lambdas, 1.0))
+        self.dx, self.dlambda = self._solve_kkt(W, J, hess_p, jac_p)
+
+        # Envelope theorem: dJ/dp = dL/dp = df/dp - lambda' c_p
+        f_p = _derivatives(objective.expr, self.params)
+        self.dobjective = f_p - self.sense * lambdas.dot(jac_p)
+        # The same from the trajectory sensitivities (as a check)
+        self.dobjective_kkt = f_p + self.sense * grad_f.dot(self.dx)
+
+    def _index(self, variables):
+        return [self._position[id(var)] for var in variables]
+
+    def _gradient(self, expr):
+        """Free variables of an expression and its symbolic gradient."""
+        variables = [
+            var for var in identify_variables(expr, include_fixed=False)
+            if id(var) in self._position
+        ]
+        return variables, differentiate(expr,
+                                        wrt_list=variables,
+                                        mode=SYMBOLIC)
+
+    def _active_jacobian(self, active_tol):
+        """Jacobian of the active constraints and their duals.
+
+        Returns
+        -------
+        list, sparse matrix, array, array
+            The (variables, symbolic gradient, 1) of every active
+            constraint, the jacobian, the derivative of the residuals
+            (body - bound) with respect to the parameters and the duals.
+
+        """
+        from scipy import sparse
+
+        # Bulk import of the duals of all the constraints
+        constraints, duals = get_duals(self.m)
+        rows, lambdas, jac, jac_p = [], [], ([], [], []), []
+        for c, dual in zip(constraints, duals):
+            if not _is_active(c, active_tol):
+                continue
+            cvars, gradient = self._gradient(c.body)
+            for var, value in zip(cvars, gradient):
+                jac[0].append(len(rows))
+                jac[1].append(self._position[id(var)])
+                jac[2].append(pyo.value(value))
+            bound = c.upper if c.upper is not None else c.lower
+            jac_p.append(_derivatives(c.body - bound, self.params))
+            rows.append((cvars, gradient, 1.0))
+            lambdas.append(dual)
+        J = sparse.csr_matrix(jac[2:] + (jac[:2], ),
+                              shape=(len(rows), len(self.variables)))
+        jac_p = np.array(jac_p).reshape(len(rows), len(self.params))
+
+        return rows, J, jac_p, np.array(lambdas, dtype=float)
+
+    def _lagrangian_hessian(self, rows, lambdas):
+        """Hessian of L = f - lambda' c and the parameter derivative of its
+        gradient, the objective is the last row with its sign."""
+        from scipy import sparse
+
+        n = len(self.variables)
+        hess = ([], [], [])
+        hess_p = np.zeros((n, len(self.params)))
+        for (cvars, gradient, sign), lam in zip(rows, lambdas):
+            if lam == 0 or not cvars:
+                continue
+            H, H_p = _second_derivatives(gradient, cvars, self.params)
+            index = self._index(cvars)
+            _add_block(hess, index, -sign * lam * H)
+            # Linear constraints can still have parametric coefficients
+            hess_p[index] -= sign * lam * H_p
+
+        return sparse.csr_matrix(hess[2:] + (hess[:2], ), shape=(n, n)), hess_p
+
+    def _solve_kkt(self, W, J, hess_p, jac_p):
+        """KKT back-solve: [W -J'; J 0] [dx; dlambda] = -[W_p; c_p]"""
+        from scipy import sparse
+        from scipy.sparse.linalg import splu
+
+        n = len(self.variables)
+        kkt = sparse.bmat([[W, -J.T], [J, None]], format='csc')
+        rhs = -np.vstack([hess_p, jac_p])
+        try:
+            solution = splu(kkt).solve(rhs)
+        except RuntimeError:
+            # Singular (degenerate) active set, use the least squares one
+            solution = np.linalg.lstsq(kkt.toarray(), rhs, rcond=None)[0]
+        return solution[:n], solution[n:]
+
+    def gradient(self):
+        """Objective sensitivity of every parameter."""
+        return dict(zip(self.names, self.dobjective))
+
+    def trajectory_sensitivity(self, name):
+        """Derivative of the trajectories with respect to a parameter.
+
+        Parameters
+        ----------
+        name : str
+            Name of the parameter.
+
+        Returns
+        -------
+        dataframe
+            Same layout as the optimal values, with the derivatives (0 for
+            the variables held at their bounds) and the time (s).
+
+        """
+        k = self.names.index(name)
+        values = {id(v): d for v, d in zip(self.variables, self.dx[:, k])}
+        df = self.profiles.copy()
+        for var in self.m.component_objects(pyo.Var, active=True):
+            if str(var) in df.columns:
+                df[str(var)] = [
+                    values.get(id(var[t]), 0.0) for t in self.m.time
+                ]
+        df['time'] = self._time(np.zeros(len(self.names)))
+        return df
+
+    def predict(self, values):
+        """First order prediction for nearby parameter values.
+
+        Parameters
+        ----------
+        values : dict
+            New values of (some of) the parameters.
+
+        Returns
+        -------
+        float, dataframe
+            The predicted objective and optimal values.
+
+        """
+        delta = np.array([
+            values.get(name, value) - value
+            for name, value in zip(self.names, self.values)
+        ])
+        objective = self.objective + self.dobjective.dot(delta)
+
+        df = self.profiles.copy()
+        for k, name in enumerate(self.names):
+            if delta[k] == 0:
+                continue
+            derivative = self.trajectory_sensitivity(name)
+            for column in df.columns:
+                if column != 'time':
+                    df[column] = df[column].astype(float) + delta[
+                        k] * derivative[column].astype(float)
+
+        df['time'] = self._time(delta)
+        return objective, df
+
+    def _time(self, delta):
+        """Time of the profiles after a change of the parameters.
+
+        The scaled models are solved over the normalised time, scaled by
+        their final time (a parameter of the model).
+        """
+        time = self.profiles['time'].astype(float)
+        if not isinstance(self.m.component('tf'), pyo.Param):
+            return time
+        if 'tf' not in self.names:
+            return time * pyo.value(self.m.tf)
+        k = self.names.index('tf')
+        return time * (self.values[k] + delta[k])
+
+
+def hammering_sensitivity(config,
+                          stiffness,
+                          tf,
+                          params=('tf', 'h_mass', 'path_length'),
+                          nfe=100,
+                          scheme='BACKWARD',
+                          initial_values=None):
+    """Solve the scaled hammering model once and compute its sensitivities.
+
+    Parameters
+    ----------
+    config : yaml
+        The configuration file for the simulation
+    stiffness : str
+        Stiffness of springs used for simulation
+    tf : float
+        Final time.
+    params : list
+        Mutable parameters of hammering.scaled_motion_model.
+    nfe : int
+        Number of finite elements.
+    scheme : str
+        Finite difference scheme.
+    initial_values : dataframe
+        Optimal values of a similar problem used as the initial point.
+
+    Returns
+    -------
+    ParametricSensitivity
+        The sensitivities around the solution.
+
+    """
+    from .hammering import scaled_motion_model
+    from .optimize import run_optimization
+
+    model = scaled_motion_model(tf, stiffness, config)
+    m, optimal_values, solution = run_optimization(
+        model, nfe, scheme=scheme, initial_values=initial_values, duals=True)
+    sensitivity = ParametricSensitivity(m, list(params))
+    sensitivity.solver_status = solution.solver.termination_condition
+
+    return sensitivity
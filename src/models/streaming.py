@@ -0,0 +1,257 @@
+import asyncio
+import struct
+import time
+
+import numpy as np
+
+# Stream header: magic, number of frames and rate (Hz)
+HEADER = struct.Struct('<4sIf')
+MAGIC = b'DMSP'
+# One frame per tick: sequence number, time (s), bd and md setpoints (m)
+FRAME = struct.Struct('<Ifff')
+
+
+def load_setpoints(path, rate=1000.0):
+    """Setpoints of a solved or resampled trajectory.
+
+    Parameters
+    ----------
+    path : str
+        A model log (.pkl), resampled to the rate, or a setpoint file
+        (.bin) written by resample.save_setpoints.
+    rate : float
+        Controller rate (Hz), used for the model logs.
+
+    Returns
+    -------
+    array, array, array
+        time, bd and md.
+
+    """
+    if str(path).endswith('.bin'):
+        from .resample import read_setpoints
+        records = read_setpoints(path)
+        return records['time'], records['bd'], records['md']
+
+    from .resample import resample_trajectories
+    from .utils import read_model_log
+    setpoints = resample_trajectories(
+        read_model_log(str(path))['optimal_values'], rate)
+    return (setpoints['time'].values, setpoints['bd'].values,
+            setpoints['md'].values)
+
+
+def pack_frames(time, bd, md):
+    """Preallocate all the frames of a trajectory in one buffer."""
+    buffer = bytearray(FRAME.size * len(time))
+    for i, values in enumerate(zip(time, bd, md)):
+        FRAME.pack_into(buffer, i * FRAME.size, i, *values)
+    return memoryview(buffer)
+
+
+def jitter_stats(errors):
+    """Percentiles of timing errors (s) in microseconds."""
+    errors = np.abs(np.asarray(errors)) * 1e6
+    if len(errors) == 0:
+        return {}
+    return {
+        'n': len(errors),
+        'p50': float(np.percentile(errors, 50)),
+        'p90': float(np.percentile(errors, 90)),
+        'p99': float(np.percentile(errors, 99)),
+        'max': float(errors.max()),
+    }
+
+
+class SetpointServer:
+    """Stream setpoint frames to the connected clients at a fixed rate.
+
+    A single ticker sends the next frame of every client at the absolute
+    deadlines t0 + k / rate. It sleeps until shortly before a deadline and
+    spins for the rest (yielding to the event loop at every turn), so the
+    send times do not drift and the jitter is not limited by the event loop
+    timer resolution. It waits without ticking while no client is
+    connected (t0 is then the next connection). Every client receives the
+    whole trajectory from its first tick; slow clients whose send buffer
+    fills up are dropped.
+
+    Parameters
+    ----------
+    frames : memoryview
+        Frames from pack_frames.
+    rate : float
+        Streaming rate (Hz).
+    spin : float
+        Time before the deadline spent spinning instead of sleeping (s).
+    max_buffer : int
+        Send buffer size (bytes) above which a client is dropped.
+
+    """
+    def __init__(self, frames, rate, spin=1e-3, max_buffer=1 << 20):
+        self.frames = frames
+        self.n_frames = len(frames) // FRAME.size
+        self.rate = rate
+        self.spin = spin
+        self.max_buffer = max_buffer
+        self.clients = {}  # writer -> index of the next frame
+        self.lateness = []  # send time minus deadline of every tick
+        self.dropped = 0
+        self.server = None
+        self._ticker = None
+        self._client_connected = None
+
+    async def _connected(self, reader, writer):
+        writer.write(HEADER.pack(MAGIC, self.n_frames, self.rate))
+        self.clients[writer] = 0
+        self._client_connected.set()
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Listen for clients and start the ticker, returns the port."""
+        # Created in the loop of the server (python < 3.10 binds it)
+        self._client_connected = asyncio.Event()
+        self.server = await asyncio.start_server(self._connected, host, port)
+        self._ticker = asyncio.ensure_future(self._tick())
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _tick(self):
+        loop = asyncio.get_event_loop()
+        period = 1.0 / self.rate
+        deadline = loop.time()
+        size = FRAME.size
+        while True:
+            if not self.clients:
+                self._client_connected.clear()
+                await self._client_connected.wait()
+                deadline = loop.time()
+            deadline += period
+            delay = deadline - loop.time() - self.spin
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                # Let the connections be served even when running late
+                await asyncio.sleep(0)
+            while loop.time() < deadline:
+                await asyncio.sleep(0)
+            if not self.clients:
+                continue
+            self.lateness.append(loop.time() - deadline)
+            for writer, index in list(self.clients.items()):
+                if writer.is_closing():
+                    del self.clients[writer]
+                    continue
+                if writer.transport.get_write_buffer_size() > self.max_buffer:
+                    self.dropped += 1
+                    self._close(writer)
+                    continue
+                writer.write(self.frames[index * size:(index + 1) * size])
+                if index + 1 == self.n_frames:
+                    self._close(writer)
+                else:
+                    self.clients[writer] = index + 1
+
+    def _close(self, writer):
+        del self.clients[writer]
+        writer.close()
+
+    async def stop(self):
+        self._ticker.cancel()
+        for writer in list(self.clients):
+            self._close(writer)
+        self.server.close()
+        await self.server.wait_closed()
+
+    def stats(self):
+        """Send time jitter (lateness to the deadlines) in microseconds."""
+        return {**jitter_stats(self.lateness), 'dropped': self.dropped}
+
+
+async def receive_setpoints(host, port):
+    """Stand-in for the robot controller: receive a whole stream.
+
+    Parameters
+    ----------
+    host : str
+        Address of the server.
+    port : int
+        Port of the server.
+
+    Returns
+    -------
+    array, dict
+        The received frames (seq, time, bd, md) and the jitter of the
+        arrival times relative to the rate in microseconds.
+
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    magic, n_frames, rate = HEADER.unpack(await reader.readexactly(
+        HEADER.size))
+    if magic != MAGIC:
+        raise ValueError('Not a setpoint stream')
+    frames = np.empty((n_frames, 4))
+    arrival = np.empty(n_frames)
+    for i in range(n_frames):
+        frames[i] = FRAME.unpack(await reader.readexactly(FRAME.size))
+        arrival[i] = time.perf_counter()
+    writer.close()
+
+    # Deviation of the inter-arrival times from the period
+    errors = np.diff(arrival) - 1.0 / rate
+    return frames, jitter_stats(errors)
+
+
+def _receive_process(port):
+    """Receive a stream in a separate process with its own event loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(receive_setpoints('127.0.0.1', port))
+    finally:
+        loop.close()
+
+
+async def _run_local(frames, rate, n_clients, spin):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    server = SetpointServer(frames, rate, spin=spin)
+    port = await server.start()
+    loop = asyncio.get_event_loop()
+    # The clients must not share the (spinning) event loop of the server
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(n_clients, mp_context=context) as executor:
+        results = await asyncio.gather(*[
+            loop.run_in_executor(executor, _receive_process, port)
+            for i in range(n_clients)
+        ])
+    await server.stop()
+    return server.stats(), results
+
+
+def run_local(frames, rate, n_clients=1, spin=1e-3):
+    """Stream to local stand-in clients and report the timing.
+
+    Every client runs in its own process, as the controller would.
+
+    Parameters
+    ----------
+    frames : memoryview
+        Frames from pack_frames.
+    rate : float
+        Streaming rate (Hz).
+    n_clients : int
+        Number of clients.
+    spin : float
+        See SetpointServer.
+
+    Returns
+    -------
+    dict, list
+        The server send jitter and the received frames and arrival jitter
+        of every client.
+
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(
+            _run_local(frames, rate, n_clients, spin))
+    finally:
+        loop.close()
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+from .batch import solve_job
+
+MANIFEST = 'sweep.json'
+# Jobs in these states are solved (again) by run_sweep
+TODO = ('pending', 'running', 'failed')
+
+
+def job_key(job):
+    """Identifier of a job specification, the same for equal specs."""
+    spec = json.dumps(job, sort_keys=True, default=str)
+    return hashlib.sha1(spec.encode()).hexdigest()[:12]
+
+
+def new_run_id():
+    """Unique identifier of a run: start time and a random suffix."""
+    return '{}-{}'.format(time.strftime('%Y%m%dT%H%M%S'), uuid.uuid4().hex[:6])
+
+
+def read_manifest(sweep_path):
+    """Manifest of a sweep, None if the sweep was never started."""
+    manifest_path = Path(sweep_path) / MANIFEST
+    if not manifest_path.is_file():
+        return None
+    with open(str(manifest_path)) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, sweep_path):
+    from utils import atomic_write
+
+    with atomic_write(Path(sweep_path) / MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=1, default=str)
+
+
+def solve_and_save(job, config, sweep_path, run_id):
+    """Solve a job and save its log, returns the summary of the result."""
+    from utils import save_model_log
+
+    output = solve_job(job, config)
+    path = save_model_log(output, str(sweep_path), run_id)
+    return {
+        'result': Path(path).name,
+        'solver_status': str(output['solver_status']),
+        'obj_values': float(output['obj_values'])
+    }
+
+
+def _finish(entry, summary=None, error=None):
+    entry['finished'] = time.time()
+    if error is None:
+        entry.update(summary)
+        entry['state'] = 'done'
+        entry['error'] = None
+    else:
+        entry['state'] = 'failed'
+        entry['error'] = repr(error)
+
+
+def _prepare_manifest(jobs, sweep_path, resume):
+    """Read or create the manifest, add the new jobs and start the todo.
+
+    Returns the manifest and its entries to solve, marked as running.
+    """
+    manifest = read_manifest(sweep_path)
+    if manifest is not None and not resume:
+        raise FileExistsError(
+            '{} already has a sweep, resume it or use another directory'.
+            format(sweep_path))
+    if manifest is None:
+        sweep_path.mkdir(parents=True, exist_ok=True)
+        manifest = {'created': time.time(), 'jobs': []}
+
+    known = {entry['key'] for entry in manifest['jobs']}
+    for job in jobs:
+        key = job_key(job)
+        if key not in known:
+            known.add(key)
+            manifest['jobs'].append({
+                'key': key,
+                'job': job,
+                'state': 'pending',
+                'attempts': 0
+            })
+
+    todo = []
+    for entry in manifest['jobs']:
+        if entry['state'] == 'done' and not (sweep_path /
+                                             entry['result']).is_file():
+            entry['state'] = 'pending'
+        if entry['state'] in TODO:
+            entry.update({
+                'state': 'running',
+                'run_id': new_run_id(),
+                'host': socket.gethostname(),
+                'pid': os.getpid(),
+                'started': time.time(),
+                'attempts': entry['attempts'] + 1
+            })
+            todo.append(entry)
+    write_manifest(manifest, sweep_path)
+
+    return manifest, todo
+
+
+def _run_serial(manifest, todo, config, sweep_path):
+    for entry in todo:
+        try:
+            summary = solve_and_save(entry['job'], config, sweep_path,
+                                     entry['run_id'])
+            _finish(entry, summary)
+        except Exception as error:
+            _finish(entry, error=error)
+        write_manifest(manifest, sweep_path)
+
+
+def _run_parallel(manifest, todo, config, sweep_path, n_jobs, history):
+    from .schedule import dispatch_order
+
+    order = dispatch_order([entry['job'] for entry in todo], config, history)
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(todo))) as pool:
+        running = {
+            pool.submit(solve_and_save, todo[i]['job'], config, sweep_path,
+                        todo[i]['run_id']): todo[i]
+            for i in order
+        }
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                entry = running.pop(future)
+                try:
+                    _finish(entry, future.result())
+                except Exception as error:
+                    _finish(entry, error=error)
+            write_manifest(manifest, sweep_path)
+
+
+def run_sweep(jobs,
+              config,
+              sweep_path,
+              n_jobs=1,
+              resume=False,
+              history=None):
+    """Solve a batch of jobs with a manifest, so the sweep can be resumed.
+
+    The manifest (sweep.json in sweep_path) records the specification,
+    state (pending, running, done or failed), attempts and result of every
+    job and is written atomically after every state change. Every result
+    is saved atomically as <model_name>-<run_id>.pkl with a unique run id.
+    When resumed, the done jobs whose result exists are skipped and the
+    pending, interrupted (still running in the manifest) and failed jobs
+    are solved again. Only the calling process writes the manifest, so a
+    sweep must not be resumed while it is still running. Parallel jobs are
+    dispatched longest first (see schedule.plan).
+
+    Parameters
+    ----------
+    jobs : list
+        A list of job specifications, added to the manifest if they are
+        not part of it yet.
+    config : yaml
+        The configuration file for the simulation
+    sweep_path : str
+        Directory of the manifest and the results.
+    n_jobs : int
+        Number of worker processes.
+    resume : bool
+        Continue the sweep of an existing manifest.
+    history : dataframe
+        Solve times of the result store (see schedule.read_history).
+
+    Returns
+    -------
+    dict
+        The manifest.
+
+    """
+    sweep_path = Path(sweep_path)
+    manifest, todo = _prepare_manifest(jobs, sweep_path, resume)
+    if n_jobs <= 1 or len(todo) <= 1:
+        _run_serial(manifest, todo, config, sweep_path)
+    else:
+        _run_parallel(manifest, todo, config, sweep_path, n_jobs, history)
+
+    return manifest
+
+
+def sweep_results(sweep_path):
+    """Model logs of the done jobs of a sweep, in the order of the jobs."""
+    from .utils import read_model_log
+
+    manifest = read_manifest(sweep_path) or {'jobs': []}
+    return [
+        read_model_log(str(Path(sweep_path) / entry['result']))
+        for entry in manifest['jobs'] if entry['state'] == 'done'
+    ]
@@ -1,7 +1,5 @@
-import os
 import pickle
 
-import pandas as pd
 from pathlib import Path
 
 
@@ -25,42 +23,177 @@ def read_model_log(read_path):
     return data
 
 
-def export_trajectory_data(config, stiffness, trajectories):
-    """Plots the optimal trajectories obtained from optimization
+def log_stiffness(read_path):
+    """Stiffness mode of a model log from its file name.
+
+    Logs are saved as <model_name>.pkl or, with a run id, as
+    <model_name>-<run_id>.pkl (see utils.save_model_log).
+
+    Parameters
+    ----------
+    read_path : str
+        Path of the model log.
+
+    Returns
+    -------
+    str
+        The model name of the log.
+
+    """
+    return Path(read_path).stem.split('-')[0]
+
+
+TRAJECTORIES = ['time', 'bd', 'bv', 'hd', 'hv', 'md', 'mv']
+EXPORT_FORMATS = ['csv', 'npz']
+
+
+def _read_export_record(save_path, name):
+    """Trajectories of every format exported from a log (json sidecar)."""
+    import json
+
+    path = Path(save_path) / (name + '.json')
+    if not path.is_file():
+        return {}
+    with open(str(path)) as f:
+        return json.load(f)
+
+
+def _up_to_date(fname, save_path, trajectories, formats):
+    """Whether the outputs of a log are newer and have the trajectories."""
+    record = _read_export_record(save_path, fname.stem)
+    mtime = fname.stat().st_mtime
+    for fmt in formats:
+        output = Path(save_path) / (fname.stem + '.' + fmt)
+        if record.get(fmt) != list(trajectories) or not output.is_file():
+            return False
+        if output.stat().st_mtime < mtime:
+            return False
+
+    return True
+
+
+def _export_log(args):
+    """Export the trajectories of one model log (in a worker process).
+
+    Returns the name of the outputs and the requested trajectories missing
+    from the log (nothing is written then).
+    """
+    import json
+
+    from utils import atomic_write, save_columns
+
+    read_path, save_path, trajectories, formats = args
+    data = read_model_log(read_path)
+    # Named after the log file, not data['model_name']: logs saved with a
+    # run id share their model name (see utils.save_model_log)
+    name = Path(read_path).stem
+    columns = data.get('optimal_values', {}).keys()
+    missing = [column for column in trajectories if column not in columns]
+    if missing:
+        return name, missing
+
+    df = data['optimal_values'][trajectories].dropna(how='any')
+    df = df.astype(float)
+    for fmt in formats:
+        path = str(Path(save_path) / (name + '.' + fmt))
+        if fmt == 'csv':
+            with atomic_write(path, 'w') as f:
+                df.to_csv(f, index=False)
+        else:
+            save_columns(path, df)
+    record = _read_export_record(save_path, name)
+    record.update({fmt: list(trajectories) for fmt in formats})
+    with atomic_write(str(Path(save_path) / (name + '.json')), 'w') as f:
+        json.dump(record, f)
+
+    return name, []
+
+
+def export_trajectory_data(config,
+                           stiffness=None,
+                           trajectories=TRAJECTORIES,
+                           read_paths=None,
+                           formats=('csv', ),
+                           n_jobs=1,
+                           force=False):
+    """Export the optimal trajectories of the model logs.
+
+    Every log is read once and written to one file per format, named
+    after the log file (<model_name>[-<run_id>].<fmt>), and a json sidecar
+    (<model_name>[-<run_id>].json) records the trajectories of every
+    format. Outputs newer than their log with the same trajectories are
+    skipped. Logs without the trajectories (e.g. of the car builder) are
+    reported and not written.
 
     Parameters
     ----------
     config : yaml
         The yaml configuration rate.
-    save_plot : boolean
-        To save the plot or not
+    stiffness : str or list
+        Stiffness modes to export, defaults to all the logs.
+    trajectories : list
+        Columns of the optimal values to export.
+    read_paths : list
+        Experiment directories (e.g. models/experiment_0), each exported to
+        a sub directory of trajectory_save_path with the same name. Defaults
+        to save_path, exported to trajectory_save_path directly.
+    formats : list
+        csv and/or npz (columnar numpy archive, see utils.read_columns).
+    n_jobs : int
+        Number of worker processes.
+    force : bool
+        Export even if the outputs are up to date.
 
     Returns
     -------
-    None
+    dict
+        The exported and skipped (up to date) logs and the missing
+        trajectories of the incompatible logs.
 
     """
-
-    read_path = Path(__file__).parents[2] / config['save_path']
-    fname = [str(f) for f in read_path.iterdir() if f.suffix == '.pkl']
-    fname.sort()
-    columns = ['time', 'bd', 'bv', 'hd', 'hv', 'md', 'mv']
-    aggregate_df = pd.DataFrame(columns=trajectories)
-    for i, item in enumerate(fname):
-        data = read_model_log(item)
-        temp = data['optimal_values'][columns].copy()
-        temp['stiffness'] = config['stiffness'][i]
-        aggregate_df = pd.concat([aggregate_df, temp],
-                                 ignore_index=True,
-                                 sort=False)
-
-    aggregate_df.dropna(how='any', inplace=True)
-    df = aggregate_df[aggregate_df['stiffness'] == stiffness]
-    df = df[trajectories]
-
-    save_path = Path(__file__).parents[2] / config['trajectory_save_path']
-    if not os.path.isdir(save_path):
-        os.mkdir(save_path)
-    df.to_csv(str(save_path) + '/' + stiffness + '.csv', index=False)
-
-    return None
+    from concurrent.futures import ProcessPoolExecutor
+
+    root = Path(__file__).parents[2]
+    trajectory_path = root / config['trajectory_save_path']
+    if read_paths is None:
+        targets = [(root / config['save_path'], trajectory_path)]
+    else:
+        targets = [(root / path, trajectory_path / Path(path).name)
+                   for path in read_paths]
+    if isinstance(stiffness, str):
+        stiffness = [stiffness]
+    for fmt in formats:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError('Unknown format {}'.format(fmt))
+
+    # The outputs are named after the logs, so they can be checked without
+    # reading the logs
+    tasks, skipped = [], []
+    for read_path, save_path in targets:
+        for fname in sorted(read_path.glob('*.pkl')):
+            if stiffness and log_stiffness(fname) not in stiffness:
+                continue
+            if not force and _up_to_date(fname, save_path, trajectories,
+                                         formats):
+                skipped.append(str(fname))
+                continue
+            save_path.mkdir(parents=True, exist_ok=True)
+            tasks.append((str(fname), str(save_path), list(trajectories),
+                          list(formats)))
+
+    if n_jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_export_log, tasks))
+    else:
+        results = [_export_log(task) for task in tasks]
+    exported = [name for name, missing in results if not missing]
+    incompatible = {
+        task[0]: missing
+        for task, (name, missing) in zip(tasks, results) if missing
+    }
+
+    return {
+        'exported': exported,
+        'skipped': skipped,
+        'incompatible': incompatible
+    }
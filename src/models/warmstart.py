@@ -0,0 +1,242 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils import atomic_write
+
+from .utils import read_model_log
+
+# Order of the entries of the parameter vector
+PARAMETERS = ['tf', 'w_min', 'w_max', 'h_mass', 'path_length', 'nfe']
+VARIABLES = ['bd', 'bv', 'ba', 'hd', 'hv', 'ha', 'md', 'mv']
+
+# Libraries already opened by this process, with the version of their
+# meta.json (written last by build_library)
+_LIBRARIES = {}
+
+
+def job_parameters(job, config):
+    """Parameter vector of a hammering job.
+
+    Parameters
+    ----------
+    job : dict
+        Job specification.
+    config : yaml
+        The configuration file for the simulation
+
+    Returns
+    -------
+    dict
+        tf, w_min, w_max, h_mass, path_length and nfe of the job.
+
+    """
+    from .hammering import stiffness_bounds
+
+    config = {**config, **job.get('overrides', {})}
+    w_min, w_max = stiffness_bounds(job['stiffness'], config)
+    return {
+        'tf': job['tf'],
+        'w_min': w_min,
+        'w_max': w_max,
+        'h_mass': config['h_mass'],
+        'path_length': config['path_length'],
+        'nfe': job['nfe'],
+    }
+
+
+def log_parameters(log, config):
+    """Parameter vector of a model log.
+
+    Logs written before the parameters were recorded are assumed to use the
+    configuration values, with tf and nfe taken from the optimal values.
+    """
+    if 'parameters' in log:
+        return log['parameters']
+    time = log['optimal_values']['time'].values.astype(float)
+    job = {
+        'tf': time[-1],
+        'nfe': len(time) - 1,
+        'stiffness': log['model_name']
+    }
+    return job_parameters(job, config)
+
+
+def is_hammering_log(log, config):
+    """Check if a model log holds a solution of the hammering problem.
+
+    Logs of other builders (e.g. car logs) have no parameter vector. Logs
+    without a job are hammering logs if they are named after a stiffness
+    mode of the configuration.
+
+    Parameters
+    ----------
+    log : dict
+        The model log.
+    config : yaml
+        The configuration file for the simulation
+
+    Returns
+    -------
+    bool
+        True if the log has the hammering builder and trajectories.
+
+    """
+    if 'optimal_values' not in log:
+        return False
+    if 'job' in log:
+        hammering = log['job'].get('builder') != 'car'
+    else:
+        hammering = log.get('model_name') in config['stiffness']
+    columns = log['optimal_values'].columns
+    return hammering and all(key in columns for key in ['time'] + VARIABLES)
+
+
+def build_library(read_paths, config, save_path, n_grid=101):
+    """Index the stored optimal values by their parameter vector.
+
+    Parameters
+    ----------
+    read_paths : list
+        Directories with model logs (.pkl), e.g. models/experiment_0.
+    config : yaml
+        The configuration file for the simulation
+    save_path : str
+        Directory of the library (params.npy, profiles.npy, meta.json).
+    n_grid : int
+        Number of samples of the profiles over the normalised time.
+
+    Returns
+    -------
+    int
+        Number of solutions in the library, only the hammering logs are
+        indexed (see is_hammering_log).
+
+    """
+    tau = np.linspace(0, 1, n_grid)
+    params, profiles, sources = [], [], []
+    for read_path in read_paths:
+        for fname in sorted(Path(read_path).glob('*.pkl')):
+            log = read_model_log(str(fname))
+            if not is_hammering_log(log, config):
+                continue
+            df = log['optimal_values'].astype(float)
+            source = df['time'].values / df['time'].values[-1]
+            # Variables without values (e.g. a failed solve) are left as nan
+            profile = np.full((len(VARIABLES), n_grid), np.nan)
+            for i, key in enumerate(VARIABLES):
+                values = df[key].values
+                valid = ~np.isnan(values)
+                if valid.any():
+                    profile[i] = np.interp(tau, source[valid], values[valid])
+            parameters = log_parameters(log, config)
+            params.append([parameters[key] for key in PARAMETERS])
+            profiles.append(profile)
+            sources.append(str(fname))
+
+    save_path = Path(save_path)
+    save_path.mkdir(parents=True, exist_ok=True)
+    arrays = {
+        'params': np.array(params, dtype=float).reshape(-1, len(PARAMETERS)),
+        'profiles': np.array(profiles).reshape(-1, len(VARIABLES), n_grid),
+    }
+    for name, array in arrays.items():
+        with atomic_write(save_path / (name + '.npy')) as f:
+            np.save(f, array)
+    meta = {
+        'parameters': PARAMETERS,
+        'variables': VARIABLES,
+        'n_grid': n_grid,
+        'sources': sources
+    }
+    # Written last, a new meta.json tells get_library to open the library
+    # again
+    with atomic_write(save_path / 'meta.json', 'w') as f:
+        json.dump(meta, f, indent=1)
+
+    return len(params)
+
+
+class WarmStartLibrary:
+    """Nearest neighbour lookup of stored solutions.
+
+    The arrays are memory-mapped, so worker processes opening the same
+    library share the pages instead of copying them.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the library written by build_library.
+
+    """
+    def __init__(self, path):
+        from scipy.spatial import cKDTree
+
+        path = Path(path)
+        self.params = np.load(str(path / 'params.npy'), mmap_mode='r')
+        self.profiles = np.load(str(path / 'profiles.npy'), mmap_mode='r')
+        with open(str(path / 'meta.json')) as f:
+            self.meta = json.load(f)
+
+        # Scale the parameters so that all of them count alike
+        scale = np.std(self.params, axis=0) if len(self.params) else 1.0
+        self.scale = np.where(scale > 0, scale, 1.0)
+        self.tree = cKDTree(self.params / self.scale) if len(
+            self.params) else None
+
+    def initial_values(self, parameters, k=4):
+        """Interpolate the closest stored solutions.
+
+        Parameters
+        ----------
+        parameters : dict
+            Parameter vector of the new problem (see PARAMETERS).
+        k : int
+            Number of neighbours, weighted by their inverse distance.
+
+        Returns
+        -------
+        dataframe
+            The interpolated optimal values with a time column, or None if
+            the library is empty.
+
+        """
+        if self.tree is None:
+            return None
+        x = np.array([parameters[key] for key in PARAMETERS]) / self.scale
+        k = min(k, len(self.params))
+        distance, index = self.tree.query(x, k=k)
+        distance, index = np.atleast_1d(distance), np.atleast_1d(index)
+        if distance[0] == 0:
+            weights = np.array([1.0])
+            index = index[:1]
+        else:
+            weights = 1 / distance
+        weights = weights / weights.sum()
+        # Variables without values have nan profiles, every variable is
+        # blended from the neighbours which have it
+        profiles = np.asarray(self.profiles[index])
+        valid = ~np.isnan(profiles)
+        total = np.tensordot(weights, valid, axes=1)
+        profile = np.tensordot(weights, np.where(valid, profiles, 0.0),
+                               axes=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            profile = np.where(total > 0, profile / total, np.nan)
+
+        tau = np.linspace(0, 1, self.meta['n_grid'])
+        df = pd.DataFrame(profile.T, columns=self.meta['variables'])
+        df.insert(0, 'time', tau * parameters['tf'])
+
+        return df
+
+
+def get_library(path):
+    """Open a library once per process, again once it is rebuilt."""
+    path = str(path)
+    stat = (Path(path) / 'meta.json').stat()
+    version = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    if path not in _LIBRARIES or _LIBRARIES[path][0] != version:
+        _LIBRARIES[path] = (version, WarmStartLibrary(path))
+    return _LIBRARIES[path][1]
@@ -0,0 +1,334 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from utils import atomic_write
+
+from .sweep import job_key, new_run_id, solve_and_save
+
+# One directory per job state, a job is a json file moved between them
+STATES = ['pending', 'claimed', 'done', 'failed']
+
+
+def _write_json(path, content):
+    with atomic_write(path, 'w') as f:
+        json.dump(content, f, indent=1, default=str)
+
+
+def _read_json(path):
+    with open(str(path)) as f:
+        return json.load(f)
+
+
+def _key(path):
+    """Job key of a job file (claimed files also carry the worker id)."""
+    return path.name.split('.')[0]
+
+
+def make_queue(queue_path):
+    """Create the directories of a queue, returns its path."""
+    queue_path = Path(queue_path)
+    for state in STATES + ['results', 'tmp']:
+        (queue_path / state).mkdir(parents=True, exist_ok=True)
+    return queue_path
+
+
+def enqueue(jobs, queue_path):
+    """Add jobs to the queue, skipping the ones already in it.
+
+    Parameters
+    ----------
+    jobs : list
+        A list of job specifications.
+    queue_path : str
+        Directory of the queue, on a filesystem shared by the workers.
+
+    Returns
+    -------
+    list
+        The keys of the added jobs.
+
+    """
+    queue_path = make_queue(queue_path)
+    known = {_key(path) for state in STATES
+             for path in (queue_path / state).glob('*.json')}
+    added = []
+    for job in jobs:
+        key = job_key(job)
+        if key in known:
+            continue
+        known.add(key)
+        _write_json(queue_path / 'pending' / (key + '.json'), {
+            'key': key,
+            'job': job,
+            'attempts': 0,
+            'enqueued': time.time()
+        })
+        added.append(key)
+
+    return added
+
+
+def claim(queue_path, worker_id):
+    """Claim the oldest pending job.
+
+    The job file is renamed from pending to claimed, which is atomic on a
+    shared POSIX filesystem: when several workers try to claim the same
+    job, only one rename succeeds and the others try the next job.
+
+    Parameters
+    ----------
+    queue_path : str
+        Directory of the queue.
+    worker_id : str
+        Identifier of the claiming worker.
+
+    Returns
+    -------
+    Path
+        The claimed job file, None if there is no pending job.
+
+    """
+    queue_path = Path(queue_path)
+    pending = sorted((queue_path / 'pending').glob('*.json'),
+                     key=lambda path: path.name)
+    for path in pending:
+        claimed = queue_path / 'claimed' / '{}.{}.json'.format(
+            _key(path), worker_id)
+        try:
+            # The mtime of the claimed file is the heartbeat of the worker,
+            # touched first so the job is never claimed and already stale
+            os.utime(str(path))
+            os.rename(str(path), str(claimed))
+        except FileNotFoundError:
+            continue  # claimed by another worker
+        return claimed
+
+    return None
+
+
+class Heartbeat:
+    """Touch a claimed job file periodically from a background thread.
+
+    Parameters
+    ----------
+    path : Path
+        The claimed job file.
+    interval : float
+        Time between two heartbeats (s).
+
+    """
+    def __init__(self, path, interval=10.0):
+        self.path = path
+        self.interval = interval
+        self.lost = False  # the job was requeued by another process
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                os.utime(str(self.path))
+            except FileNotFoundError:
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+
+def requeue_stale(queue_path, timeout=60.0, max_attempts=3):
+    """Move the jobs of dead workers back to pending.
+
+    A claimed job is stale when its file was not touched for timeout
+    seconds. The timeout should be several heartbeat intervals plus the
+    clock difference between the nodes. Jobs which were already claimed
+    max_attempts times are moved to failed instead.
+
+    Parameters
+    ----------
+    queue_path : str
+        Directory of the queue.
+    timeout : float
+        Heartbeat age (s) after which a job is requeued.
+    max_attempts : int
+        Number of claims after which a job is not requeued.
+
+    Returns
+    -------
+    int
+        Number of requeued (or failed) jobs.
+
+    """
+    queue_path = Path(queue_path)
+    count = 0
+    for path in (queue_path / 'claimed').glob('*.json'):
+        try:
+            if time.time() - path.stat().st_mtime < timeout:
+                continue
+            # Take the job over atomically, another process may requeue it
+            temp_path = queue_path / 'tmp' / '{}.{}.json'.format(
+                _key(path), os.getpid())
+            os.rename(str(path), str(temp_path))
+        except FileNotFoundError:
+            continue
+        content = _read_json(temp_path)
+        content['attempts'] += 1
+        content['error'] = 'worker {} stopped heartbeating'.format(
+            path.name.split('.')[1])
+        state = 'failed' if content['attempts'] >= max_attempts else 'pending'
+        _write_json(queue_path / state / (content['key'] + '.json'), content)
+        os.remove(str(temp_path))
+        count += 1
+
+    return count
+
+
+def retry_failed(queue_path):
+    """Move the failed jobs back to pending, returns their number."""
+    queue_path = Path(queue_path)
+    count = 0
+    for path in (queue_path / 'failed').glob('*.json'):
+        try:
+            os.rename(str(path), str(queue_path / 'pending' / path.name))
+        except FileNotFoundError:
+            continue
+        count += 1
+
+    return count
+
+
+def queue_status(queue_path):
+    """Number of jobs in every state of the queue."""
+    queue_path = Path(queue_path)
+    return {
+        state: len(list((queue_path / state).glob('*.json')))
+        for state in STATES
+    }
+
+
+def run_worker(queue_path,
+               config,
+               worker_id=None,
+               heartbeat=10.0,
+               timeout=60.0,
+               max_attempts=3,
+               poll=1.0,
+               wait=False):
+    """Solve the jobs of the queue until it is empty.
+
+    The results are saved atomically in the results directory of the
+    queue as <model_name>-<run_id>.pkl and the job file is moved to done
+    (or failed, with the error) once the result is saved. While idle, the
+    worker requeues the jobs of dead workers.
+
+    Parameters
+    ----------
+    queue_path : str
+        Directory of the queue.
+    config : yaml
+        The configuration file for the simulation
+    worker_id : str
+        Identifier of the worker, defaults to host-pid-random.
+    heartbeat : float
+        Heartbeat interval (s).
+    timeout : float
+        See requeue_stale.
+    max_attempts : int
+        See requeue_stale.
+    poll : float
+        Time between two looks at an empty queue (s).
+    wait : bool
+        Keep waiting for new jobs once the queue is empty.
+
+    Returns
+    -------
+    int
+        Number of jobs solved by this worker.
+
+    """
+    queue_path = make_queue(queue_path)
+    if worker_id is None:
+        worker_id = '{}-{}-{}'.format(socket.gethostname().replace('.', '_'),
+                                      os.getpid(),
+                                      uuid.uuid4().hex[:4])
+    solved = 0
+    while True:
+        path = claim(queue_path, worker_id)
+        if path is None:
+            requeue_stale(queue_path, timeout, max_attempts)
+            status = queue_status(queue_path)
+            if not wait and not status['pending'] and not status['claimed']:
+                return solved
+            time.sleep(poll)
+            continue
+
+        content = _read_json(path)
+        content.update({
+            'worker': worker_id,
+            'run_id': new_run_id(),
+            'attempts': content['attempts'] + 1,
+            'started': time.time()
+        })
+        with Heartbeat(path, heartbeat) as beat:
+            try:
+                content.update(
+                    solve_and_save(content['job'], config,
+                                   queue_path / 'results', content['run_id']))
+                state = 'done'
+                content['error'] = None
+            except Exception as error:
+                state = 'failed'
+                content['error'] = repr(error)
+        content['finished'] = time.time()
+        if beat.lost:
+            # Requeued meanwhile: the result is kept, the job solved again
+            continue
+        _write_json(queue_path / state / (content['key'] + '.json'), content)
+        try:
+            os.remove(str(path))
+        except FileNotFoundError:
+            pass
+        solved += state == 'done'
+
+
+def _worker_process(args):
+    queue_path, config, kwargs = args
+    return run_worker(queue_path, config, **kwargs)
+
+
+def run_local_workers(queue_path, config, n_workers=2, **kwargs):
+    """Run workers in local processes until the queue is empty.
+
+    Parameters
+    ----------
+    queue_path : str
+        Directory of the queue.
+    config : yaml
+        The configuration file for the simulation
+    n_workers : int
+        Number of worker processes.
+    **kwargs : dict
+        Options of run_worker.
+
+    Returns
+    -------
+    list
+        Number of jobs solved by every worker.
+
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        return list(
+            pool.map(_worker_process,
+                     [(str(queue_path), config, kwargs)] * n_workers))
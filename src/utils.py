@@ -1,8 +1,10 @@
 import os
 import sys
 import pickle
+import threading
 
-import deepdish as dd
+import yaml
+from pathlib import Path
 from contextlib import contextmanager
 
 
@@ -71,6 +73,7 @@ def save_dataset(path, dataset, save):
 
     """
     if save:
+        import deepdish as dd  # pulls in h5py/tables, so import on use
         dd.io.save(path, dataset)
 
     return None
@@ -115,10 +118,142 @@ def read_dataframe(path):
     return data
 
 
-def save_model_log(info, save_path):
-    if not os.path.isdir(save_path):
-        os.mkdir(save_path)
-    with open(save_path + '/' + info['model_name'] + '.pkl', 'wb') as f:
+@contextmanager
+def atomic_write(path, mode='wb'):
+    """Open a file which replaces path atomically once it is written.
+
+    The content goes to a temporary file next to path (unique for the
+    process and thread) which is moved over path when the block exits
+    without an error, so readers never see a partial file.
+
+    Parameters
+    ----------
+    path : str
+        Path of the file, its directory is created if needed.
+    mode : str
+        'wb' for binary content or 'w' for text.
+
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = '{}.{}.{}.tmp'.format(path, os.getpid(),
+                                      threading.get_ident())
+    try:
+        with open(temp_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, str(path))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def save_model_log(info, save_path, run_id=None):
+    """Save a model log atomically.
+
+    Parameters
+    ----------
+    info : dict
+        The model log, with a model_name.
+    save_path : str
+        Directory of the model logs.
+    run_id : str
+        If given, the log is saved as <model_name>-<run_id>.pkl so runs
+        with the same model name do not overwrite each other.
+
+    Returns
+    -------
+    str
+        Path of the saved log.
+
+    """
+    os.makedirs(save_path, exist_ok=True)
+    name = info['model_name']
+    if run_id is not None:
+        name = '{}-{}'.format(name, run_id)
+    path = os.path.join(save_path, name + '.pkl')
+    with atomic_write(path) as f:
         pickle.dump(info, f, pickle.HIGHEST_PROTOCOL)
 
+    return path
+
+
+def load_config(config_path=None, overrides=None):
+    """Read the configuration file and apply the overrides.
+
+    Parameters
+    ----------
+    config_path : str
+        Path to the yaml configuration, defaults to src/config.yml.
+    overrides : list
+        A list of 'key=value' strings, the value is parsed as yaml
+        e.g. ['h_mass=0.25', "stiffness=['low_stiffness']"]
+
+    Returns
+    -------
+    dict
+        The configuration.
+
+    """
+    if config_path is None:
+        config_path = Path(__file__).parents[1] / 'src/config.yml'
+    with open(str(config_path)) as f:
+        config = yaml.load(f, Loader=yaml.SafeLoader)
+
+    for item in overrides or []:
+        key, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError('Override should be key=value, got ' + item)
+        config[key.strip()] = yaml.load(value, Loader=yaml.SafeLoader)
+
+    return config
+
+
+def save_columns(path, dataframe):
+    """Save a dataframe as a columnar numpy archive (one array per column).
+
+    Parameters
+    ----------
+    path : str
+        Path of the .npz file.
+    dataframe : dataframe
+        The pandas dataframe to save.
+
+    """
+    import numpy as np
+
+    columns = {}
+    for column in dataframe.columns:
+        values = dataframe[column].values
+        if values.dtype == object:
+            values = values.astype(str)
+        columns[str(column)] = values
+    with atomic_write(path) as f:
+        np.savez(f, **columns)
+
     return None
+
+
+def read_columns(path, columns=None):
+    """Read a columnar numpy archive written by save_columns.
+
+    Parameters
+    ----------
+    path : str
+        Path of the .npz file.
+    columns : list
+        Columns to read, all of them if None.
+
+    Returns
+    -------
+    dataframe
+        A pandas dataframe with the columns.
+
+    """
+    import numpy as np
+    import pandas as pd
+
+    with np.load(str(path)) as data:
+        columns = columns or list(data.keys())
+        return pd.DataFrame({column: data[column] for column in columns})
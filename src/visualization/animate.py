@@ -0,0 +1,327 @@
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+# Positions drawn by the animation and the columns they are read from
+# (feature expressions, see expressions.compile_feature). bd is the
+# gripper, hd the hammer and md the magnets, hd and md relative to bd.
+COLUMNS = {'time': 'time', 'bd': 'bd', 'hd': 'hd', 'md': 'md'}
+# Same colors as plot_magnet_hammer_path
+COLORS = {'gripper': '#7F7F7F', 'magnet': '#3C5CA0', 'hammer': '#B53941'}
+FORMATS = ['gif', 'mp4']
+
+
+def load_run(path, columns=None):
+    """Positions of a solved or measured strike.
+
+    Parameters
+    ----------
+    path : str
+        A model log (.pkl, its optimal_values are used) or an experiment
+        csv file.
+    columns : dict
+        Expressions of the time, bd, hd and md columns, overriding COLUMNS
+        (e.g. {'md': 'Magnet_position', 'bd': '0'}).
+
+    Returns
+    -------
+    dict
+        The time and the positions as float arrays.
+
+    """
+    from .expressions import evaluate_features
+
+    path = Path(path)
+    if path.suffix == '.pkl':
+        from .utils import read_model_log
+        df = read_model_log(str(path))['optimal_values']
+    else:
+        from data.ingest import read_experiment
+        df = read_experiment(str(path))
+    columns = {**COLUMNS, **(columns or {})}
+    values = evaluate_features(df, list(columns.values()))
+
+    return {role: values[feature] for role, feature in columns.items()}
+
+
+def frame_times(time, fps=30, speed=1.0):
+    """Times of the frames of a run played at speed times real time."""
+    n_frames = int(np.floor((time[-1] - time[0]) * fps / speed)) + 1
+    return time[0] + np.arange(n_frames) * speed / fps
+
+
+def _scene(run, title, size=(6, 4), dpi=100):
+    """Figure of a run and its animated artists (preallocated).
+
+    The top axes show the gripper, the magnets and the hammer along the
+    strike direction, the bottom axes the hammer and magnet displacements
+    over time with a time cursor. Only the artists change between frames.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.patches import Rectangle
+
+    fig, (scene, traces) = plt.subplots(
+        nrows=2, figsize=size, dpi=dpi,
+        gridspec_kw={'height_ratios': [1, 1.6]})
+    fig.suptitle(title)
+
+    # Static part: the displacements over the whole strike
+    traces.plot(run['time'], run['hd'], color=COLORS['hammer'],
+                label='hammer position')
+    traces.plot(run['time'], run['md'], '--', color=COLORS['magnet'],
+                label='magnet position')
+    traces.plot(run['time'], -run['md'], '--', color=COLORS['magnet'])
+    traces.set_xlim(run['time'][0], run['time'][-1])
+    traces.set_xlabel('Time (s)')
+    traces.set_ylabel('Displacement (m)')
+    traces.legend(loc='upper left', fontsize=8)
+    traces.grid(alpha=0.3)
+
+    positions = np.concatenate([
+        run['bd'], run['bd'] + run['hd'], run['bd'] + run['md'],
+        run['bd'] - run['md']
+    ])
+    margin = 0.1 * max(np.ptp(positions), 1e-3)
+    width = margin / 2
+    scene.set_xlim(positions.min() - margin, positions.max() + margin)
+    scene.set_ylim(-1, 1)
+    scene.set_yticks([])
+    scene.set_xlabel('Position (m)')
+    scene.axhline(0, color='k', linewidth=0.5)
+
+    artists = {
+        'gripper': Rectangle((0, -0.8), width, 1.6,
+                             color=COLORS['gripper']),
+        'upper': Rectangle((0, 0.3), width / 2, 0.4, color=COLORS['magnet']),
+        'lower': Rectangle((0, -0.7), width / 2, 0.4,
+                           color=COLORS['magnet']),
+        'hammer': Rectangle((0, -0.25), width, 0.5, color=COLORS['hammer']),
+    }
+    for artist in artists.values():
+        scene.add_patch(artist)
+    artists['link'], = scene.plot([], [], color='k', linewidth=1)
+    artists['cursor'] = traces.axvline(run['time'][0], color='k',
+                                       linewidth=0.75)
+    artists['clock'] = scene.text(0.01, 0.85, '', transform=scene.transAxes,
+                                  fontsize=9)
+    for artist in artists.values():
+        artist.set_animated(True)
+    fig.tight_layout()
+
+    return fig, artists, width
+
+
+def render_frames(run, fps=30, speed=1.0, title='', size=(6, 4), dpi=100):
+    """Render the frames of a run with blitting.
+
+    The static background is drawn once, every frame restores it and only
+    draws the animated artists, so a frame costs a few artist draws.
+
+    Parameters
+    ----------
+    run : dict
+        Time and positions (see load_run).
+    fps : int
+        Frames per second of the video.
+    speed : float
+        Playback speed, 1 is real time.
+    title : str
+        Title of the animation.
+    size : tuple
+        Figure size (inches).
+    dpi : int
+        Resolution.
+
+    Yields
+    ------
+    array
+        The (height, width, 4) rgba buffer of every frame, only valid until
+        the next frame is rendered.
+
+    """
+    import matplotlib.pyplot as plt
+
+    fig, artists, width = _scene(run, title, size, dpi)
+    canvas = fig.canvas
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+
+    times = frame_times(run['time'], fps, speed)
+    positions = {
+        role: np.interp(times, run['time'], run[role])
+        for role in ['bd', 'hd', 'md']
+    }
+    try:
+        for i, t in enumerate(times):
+            bd, hd, md = (positions[role][i] for role in ['bd', 'hd', 'md'])
+            artists['gripper'].set_x(bd - width / 2)
+            artists['upper'].set_x(bd + md - width / 4)
+            artists['lower'].set_x(bd - md - width / 4)
+            artists['hammer'].set_x(bd + hd - width / 2)
+            artists['link'].set_data([bd, bd + hd], [0, 0])
+            artists['cursor'].set_xdata([t, t])
+            artists['clock'].set_text('t = {:.3f} s'.format(t))
+
+            canvas.restore_region(background)
+            for artist in artists.values():
+                fig.draw_artist(artist)
+            yield np.asarray(canvas.buffer_rgba())
+    finally:
+        plt.close(fig)
+
+
+def _write_mp4(frames, path, fps):
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError('ffmpeg is needed for mp4, export a gif instead')
+    process = None
+    n_frames = 0
+    for frame in frames:
+        if process is None:
+            height, width = frame.shape[:2]
+            process = subprocess.Popen([
+                ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo',
+                '-pix_fmt', 'rgba', '-s', '{}x{}'.format(width, height),
+                '-r', str(fps), '-i', '-', '-pix_fmt', 'yuv420p', '-vf',
+                'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-f', 'mp4', path
+            ], stdin=subprocess.PIPE)
+        process.stdin.write(frame.tobytes())
+        n_frames += 1
+    process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError('ffmpeg failed to write {}'.format(path))
+    return n_frames
+
+
+def _write_gif(frames, path, fps):
+    from PIL import Image
+
+    # One palette (from the first frame, which has all the artists) for
+    # all the frames, quantizing every frame on its own is slower
+    images, palette = [], None
+    for frame in frames:
+        image = Image.fromarray(frame[..., :3].copy())
+        if palette is None:
+            palette = image.quantize(colors=64, method=Image.FASTOCTREE)
+        images.append(image.quantize(palette=palette, dither=Image.NONE))
+    # gif frame durations are in hundredths of a second
+    images[0].save(path,
+                   format='GIF',
+                   save_all=True,
+                   append_images=images[1:],
+                   duration=int(round(100 / fps)) * 10,
+                   loop=0)
+    return len(images)
+
+
+def export_animation(run, path, fps=30, speed=1.0, title=''):
+    """Render a run and save it as a gif or an mp4 video (from the suffix).
+
+    Parameters
+    ----------
+    run : dict
+        Time and positions (see load_run).
+    path : str
+        Output file, .gif or .mp4 (needs ffmpeg). Written atomically.
+    fps : int
+        Frames per second of the video.
+    speed : float
+        Playback speed, 1 is real time.
+    title : str
+        Title of the animation.
+
+    Returns
+    -------
+    dict
+        The path, number of frames, duration of the video (s) and render
+        time (s), the render is faster than real time if it is smaller
+        than the duration times speed.
+
+    """
+    path = Path(path)
+    fmt = path.suffix.lstrip('.')
+    if fmt not in FORMATS:
+        raise ValueError('Unknown animation format {}'.format(fmt))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+
+    start = time.perf_counter()
+    frames = render_frames(run, fps, speed, title)
+    writer = _write_mp4 if fmt == 'mp4' else _write_gif
+    try:
+        n_frames = writer(frames, temp_path, fps)
+        os.replace(temp_path, str(path))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    return {
+        'path': str(path),
+        'frames': n_frames,
+        'duration': n_frames / fps,
+        'render_time': time.perf_counter() - start
+    }
+
+
+def _export(args):
+    """Load and export one run in a worker process."""
+    path, output, columns, fps, speed = args
+    try:
+        run = load_run(path, columns)
+        return export_animation(run, output, fps, speed,
+                                title=Path(path).stem.replace('_', ' '))
+    except Exception as error:
+        return {
+            'path': str(output),
+            'error': '{}: {}'.format(type(error).__name__, error)
+        }
+
+
+def animate_runs(paths,
+                 save_path,
+                 fmt='gif',
+                 fps=30,
+                 speed=1.0,
+                 columns=None,
+                 n_jobs=1):
+    """Export the animations of many runs in parallel processes.
+
+    Parameters
+    ----------
+    paths : list
+        Model logs (.pkl) and experiment csv files.
+    save_path : str
+        Directory of the animations, saved as <file name>.<fmt>.
+    fmt : str
+        gif or mp4.
+    fps : int
+        Frames per second of the videos.
+    speed : float
+        Playback speed, 1 is real time.
+    columns : dict
+        Column expressions (see load_run).
+    n_jobs : int
+        Number of worker processes.
+
+    Returns
+    -------
+    list
+        The result (see export_animation) or the error of every run.
+
+    """
+    from .pipeline import _use_agg
+
+    # The parent process keeps its backend, use Agg there for headless runs
+    tasks = [(str(path), str(Path(save_path) / (Path(path).stem + '.' + fmt)),
+              columns, fps, speed) for path in paths]
+    if n_jobs <= 1 or len(tasks) <= 1:
+        return [_export(task) for task in tasks]
+
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks)),
+                             initializer=_use_agg) as executor:
+        return list(executor.map(_export, tasks))
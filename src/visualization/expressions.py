@@ -0,0 +1,119 @@
+import ast
+import operator
+from functools import lru_cache
+
+import numpy as np
+
+# Operators and functions a feature expression may use
+BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+}
+UNARY = {ast.USub: operator.neg, ast.UAdd: operator.pos}
+FUNCTIONS = {
+    'abs': np.abs,
+    'sqrt': np.sqrt,
+    'exp': np.exp,
+    'log': np.log,
+    'sin': np.sin,
+    'cos': np.cos,
+}
+
+
+def _compile(node, names):
+    """Function of the column arrays evaluating an expression node."""
+    if isinstance(node, ast.Name):
+        names.append(node.id)
+        name = node.id
+        return lambda columns: columns[name]
+    if isinstance(node, ast.Constant) and isinstance(node.value,
+                                                     (int, float)):
+        value = float(node.value)
+        return lambda columns: value
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY:
+        op = BINARY[type(node.op)]
+        left, right = _compile(node.left, names), _compile(node.right, names)
+        return lambda columns: op(left(columns), right(columns))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY:
+        op = UNARY[type(node.op)]
+        operand = _compile(node.operand, names)
+        return lambda columns: op(operand(columns))
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and node.func.id in FUNCTIONS and len(node.args) == 1
+            and not node.keywords):
+        function = FUNCTIONS[node.func.id]
+        argument = _compile(node.args[0], names)
+        return lambda columns: function(argument(columns))
+    raise ValueError('Unsupported {} in a feature expression'.format(
+        type(node).__name__))
+
+
+@lru_cache(maxsize=None)
+def compile_feature(expression):
+    """Parse a feature expression once into a function of the columns.
+
+    An expression combines columns (e.g. 'bd + hd' or '-md') with numbers,
+    + - * / ** and the FUNCTIONS. Parsed expressions are cached.
+
+    Parameters
+    ----------
+    expression : str
+        The feature expression.
+
+    Returns
+    -------
+    tuple, function
+        The columns the expression uses and the function evaluating it
+        from a dict of column arrays.
+
+    """
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError as error:
+        raise ValueError('Invalid feature expression {!r}: {}'.format(
+            expression, error.msg))
+    names = []
+    function = _compile(tree.body, names)
+    return tuple(dict.fromkeys(names)), function
+
+
+def evaluate_features(df, features):
+    """Evaluate feature expressions over a dataframe, without changing it.
+
+    Every column is read once as an array and every expression is
+    evaluated over all the rows in one vectorized pass, so filter the
+    result (e.g. by stiffness) instead of evaluating every group.
+
+    Parameters
+    ----------
+    df : dataframe
+        A pandas dataframe with all the basic features as columns
+    features : list
+        Feature expressions, e.g. ['bd + hd', '-md'].
+
+    Returns
+    -------
+    dict
+        The float array of every expression.
+
+    """
+    compiled = {feature: compile_feature(feature) for feature in features}
+    columns = {}
+    for names, _ in compiled.values():
+        for name in names:
+            if name not in columns:
+                if name not in df:
+                    raise KeyError('Unknown column {!r} in features'.format(
+                        name))
+                columns[name] = np.asarray(df[name].values, dtype=float)
+
+    values = {}
+    for feature, (names, function) in compiled.items():
+        value = function(columns)
+        # A constant expression is broadcast to the rows
+        values[feature] = np.broadcast_to(value, len(df)).astype(float)
+
+    return values
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+FIGURES = [
+    'optimal_trajectories', 'hammer_magnet_path', 'hammer_magnet_external',
+    'simulation_trajectories', 'experiment_trajectories'
+]
+
+# Plotting parameters of the report figures
+OPTIMAL_FEATURES = {
+    'bd': 'end-effector displacement (m)',
+    'bd + hd': 'Hammer displacement (m)',
+    'bv + hv': 'Hammer velocity (m/s)',
+    'md': 'Magnet separation (m)'
+}
+SIMULATION_FEATURES = [{
+    'bd': 'Displacement (m)',
+    'bd + hd': 'Displacement (m)'
+}, {
+    'bv': 'Velocity (m/s)',
+    'bv + hv': 'Velocity (m/s)'
+}]
+
+CACHE_FILE = '.render_cache.json'
+
+
+def draw_figure(config, name, save_plot):
+    """Draw one of the report figures.
+
+    Parameters
+    ----------
+    config : yaml
+        The configuration file.
+    name : str
+        Name of the figure (see FIGURES).
+    save_plot : boolean
+        To save the plot or not
+
+    Returns
+    -------
+    None
+
+    """
+    import matplotlib.pyplot as plt
+    from . import visualize
+    from .utils import plot_settings
+
+    if name == 'optimal_trajectories':
+        visualize.plot_optimal_trajectories(config,
+                                            OPTIMAL_FEATURES,
+                                            save_plot=save_plot)
+    elif name == 'hammer_magnet_path':
+        visualize.plot_magnet_hammer_path(config, save_plot=save_plot)
+    elif name == 'hammer_magnet_external':
+        visualize.plot_magnet_hammer(config, save_plot=save_plot)
+    elif name == 'simulation_trajectories':
+        plot_settings()
+        fig, ax = plt.subplots(nrows=1, ncols=2, figsize=(8, 4))
+        for i, features in enumerate(SIMULATION_FEATURES):
+            visualize.plot_simulation_trajectories(config,
+                                                   features,
+                                                   ax[i],
+                                                   save_plot=save_plot)
+    elif name == 'experiment_trajectories':
+        plot_settings()
+        visualize.plot_experiment_trajectories(config, save_plot=save_plot)
+    else:
+        raise ValueError('Unknown figure {}'.format(name))
+
+    return None
+
+
+def figure_inputs(config, name):
+    """Data files read by a figure (same paths as the plot functions)."""
+    if name in ['optimal_trajectories', 'hammer_magnet_path']:
+        read_path = Path(__file__).parents[2] / config['save_path']
+        return sorted(read_path.glob('*.pkl'))
+    elif name == 'hammer_magnet_external':
+        # Missing paths are left to the plot function to report
+        return [
+            Path(config.get(key, '') + item + '.csv')
+            for key in ['input_data_path', 'output_data_path']
+            for item in
+            ['high_stiffness', 'low_stiffness', 'variable_stiffness']
+        ]
+    elif name == 'simulation_trajectories':
+        return [Path(config['data_path'] + 'variable_stiffness.csv')]
+    elif name == 'experiment_trajectories':
+        return [
+            Path(config['data_path'] + item + '.csv')
+            for item in ['displacement', 'velocity']
+        ]
+    raise ValueError('Unknown figure {}'.format(name))
+
+
+def figure_key(config, name):
+    """Hash of the input data and the plotting parameters of a figure."""
+    import matplotlib
+
+    key = hashlib.sha1()
+    parameters = {
+        'name': name,
+        'config': config,
+        'optimal_features': OPTIMAL_FEATURES,
+        'simulation_features': SIMULATION_FEATURES,
+        'matplotlib': matplotlib.__version__,
+    }
+    key.update(json.dumps(parameters, sort_keys=True, default=str).encode())
+    for path in figure_inputs(config, name):
+        key.update(str(path).encode())
+        if not path.is_file():
+            continue
+        with open(str(path), 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                key.update(chunk)
+
+    return key.hexdigest()
+
+
+def _use_agg():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _render(args):
+    """Render and save one figure in a worker process."""
+    config, name = args
+    import matplotlib.pyplot as plt
+    from . import utils
+
+    del utils.SAVED_FIGURES[:]
+    try:
+        draw_figure(config, name, save_plot=True)
+    except Exception as error:
+        return name, None, '{}: {}'.format(type(error).__name__, error)
+    finally:
+        plt.close('all')
+
+    # A figure may save the same file several times
+    return name, list(dict.fromkeys(utils.SAVED_FIGURES)), None
+
+
+def _check_outputs(cache, status):
+    """Drop the figures saving the same file from the cache.
+
+    Such figures overwrite each other, so none of them can be up to date.
+    """
+    owners = {}
+    for name, entry in cache.items():
+        for output in entry['outputs']:
+            owners.setdefault(output, []).append(name)
+    for output, names in owners.items():
+        if len(names) < 2:
+            continue
+        for name in names:
+            cache.pop(name, None)
+            status[name] = 'ValueError: {} is also saved by {}'.format(
+                output, ', '.join(other for other in names if other != name))
+
+
+def render_figures(config, names=None, n_jobs=1, force=False):
+    """Render the report figures with the Agg backend.
+
+    Independent figures are drawn in parallel worker processes. A figure
+    is skipped when the hash of its input data and plotting parameters
+    matches the previous render and its pdfs still exist. Figures saving
+    the same pdf are reported as errors and never cached.
+
+    Parameters
+    ----------
+    config : yaml
+        The configuration file.
+    names : list
+        Figures to render, defaults to all of FIGURES.
+    n_jobs : int
+        Number of worker processes.
+    force : bool
+        Render even if the figure is up to date.
+
+    Returns
+    -------
+    dict
+        Status (cached, rendered or the error) of every figure.
+
+    """
+    from utils import atomic_write
+
+    names = list(names or FIGURES)
+    save_path = Path(__file__).parents[2] / config['figure_save_path']
+    cache_path = save_path / CACHE_FILE
+    cache = {}
+    if cache_path.is_file():
+        with open(str(cache_path)) as f:
+            cache = json.load(f)
+
+    status, pending, keys = {}, [], {}
+    for name in names:
+        keys[name] = figure_key(config, name)
+        entry = cache.get(name, {})
+        up_to_date = (entry.get('key') == keys[name] and entry['outputs']
+                      and all(os.path.isfile(p) for p in entry['outputs']))
+        if up_to_date and not force:
+            status[name] = 'cached'
+        else:
+            pending.append(name)
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=max(1, min(n_jobs, len(pending))),
+                                 initializer=_use_agg) as executor:
+            tasks = [(config, name) for name in pending]
+            for name, outputs, error in executor.map(_render, tasks):
+                if error is not None:
+                    status[name] = error
+                    cache.pop(name, None)
+                else:
+                    status[name] = 'rendered'
+                    cache[name] = {'key': keys[name], 'outputs': outputs}
+
+        _check_outputs(cache, status)
+        with atomic_write(cache_path, 'w') as f:
+            json.dump(cache, f, indent=1, sort_keys=True)
+
+    return status
@@ -1,6 +1,12 @@
 import pickle
+from pathlib import Path
+
+import numpy as np
 import matplotlib.pyplot as plt
 
+# Figures written by save_figure since the last render (see pipeline.py)
+SAVED_FIGURES = []
+
 
 def read_dataframe(path):
     """Save the dataset.
@@ -41,6 +47,32 @@ def read_model_log(read_path):
     return data
 
 
+def save_figure(config, name):
+    """Save the current figure as a pdf in the figure folder.
+
+    Parameters
+    ----------
+    config : yaml
+        The configuration file.
+    name : str
+        Name of the figure (without the extension).
+
+    Returns
+    -------
+    str
+        Path of the saved figure.
+
+    """
+    save_path = Path(__file__).parents[2] / config['figure_save_path']
+    # If the folder does not exist create it
+    save_path.mkdir(parents=True, exist_ok=True)
+    path = str(save_path / (name + '.pdf'))
+    plt.savefig(path, bbox_inches='tight')
+    SAVED_FIGURES.append(path)
+
+    return path
+
+
 def figure_asthetics(ax, subplot):
     """Change the asthetics of the given figure (operators in place).
 
@@ -153,3 +185,77 @@ def fix_microseconds(timestamp):
     parts = timestamp.split(':')
 
     return ':'.join(parts[:-1] + ['{:06d}'.format(int(parts[-1]))])
+
+
+def _minmax_index(y, n_buckets):
+    """Indices of the minimum and maximum of equal size buckets."""
+    size = -(-len(y) // n_buckets)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:len(y)] = y
+    padded = padded.reshape(n_buckets, size)
+    offset = np.arange(n_buckets) * size
+    low = np.where(np.isnan(padded), np.inf, padded).argmin(axis=1)
+    high = np.where(np.isnan(padded), -np.inf, padded).argmax(axis=1)
+    index = np.concatenate([offset + low, offset + high, [0, len(y) - 1]])
+
+    return np.unique(np.minimum(index, len(y) - 1))
+
+
+def _lttb_index(x, y, n_out):
+    """Indices selected by largest triangle three buckets."""
+    n = len(y)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    # Average of every bucket, the next bucket average is the third vertex
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+
+    index = np.empty(n_out, dtype=int)
+    index[0], index[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        # Twice the triangle area with the last selected point
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[start:stop] - y[a]) -
+                      (x[a] - x[start:stop]) * (avg_y[i + 1] - y[a]))
+        a = start + int(np.nanargmax(area))
+        index[i + 1] = a
+
+    return index
+
+
+def downsample(x, y, max_points=5000, method='minmax'):
+    """Reduce a trace to a point budget keeping its shape.
+
+    Parameters
+    ----------
+    x : array
+        Time (increasing).
+    y : array
+        Values of the trace.
+    max_points : int
+        Maximum number of points to return, None to keep all of them.
+    method : str
+        minmax keeps the minimum and maximum of every bucket, so the impact
+        peaks are kept exactly. lttb (largest triangle three buckets) keeps
+        the visually most significant point of every bucket.
+
+    Returns
+    -------
+    array, array
+        The downsampled x and y.
+
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    if max_points is None or len(y) <= max_points or max_points < 3:
+        return x, y
+    if method == 'minmax':
+        index = _minmax_index(y, max_points // 2 - 1)
+    elif method == 'lttb':
+        index = _lttb_index(x, y, max_points)
+    else:
+        raise ValueError('Unknown method {}'.format(method))
+
+    return x[index], y[index]
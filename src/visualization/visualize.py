@@ -1,13 +1,12 @@
-import os
-from datetime import datetime
-
-import numpy as np
 import pandas as pd
 from pathlib import Path
 import matplotlib.pyplot as plt
 
+from data.ingest import read_experiment
+
+from .expressions import evaluate_features
 from .utils import (read_model_log, figure_asthetics, plot_settings,
-                    fix_microseconds)
+                    save_figure, downsample)
 
 
 def get_plot_data(df, feature):
@@ -17,9 +16,9 @@ def get_plot_data(df, feature):
     ----------
     df : dataframe
         A pandas dataframe with all the basic features as columns
-    feature : list
-        A list constainig the expresssion we want to extract
-        e.g. ['feature_1 + feature_2']
+    feature : str
+        The expresssion we want to extract e.g. 'feature_1 + feature_2'
+        (see expressions.compile_feature). The dataframe is not changed.
 
     Returns
     -------
@@ -27,8 +26,7 @@ def get_plot_data(df, feature):
         An array of the feature constructedf from the dataframe
     """
 
-    df.eval('result=' + feature, inplace=True)
-    data = df['result'].values
+    data = evaluate_features(df, [feature])[feature]
 
     return data
 
@@ -83,28 +81,31 @@ def plot_optimal_trajectories(config, features, save_plot):
     """
 
     aggregate_df = get_dataframe_dict(config)
+    # All the features of all the stiffness modes in one pass
+    values = evaluate_features(aggregate_df, list(features))
+    time = aggregate_df['time'].values.astype(float)
+    stiffness = aggregate_df['stiffness'].values
+    low = stiffness == 'low_stiffness'
+    high = stiffness == 'high_stiffness'
+    variable = stiffness == 'variable_stiffness'
 
     # Global plot settings
     plot_settings()
     for key, value in features.items():
 
         fig, ax = plt.subplots()
-        df_low = aggregate_df[aggregate_df['stiffness'] == 'low_stiffness']
-        ax.plot(df_low['time'].values,
-                get_plot_data(df_low, key),
+        ax.plot(time[low],
+                values[key][low],
                 label='low stiffness',
                 color='#469B55')
 
-        df_high = aggregate_df[aggregate_df['stiffness'] == 'high_stiffness']
-        ax.plot(df_high['time'].values,
-                get_plot_data(df_high, key),
+        ax.plot(time[high],
+                values[key][high],
                 label='high stiffness',
                 color='#3C5CA0')
 
-        df_variable = aggregate_df[aggregate_df['stiffness'] ==
-                                   'variable_stiffness']
-        ax.plot(df_variable['time'].values,
-                get_plot_data(df_variable, key),
+        ax.plot(time[variable],
+                values[key][variable],
                 label='variable stiffness',
                 color='#B53941')
         # Asthetics
@@ -118,12 +119,7 @@ def plot_optimal_trajectories(config, features, save_plot):
         if save_plot:
             name = value.lower().replace(" ", "-")
             name = name.replace("/", " ")
-            path = str(Path(__file__).parents[2] /
-                       config['figure_save_path']) + '/' + name + '.pdf'
-            # If the folder does not exist create it
-            if not os.path.isdir(config['figure_save_path']):
-                os.mkdir(config['figure_save_path'])
-            plt.savefig(path, bbox_inches='tight')
+            save_figure(config, name)
 
     return None
 
@@ -136,6 +132,8 @@ def plot_magnet_hammer_path(config, save_plot):
     stiffness = ['low_stiffness', 'high_stiffness', 'variable_stiffness']
     colors = ['#469B55', '#3C5CA0', '#B53941']
     features = ['md', 'hd', '-md']
+    values = evaluate_features(aggregate_df, features)
+    time = aggregate_df['time'].values.astype(float)
 
     # Global plot settings
     plot_settings()
@@ -143,14 +141,14 @@ def plot_magnet_hammer_path(config, save_plot):
 
     for i, item in enumerate(stiffness):
 
-        df = aggregate_df[aggregate_df['stiffness'] == item]
+        group = aggregate_df['stiffness'].values == item
         for feature in features:
             if feature == 'hd':
                 linestyle = '-'
             else:
                 linestyle = '--'
-            ax[i].plot(df['time'].values,
-                       get_plot_data(df, feature),
+            ax[i].plot(time[group],
+                       values[feature][group],
                        color=colors[i],
                        linestyle=linestyle)
 
@@ -165,19 +163,26 @@ def plot_magnet_hammer_path(config, save_plot):
         plt.tight_layout(pad=0.4, w_pad=0.5, h_pad=1.0)
 
         if save_plot:
-            name = item.lower().replace(" ",
-                                        "-") + "_hammer_magnet_displacement"
-            path = str(Path(__file__).parents[2] /
-                       config['figure_save_path']) + '/' + name + '.pdf'
-            # If the folder does not exist create it
-            if not os.path.isdir(config['figure_save_path']):
-                os.mkdir(config['figure_save_path'])
-            plt.savefig(path, bbox_inches='tight')
+            name = item.lower().replace(" ", "-") + "_hammer_magnet_path"
+            save_figure(config, name)
 
     return None
 
 
-def plot_magnet_hammer(config, save_plot):
+def plot_magnet_hammer(config, save_plot, max_points=5000):
+    """Plot the measured hammer and magnet positions.
+
+    Parameters
+    ----------
+    config : yaml
+        The yaml configuration rate.
+    save_plot : boolean
+        To save the plot or not
+    max_points : int
+        Point budget of every trace (see utils.downsample), None to plot
+        all the samples.
+
+    """
 
     stiffness = ['high_stiffness', 'low_stiffness', 'variable_stiffness']
     features = ['Magnet_position', 'handle_disp', '-Magnet_position']
@@ -196,23 +201,11 @@ def plot_magnet_hammer(config, save_plot):
                 linestyle = '--'
                 color = 'b'
                 path = config['input_data_path']
-            df = pd.read_csv(path + item + '.csv')
-            # Covert time to seconds
-            if feature == 'handle_disp':
-                time_data = df['Time'].values.tolist()
-                time_list = [
-                    datetime.strptime(fix_microseconds(item), '%H:%M:%S:%f')
-                    for item in time_data
-                ]
-                time = []  # convert to numpy
-                dt = np.array(time_list)
-                dt = dt - dt[0]
-                for t in dt:
-                    time.append(t.total_seconds())
-            else:
-                time = df['Time'].values
-            ax[i].plot(time,
-                       get_plot_data(df, feature),
+            # Cached with the time converted to seconds
+            df = read_experiment(path + item + '.csv')
+            time = df['time'].values
+            ax[i].plot(*downsample(time, get_plot_data(df, feature),
+                                   max_points),
                        color=color,
                        linestyle=linestyle)
 
@@ -230,19 +223,33 @@ def plot_magnet_hammer(config, save_plot):
         plt.tight_layout(pad=0.4, w_pad=0.5, h_pad=1.0)
 
         if save_plot:
-            name = item.lower().replace(" ",
-                                        "-") + "_hammer_magnet_displacement"
-            path = str(Path(__file__).parents[2] /
-                       config['figure_save_path']) + '/' + name + '.pdf'
-            # If the folder does not exist create it
-            if not os.path.isdir(config['figure_save_path']):
-                os.mkdir(config['figure_save_path'])
-            plt.savefig(path, bbox_inches='tight')
+            name = item.lower().replace(" ", "-") + "_hammer_magnet_external"
+            save_figure(config, name)
 
     return None
 
 
-def plot_simulation_trajectories(config, features, ax, save_plot):
+def plot_simulation_trajectories(config,
+                                 features,
+                                 ax,
+                                 save_plot,
+                                 max_points=5000):
+    """Plot the simulated trajectories on the given axes.
+
+    Parameters
+    ----------
+    config : yaml
+        The yaml configuration rate.
+    features : dict
+        Expressions to plot and their axis labels.
+    ax : matplotlib ax object
+    save_plot : boolean
+        To save the plot or not
+    max_points : int
+        Point budget of every trace (see utils.downsample), None to plot
+        all the samples.
+
+    """
 
     stiffness = ['variable_stiffness']
 
@@ -252,10 +259,11 @@ def plot_simulation_trajectories(config, features, ax, save_plot):
     style = ['-', '--', '-.']
 
     for i, item in enumerate(stiffness):
+        df = read_experiment(path + item + '.csv')
+        values = evaluate_features(df, list(features))
         for j, feature in enumerate(features):
-            df = pd.read_csv(path + item + '.csv')
-            ax.plot(df['time'].values,
-                    get_plot_data(df, feature),
+            ax.plot(*downsample(df['time'].values, values[feature],
+                                max_points),
                     color=color[j],
                     linestyle=style[j])
             ax.set_xlabel('Time (s)')
@@ -265,19 +273,26 @@ def plot_simulation_trajectories(config, features, ax, save_plot):
             plt.tight_layout(pad=0.4, w_pad=0.5, h_pad=1.0)
         plt.legend(['Hammer', 'Hammer + Base'])
         if save_plot:
-            name = item.lower().replace(" ",
-                                        "-") + "_hammer_magnet_displacement"
-            path = str(Path(__file__).parents[2] /
-                       config['figure_save_path']) + '/' + name + '.pdf'
-            # If the folder does not exist create it
-            if not os.path.isdir(config['figure_save_path']):
-                os.mkdir(config['figure_save_path'])
-            plt.savefig(path, bbox_inches='tight')
+            name = item.lower().replace(" ", "-") + "_simulation_trajectories"
+            save_figure(config, name)
 
     return None
 
 
-def plot_experiment_trajectories(config, save_plot):
+def plot_experiment_trajectories(config, save_plot, max_points=5000):
+    """Plot the measured displacement and velocity of the three modes.
+
+    Parameters
+    ----------
+    config : yaml
+        The yaml configuration rate.
+    save_plot : boolean
+        To save the plot or not
+    max_points : int
+        Point budget of every trace (see utils.downsample), None to plot
+        all the samples.
+
+    """
 
     stiffness = ['displacement', 'velocity']
     label = ['Displacement (m)', 'Velocity (m/s)']
@@ -292,6 +307,8 @@ def plot_experiment_trajectories(config, save_plot):
     plot_settings()
     fig, ax = plt.subplots(nrows=2, ncols=1, sharex=True, figsize=(6, 6))
     for i, item in enumerate(stiffness):
+        df = read_experiment(path + item + '.csv')
+        values = evaluate_features(df, features)
         for j, feature in enumerate(features):
             if item == 'displacement':
                 ax[i].axhline(y=0.05,
@@ -299,11 +316,10 @@ def plot_experiment_trajectories(config, save_plot):
                               linestyle='--',
                               linewidth=0.75)
 
-            df = pd.read_csv(path + item + '.csv')
             ax[i].axvline(x=0.27, color='k', linestyle='--', linewidth=0.75)
             ax[i].axvline(x=0.25, color='k', linestyle='--', linewidth=0.75)
-            ax[i].plot(df['time'].values,
-                       get_plot_data(df, feature),
+            ax[i].plot(*downsample(df['time'].values, values[feature],
+                                   max_points),
                        color=color[j],
                        linestyle=style[j],
                        label=plot_label[i])
@@ -315,13 +331,7 @@ def plot_experiment_trajectories(config, save_plot):
         plt.tight_layout(pad=0.4, w_pad=0.5, h_pad=1.0)
 
         if save_plot:
-            name = item.lower().replace(" ",
-                                        "-") + "_hammer_magnet_displacement"
-            path = str(Path(__file__).parents[2] /
-                       config['figure_save_path']) + '/' + name + '.pdf'
-            # If the folder does not exist create it
-            if not os.path.isdir(config['figure_save_path']):
-                os.mkdir(config['figure_save_path'])
-            plt.savefig(path, bbox_inches='tight')
+            name = item.lower().replace(" ", "-") + "_experiment_trajectories"
+            save_figure(config, name)
 
     return None
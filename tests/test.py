@@ -1,2 +1,381 @@
+import json
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+
 import pytest
 import yaml
+
+# The modules import each other from src (like cli.py and main.py)
+SRC_PATH = Path(__file__).resolve().parents[1] / 'src'
+sys.path.insert(0, str(SRC_PATH))
+
+FORK = multiprocessing.get_start_method() == 'fork'
+
+
+def _fake_solve_and_save(job, config, sweep_path, run_id):
+    from utils import save_model_log
+
+    time.sleep(0.05)
+    path = save_model_log({'model_name': job['model_name']}, str(sweep_path),
+                          run_id)
+    return {'result': Path(path).name, 'solver_status': 'ok',
+            'obj_values': float(job['tf'])}
+
+
+@pytest.mark.skipif(not FORK, reason='the stub is inherited by fork only')
+def test_workqueue_local_workers(tmp_path, monkeypatch):
+    from models import workqueue
+
+    monkeypatch.setattr(workqueue, 'solve_and_save', _fake_solve_and_save)
+    jobs = [{'model_name': 'job_{}'.format(i), 'tf': 0.5 + i}
+            for i in range(6)]
+    queue_path = tmp_path / 'queue'
+    assert len(workqueue.enqueue(jobs, queue_path)) == len(jobs)
+    assert workqueue.enqueue(jobs, queue_path) == []
+
+    # A worker which died after claiming a job: no heartbeat for 10 min
+    stale = workqueue.claim(queue_path, 'dead-worker')
+    old = time.time() - 600
+    os.utime(str(stale), (old, old))
+
+    solved = workqueue.run_local_workers(queue_path, config={}, n_workers=3,
+                                         heartbeat=0.1, timeout=5.0,
+                                         poll=0.05)
+
+    assert sum(solved) == len(jobs)
+    assert workqueue.queue_status(queue_path) == {
+        'pending': 0, 'claimed': 0, 'done': len(jobs), 'failed': 0
+    }
+    done = [json.loads(path.read_text())
+            for path in (queue_path / 'done').glob('*.json')]
+    assert sorted(content['job']['model_name'] for content in done) == sorted(
+        job['model_name'] for job in jobs)
+    requeued = [content for content in done
+                if content['key'] == workqueue._key(stale)]
+    assert requeued[0]['attempts'] == 2
+    assert len(list((queue_path / 'results').glob('*.pkl'))) == len(jobs)
+
+
+def _backends_available():
+    try:
+        import pyomo.environ as pyo
+        from models.inprocess import InProcessIpopt
+    except ImportError:
+        return False
+    return (InProcessIpopt().available()
+            and pyo.SolverFactory('ipopt').available(exception_flag=False))
+
+
+@pytest.mark.skipif(not _backends_available(),
+                    reason='needs the ipopt executable, cyipopt and the '
+                    'PyNumero ASL library')
+def test_inprocess_matches_ipopt():
+    import numpy as np
+    from models.batch import make_job, solve_job
+    from utils import load_config
+
+    config = {**load_config(), 'warm_start_library': None}
+    outputs = [
+        solve_job(make_job(stiffness='variable_stiffness', tf=1.0, nfe=20,
+                           solver=solver), config)
+        for solver in ['ipopt', 'cyipopt']
+    ]
+    assert outputs[0]['obj_values'] == pytest.approx(outputs[1]['obj_values'],
+                                                     rel=1e-6)
+    for column in ['bd', 'hd', 'md']:
+        np.testing.assert_allclose(outputs[0]['optimal_values'][column],
+                                   outputs[1]['optimal_values'][column],
+                                   atol=1e-5)
+
+
+def test_lean_builder_rejects_inprocess_solver():
+    from models.batch import make_job
+
+    with pytest.raises(ValueError, match='lean builder'):
+        make_job(builder='lean', tf=1.0, solver='cyipopt')
+
+
+def test_artifacts_round_trip(tmp_path, monkeypatch):
+    import numpy as np
+    from data import artifacts
+
+    project = tmp_path / 'project'
+    monkeypatch.setattr(artifacts, 'PROJECT_DIR', project)
+    rng = np.random.RandomState(0)
+    log = rng.bytes(200 << 10)
+    files = {
+        'models/experiment_0/log.bin': log,
+        'models/experiment_0/notes.txt': b'first run',
+    }
+    for name, data in files.items():
+        (project / name).parent.mkdir(parents=True, exist_ok=True)
+        (project / name).write_bytes(data)
+
+    store = tmp_path / 'store'
+    first = artifacts.commit('experiment_0', [project / 'models'], store)
+    assert sorted(first['manifest']['files']) == sorted(files)
+
+    # Same log with appended bytes: only the chunks at the end are new
+    appended = project / 'models/experiment_1/log.bin'
+    appended.parent.mkdir(parents=True)
+    appended.write_bytes(log + rng.bytes(4 << 10))
+    second = artifacts.commit('experiment_1', [appended], store)
+    n_chunks = len(second['manifest']['files']['models/experiment_1/log.bin']
+                   ['chunks'])
+    assert 0 < second['new_chunks'] < n_chunks / 4
+
+    remote = artifacts.get_remote(str(tmp_path / 'remote'))
+    pushed = artifacts.push('experiment_0', remote, store)
+    assert artifacts.push('experiment_0', remote, store)['chunks'] == 0
+    assert artifacts.push('experiment_1', remote,
+                          store)['chunks'] == second['new_chunks']
+
+    fresh = tmp_path / 'fresh'
+    assert artifacts.pull('experiment_0', remote, fresh) == pushed
+    assert artifacts.pull('experiment_1', remote,
+                          fresh)['chunks'] == second['new_chunks']
+    assert artifacts.experiments(fresh) == ['experiment_0', 'experiment_1']
+
+    for name in files:
+        (project / name).unlink()
+    (project / 'models/experiment_0/notes.txt').write_bytes(b'edited')
+    status = artifacts.checkout('experiment_0', fresh)
+    assert status['written'] == ['models/experiment_0/log.bin']
+    assert status['skipped'] == ['models/experiment_0/notes.txt']
+    status = artifacts.checkout('experiment_0', fresh, force=True)
+    assert status['unchanged'] == ['models/experiment_0/log.bin']
+    for name, data in files.items():
+        assert (project / name).read_bytes() == data
+
+
+def _fake_lookup_jobs(jobs, config, n_jobs=1):
+    import numpy as np
+    import pandas as pd
+    import pyomo.environ as pyo
+
+    outputs = []
+    for job in jobs:
+        time = np.linspace(0, job['tf'], 5)
+        df = pd.DataFrame({'time': time, 'ba': job['tf'] + 0 * time,
+                           'md': job['overrides']['h_mass'] + 0 * time})
+        status = pyo.TerminationCondition.optimal
+        if job['tf'] == 2.0 and job['overrides']['h_mass'] == 0.3:
+            # A failed solve without a schedule
+            df[['ba', 'md']] = np.nan
+            status = pyo.TerminationCondition.infeasible
+        outputs.append({'optimal_values': df, 'obj_values': job['tf'],
+                        'solver_status': status})
+    return outputs
+
+
+def test_lookup_table_query(tmp_path, monkeypatch):
+    import numpy as np
+
+    from models import lookup
+
+    monkeypatch.setattr(lookup, 'run_jobs', _fake_lookup_jobs)
+    path = tmp_path / 'table.npz'
+    table = lookup.generate_lookup_table({}, [1.0, 2.0], [0.2], [0.1, 0.3],
+                                         stiffness=['low_stiffness'],
+                                         n_samples=5, save_path=str(path))
+    assert table['feasible'].sum() == 3
+    assert np.isnan(table['ba'][1, 0, 1, 0]).all()
+
+    lookup_table = lookup.LookupTable(path)
+    result = lookup_table.query(1.5, 0.2, 0.1, 'low_stiffness')
+    assert result['feasible']
+    np.testing.assert_allclose(result['ba'], 1.5, rtol=1e-6)
+    np.testing.assert_allclose(result['md'], 0.1, rtol=1e-6)
+    np.testing.assert_allclose(result['time'], np.linspace(0, 1.5, 5))
+    assert result['hv'] == pytest.approx(1.5)
+
+    # Next to the failed grid point
+    result = lookup_table.query(1.5, 0.2, 0.2, 'low_stiffness')
+    assert not result['feasible']
+    # On a grid point, the failed one has no weight
+    result = lookup_table.query(1.0, 0.2, 0.1, 'low_stiffness')
+    assert result['feasible'] and not np.isnan(result['ba']).any()
+    # Outside the grid
+    assert not lookup_table.query(2.5, 0.2, 0.1, 'low_stiffness')['feasible']
+    assert not lookup_table.query(1.5, 0.3, 0.1, 'low_stiffness')['feasible']
+
+
+def test_downsample_keeps_extremes_and_ends():
+    import numpy as np
+
+    from visualization.utils import _lttb_index, _minmax_index, downsample
+
+    x = np.linspace(0, 10, 20001)
+    y = np.sin(x) + 0.01 * np.cos(37 * x)
+    y[12345], y[4321] = 5.0, -5.0
+
+    for method in ['minmax', 'lttb']:
+        x_new, y_new = downsample(x, y, max_points=500, method=method)
+        assert 3 <= len(y_new) <= 500
+        assert np.all(np.diff(x_new) > 0)
+        assert (x_new[0], x_new[-1]) == (x[0], x[-1])
+        assert y_new.max() == 5.0 and y_new.min() == -5.0
+        # Only points of the trace
+        np.testing.assert_array_equal(y_new, y[np.searchsorted(x, x_new)])
+
+    index = _minmax_index(y, 100)
+    assert np.all(np.diff(index) > 0)
+    size = -(-len(y) // 100)
+    for start in range(0, len(y), size):
+        bucket = y[start:start + size]
+        assert start + bucket.argmax() in index
+        assert start + bucket.argmin() in index
+    assert len(_lttb_index(x, y, 500)) == 500
+
+    # Short traces and small budgets are kept as they are
+    assert len(downsample(x[:100], y[:100], max_points=500)[0]) == 100
+    assert len(downsample(x, y, max_points=None)[0]) == len(x)
+    with pytest.raises(ValueError):
+        downsample(x, y, max_points=500, method='every_nth')
+
+
+def test_compile_feature_matches_eval():
+    import numpy as np
+    import pandas as pd
+
+    from visualization.expressions import compile_feature, evaluate_features
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.uniform(0.01, 1, (50, 5)),
+                      columns=['bd', 'bv', 'hd', 'hv', 'md'])
+    # The features of main.py and the plots, and a few combinations
+    features = [
+        'bd', 'md', 'hd', '-md', 'bd + hd', 'bv + hv', '2 * md - hd / 3',
+        '(bd + hd) ** 2', '-(bv - hv) * 0.5', 'sqrt(md) + abs(-bd)'
+    ]
+    values = evaluate_features(df, features)
+    for feature in features:
+        names, function = compile_feature(feature)
+        assert set(names) <= set(df.columns)
+        np.testing.assert_allclose(values[feature],
+                                   df.eval(feature, engine='python'))
+    assert compile_feature('bd + hd') is compile_feature('bd + hd')
+    assert compile_feature('hd - bd + hd')[0] == ('hd', 'bd')
+    np.testing.assert_array_equal(evaluate_features(df, ['2'])['2'], 2.0)
+
+    for feature in ['bd.values', '__import__("os")', 'bd +', 'bd[0]']:
+        with pytest.raises(ValueError):
+            compile_feature(feature)
+    with pytest.raises(KeyError):
+        evaluate_features(df, ['md + ha'])
+
+
+def test_constant_acceleration():
+    import numpy as np
+
+    from models.resample import constant_acceleration
+
+    time = np.array([0.0, 1.0, 2.0])
+    position, velocity, acceleration = constant_acceleration(
+        time, np.array([0.0, 0.5, 1.0]), np.array([0.0, 1.0, 0.0]),
+        np.array([1.0, -1.0]), np.array([0.0, 0.5, 1.0, 1.5, 2.0]))
+    np.testing.assert_allclose(position, [0, 0.125, 0.5, 0.875, 1.0])
+    np.testing.assert_allclose(velocity, [0, 0.5, 1.0, 0.5, 0.0])
+    np.testing.assert_allclose(acceleration, [1, 1, -1, -1, -1])
+
+
+def test_resample_keeps_endpoints_and_limits():
+    import numpy as np
+    import pandas as pd
+
+    from models.resample import (check_endpoints, check_limits,
+                                 resample_trajectories)
+
+    # Bang-bang solution of the backward scheme (bd moves by bv times h)
+    time = np.linspace(0, 1.0, 41)
+    h = np.diff(time)
+    ba = np.where(time[1:] <= 0.5, 4.0, -4.0)
+    bv = np.concatenate([[0], np.cumsum(h * ba)])
+    bd = np.concatenate([[0], np.cumsum(h * bv[1:])])
+    md = np.clip(0.09 - 0.06 * time, 0.03, 0.06)
+    optimal_values = pd.DataFrame({
+        'time': time, 'bd': bd, 'bv': bv, 'ba': np.append(np.nan, ba),
+        'md': md
+    })
+    config = {
+        'bd_min': 0.0, 'bd_max': bd[-1], 'bv_min': 0.0, 'bv_max': 2.0,
+        'ba_min': -4.0, 'ba_max': 4.0, 'w_min': 0.03, 'w_max': 0.06
+    }
+
+    setpoints = resample_trajectories(optimal_values, rate=1000.0)
+    assert len(setpoints) == 1001
+    assert setpoints['time'].iloc[-1] == 1.0
+    assert check_limits(setpoints, config) == {}
+    assert max(check_endpoints(setpoints, optimal_values).values()) < 1e-9
+    assert setpoints['bv'].iloc[-1] == pytest.approx(0, abs=1e-12)
+    np.testing.assert_allclose(np.abs(setpoints['ba']), 4.0)
+    # bd, bv and ba are consistent at every sample
+    dt = np.diff(setpoints['time'])
+    bv = setpoints['bv'].values
+    np.testing.assert_allclose(np.diff(setpoints['bd']),
+                               dt * (bv[1:] + bv[:-1]) / 2, atol=1e-12)
+    np.testing.assert_allclose(np.abs(np.diff(bv) / dt), 4.0)
+
+
+def test_parse_time(tmp_path):
+    import numpy as np
+    import pandas as pd
+
+    from data.ingest import convert_csv, parse_time
+
+    # Robot timestamps H:M:S:microseconds, not zero padded
+    stamps = pd.Series(['13:59:59:999000', '14:0:0:1000', '14:00:01:250000'])
+    np.testing.assert_allclose(parse_time(stamps), [0, 0.002, 1.251])
+    seconds = pd.Series([0.5, 1.0, 1.5])
+    np.testing.assert_array_equal(parse_time(seconds), [0.5, 1.0, 1.5])
+    assert parse_time(pd.Series([0, 1, 2])).dtype == float
+
+    path = tmp_path / 'strike.csv'
+    pd.DataFrame({'Time': stamps, 'bd': [0.0, 0.1, 0.2],
+                  'mode': ['a', 'b', 'c']}).to_csv(path, index=False)
+    df = convert_csv(path)
+    assert 'Time' not in df.columns
+    np.testing.assert_allclose(df['time'], [0, 0.002, 1.251])
+    assert df['bd'].dtype == float and df['mode'].dtype == object
+
+
+def _fake_solve_job(job, config, initial_values=None):
+    import pandas as pd
+
+    time.sleep(0.01)
+    seed = None if initial_values is None else initial_values['tf'].iloc[0]
+    df = pd.DataFrame({'time': [0.0, job['tf']], 'tf': job['tf']})
+    return {'optimal_values': df, 'solver_status': 'optimal', 'seed': seed}
+
+
+@pytest.mark.skipif(not FORK, reason='the stub is inherited by fork only')
+def test_solve_scenarios_seeding(tmp_path, monkeypatch):
+    from models import batch
+    from utils import read_columns
+
+    monkeypatch.setattr(batch, 'solve_job', _fake_solve_job)
+    tf = [3.0, 1.1, 1.0, 3.1, 1.2]
+    jobs = [{'tf': value, 'final_state': {'x': 0.5}} for value in tf]
+
+    # One worker: the smallest scenario starts cold, every other one from
+    # the nearest solved scenario
+    outputs, scenarios = batch.solve_scenarios(jobs, {}, n_jobs=1)
+    seeds = {value: output['seed'] for value, output in zip(tf, outputs)}
+    assert seeds == {1.0: None, 1.1: 1.0, 1.2: 1.1, 3.0: 1.2, 3.1: 3.0}
+    assert list(scenarios['scenario'].unique()) == list(range(len(jobs)))
+    assert scenarios['optimal'].all()
+    assert (scenarios['x_final'] == 0.5).all()
+
+    # Two workers: both ends of the parameter range start cold
+    path = tmp_path / 'scenarios.npz'
+    outputs, scenarios = batch.solve_scenarios(jobs, {}, n_jobs=2,
+                                               save_path=str(path))
+    cold = {value for value, output in zip(tf, outputs)
+            if output['seed'] is None}
+    assert cold == {1.0, 3.1}
+    for output in outputs:
+        assert output['seed'] is None or output['seed'] in tf
+    assert len(read_columns(path)) == len(scenarios) == 2 * len(jobs)